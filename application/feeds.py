@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from array import array
+from json import loads
+from mmap import ACCESS_READ, mmap
+from os.path import getsize, isfile
+from re import DOTALL, compile
+
+TOKEN_REGEX = compile(rb'[{}\[\]"]')
+STRING_REGEX = compile(rb'"(?:[^"\\]|\\.)*"', DOTALL)
+
+
+class FeedIndex:
+    """
+    Byte offset index of the items in a JSON feed file. Index is kept in a sidecar file next to the feed and is
+    updated incrementally, so only newly appended feed bytes are scanned while the spider is still writing the feed.
+    """
+
+    def __init__(self, feed_file: str):
+        """
+        :param str feed_file: path to JSON (or JSON lines) feed file
+        """
+        self._feed_file = feed_file
+        self._index_file = feed_file + ".idx"
+        self._position = 0  # Feed is scanned up to the end of the last complete item
+        self._offsets = array('Q')  # Item start and end byte offset pairs
+        self._load()
+
+    def __len__(self):
+        """Overridden"""
+        return len(self._offsets) // 2
+
+    def _load(self):
+        """Loads sidecar index file, index is rebuilt if it doesn't match the feed file"""
+        if not isfile(self._index_file):
+            return
+        offsets = array('Q')
+        with open(self._index_file, "rb") as f:
+            offsets.frombytes(f.read())
+        if not offsets or len(offsets) % 2 == 0 or offsets[0] > getsize(self._feed_file):
+            return
+        self._position = offsets[0]
+        self._offsets = offsets[1:]
+
+    def _save(self):
+        """Saves sidecar index file"""
+        with open(self._index_file, "wb") as f:
+            array('Q', [self._position]).tofile(f)
+            self._offsets.tofile(f)
+
+    def update(self) -> int:
+        """
+        Indexes items appended to the feed file since the last update
+        :return: number of newly indexed items
+        """
+        if not isfile(self._feed_file):
+            return 0
+        size = getsize(self._feed_file)
+        if size <= self._position:
+            return 0
+        count = len(self)
+        with open(self._feed_file, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            self._scan(data, size)
+        if len(self) > count:
+            self._save()
+
+        return len(self) - count
+
+    def _scan(self, data, size: int):
+        """
+        Finds top level JSON objects in feed data, incomplete last object is left for the next update
+        :param data: memory mapped feed file
+        :param int size: feed file size in bytes
+        """
+        position, depth, start = self._position, 0, None
+        while True:
+            match = TOKEN_REGEX.search(data, position, size)
+            if match is None:
+                break
+            token, position = match.group(), match.start()
+            if token == b'"':
+                string = STRING_REGEX.match(data, position, size)
+                if string is None:  # Incomplete string
+                    break
+                position = string.end()
+                continue
+            if token == b'{' or token == b'[' and depth > 0:
+                if depth == 0:
+                    start = position
+                depth += 1
+            elif depth > 0:  # Closing brace or bracket
+                depth -= 1
+                if depth == 0:
+                    self._offsets.extend((start, position + 1))
+                    self._position = position + 1
+            position += 1
+
+    def items(self, first: int, count: int) -> list:
+        """
+        Returns decoded feed items
+        :param int first: index of the first item
+        :param int count: number of items
+        :return: list of item dicts
+        """
+        items = []
+        if first >= len(self):
+            return items
+        with open(self._feed_file, "rb") as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+            for i in range(first, min(first + count, len(self))):
+                start, end = self._offsets[i * 2], self._offsets[i * 2 + 1]
+                items.append(loads(data[start:end].decode("utf-8")))
+
+        return items
@@ -2,7 +2,7 @@
 #!/usr/bin/env python
 
 from config import FEEDS_DIR, SPIDER_LOG_DIR
-from os.path import isfile, join
+from os.path import getsize, isfile, join
 
 
 def text_file_to_lines(file_path: str) -> list:
@@ -22,6 +22,41 @@ def text_file_to_lines(file_path: str) -> list:
     return lines
 
 
+def read_text_chunk(file_path: str, offset: int, size: int, backward: bool=False) -> tuple:
+    """
+    Reads whole text lines from a byte offset of a (growing) text file without reading the rest of the file
+    :param str file_path: path to text file
+    :param int offset: byte offset to read from, or to read up to when reading backward
+    :param int size: maximum chunk size in bytes
+    :param bool backward: read the chunk preceding the offset
+    :return: tuple of list of line strings (skips empty lines), chunk start and chunk end byte offsets
+    """
+    file_size = getsize(file_path)
+    offset = max(0, min(offset, file_size))
+    if backward:
+        start, end = max(0, offset - size), offset
+    else:
+        start, end = offset, min(file_size, offset + size)
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if backward and start > 0:  # Skip partial first line
+        newline = data.find(b'\n')
+        if newline != -1:
+            data = data[newline + 1:]
+            start = end - len(data)
+    if (end == file_size or not backward) and not data.endswith(b'\n'):  # Skip partial last line
+        newline = data.rfind(b'\n')
+        if newline != -1:
+            data = data[:newline + 1]
+        elif end - start < size:  # Wait for the rest of the line
+            data = b''
+        end = start + len(data)
+    lines = [line.strip() for line in data.decode("utf-8", errors="replace").splitlines()]
+
+    return [line for line in lines if line], start, end
+
+
 def log_file_path(spider_name: str, date_time: str) -> str:
     file_name = "{} {}.log".format(spider_name, str(date_time).split('.')[0].strip().replace(':', '-'))
     log_file = join(SPIDER_LOG_DIR, file_name)
@@ -2,22 +2,37 @@
 #!/usr/bin/env python
 
 from datetime import datetime
+import json
 import sys
 
-from redis import Redis
 from scrapy import Request, Spider, signals
 from scrapy.exceptions import CloseSpider
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
 
 try:  # main
     from config import REDIS_PORT, REDIS_HOST
     from application.webui.models import Jobs
     from application.scrapers.scrapers.common import SpiderStatus
+    from application.scrapers.scrapers.connections import get_engine, get_redis
+    from application.scrapers.scrapers.events import JOB_ITEMS_KEY, JOB_RUNNING_KEY, JobTable, publish_job_event
+    from application.scrapers.scrapers.extraction import ExtractionPlan
+    from application.scrapers.scrapers.models import JobPosts
+    from application.scrapers.scrapers.pending import PendingQueue
+    from application.scrapers.scrapers.seen import SeenIndex
+    from application.scrapers.scrapers.throttle import RATES_STATS_KEY as THROTTLE_RATES_STATS_KEY
     SCRAPY_CRAWL = False
 except ImportError:  # scrapy crawl
     sys.path.append("..")  # allow imports from application directory
     from scrapers.common import SpiderStatus
+    from scrapers.connections import get_engine, get_redis
+    from scrapers.events import JOB_ITEMS_KEY, JOB_RUNNING_KEY, JobTable, publish_job_event
+    from scrapers.extraction import ExtractionPlan
+    from scrapers.models import JobPosts
+    from scrapers.pending import PendingQueue
+    from scrapers.seen import SeenIndex
+    from scrapers.throttle import RATES_STATS_KEY as THROTTLE_RATES_STATS_KEY
     from scrapers.settings import REDIS_HOST, REDIS_PORT
     SCRAPY_CRAWL = True
 
@@ -29,6 +44,7 @@ class BaseSpider(Spider):
     base_url = None
     pagination_xpath = None
     article_xpath = None
+    extraction_plans = {}  # Plan name: {field name: Field}, see extraction.py
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -36,8 +52,13 @@ class BaseSpider(Spider):
         self._job_id = None
         self._task_id = None
         self._redis = None
+        self._stop_requested = False
+        self._stop_check = None
         self._webui_db = None
         self._db = None
+        self._distributed = False
+        self._seen_job_posts = SeenIndex()
+        self._pending_job_posts = None
         self._pagination_urls = set()
         self._job_urls = set()
 
@@ -49,10 +70,34 @@ class BaseSpider(Spider):
         crawler.signals.connect(spider.spider_opened, signals.spider_opened)
         crawler.signals.connect(spider.spider_closed, signals.spider_closed)
         # crawler.signals.connect(spider.request_scheduled, signals.request_scheduled)
-        crawler.signals.connect(spider.response_received, signals.response_received)
 
         return spider
 
+    @classmethod
+    def extraction_plan(cls, name: str) -> ExtractionPlan:
+        """
+        Returns extraction plan, plans are compiled once per spider class
+        :param str name: extraction plan name
+        :return: compiled extraction plan
+        """
+        plans = cls.__dict__.get("_compiled_extraction_plans")
+        if plans is None:
+            plans = {}
+            cls._compiled_extraction_plans = plans
+        if name not in plans:
+            plans[name] = ExtractionPlan(cls.extraction_plans[name])
+
+        return plans[name]
+
+    def extract(self, response, name: str) -> dict:
+        """
+        Extracts all fields of an extraction plan from response
+        :param response: scrapy HTML response
+        :param str name: extraction plan name
+        :return: dict of field values
+        """
+        return self.extraction_plan(name).extract(response.selector.root)
+
     def spider_opened(self, spider):
         """"""
         if not SCRAPY_CRAWL:
@@ -63,7 +108,7 @@ class BaseSpider(Spider):
             redis_port = self.settings.get("REDIS_PORT", None)
             if redis_port is None:
                 raise CloseSpider("Redis port isn't set!")
-            self._redis = Redis(redis_host, redis_port)
+            self._redis = get_redis(redis_host, redis_port)
             if not self._redis.ping():
                 raise CloseSpider("Can't connect to Redis instance at {host}:{port}".format(
                     host=redis_host,
@@ -73,9 +118,8 @@ class BaseSpider(Spider):
             webui_db_uri = self.settings.get("WEBUI_DB_URI", None)
             if webui_db_uri is None:
                 raise CloseSpider("Can't connect to WebUI DB!")
-            engine = create_engine(webui_db_uri)
-            db_session = sessionmaker(bind=engine)
-            self._webui_db = db_session()
+            # Session factory, WebUI DB is shared with other processes so sessions are opened only while used
+            self._webui_db = sessionmaker(bind=get_engine(webui_db_uri))
             # DB
             if self.settings.get("DB_URI", None) is not None:
                 # db_uri = "mysql+pymysql://{user}:{passw}@{host}/{db}?host={host}?port={port}".format(
@@ -86,9 +130,21 @@ class BaseSpider(Spider):
                 #     passw=self.settings.get("DB_PASS"),
                 # )
                 # engine = create_engine(db_uri)
-                engine = create_engine(self.settings.get("DB_URI"))
+                engine = get_engine(self.settings.get("DB_URI"))
                 db_session = sessionmaker(bind=engine)
                 self._db = db_session()
+                # Already scraped job posts
+                self._seen_job_posts = SeenIndex(self._redis, self.settings.get("SEEN_INDEX_REDIS_KEY", None))
+                self._seen_job_posts.load(
+                    job_post_id for job_post_id, in self._db.query(JobPosts.job_post_id).yield_per(10000)
+                )
+                self.logger.info("Loaded {} already scraped job post IDs".format(len(self._seen_job_posts)))
+                # Job posts discovered on listing pages, waiting for their detail pages
+                self._pending_job_posts = PendingQueue(
+                    self._db,
+                    self.settings.getfloat("PENDING_LEASE", 3600),
+                    self.settings.getint("PENDING_MAX_ATTEMPTS", 3),
+                )
             # Job ID, Task ID
             self._scrape_type = self.settings.get("SCRAPE_TYPE")
             self._job_id = self.settings.get("JOB_ID", None)
@@ -98,30 +154,117 @@ class BaseSpider(Spider):
             if self._task_id is None:
                 raise CloseSpider("Task ID not set!")
             self.logger.info("Job ID [{}], Task ID [{}]".format(self._job_id, self._task_id))
+            # Distributed job, crawlers share one job row which is finished by the last running crawler
+            self._distributed = self.settings.getbool("DISTRIBUTED")
+            if self._distributed:  # Running crawlers were counted when the job was dispatched
+                self.logger.info("Crawler {} of distributed job".format(self.settings.get("CRAWLER_ID")))
+            # Job cancellation
+            self._stop_check = LoopingCall(self._check_stop)
+            self._stop_check.start(self.settings.getfloat("STOP_CHECK_INTERVAL", 2), now=False)
 
-    def spider_closed(self, spider):
+    def spider_closed(self, spider, reason):
         """"""
         if not SCRAPY_CRAWL:
+            if self._stop_check is not None and self._stop_check.running:
+                self._stop_check.stop()
             stats = spider.crawler.stats.get_stats()
-            job = self._webui_db.query(Jobs).filter(Jobs.id == self._job_id).first()
-            if job is None:
-                self.logger.warning("Failed updating spider state for job id <{}>".format(self._job_id))
-                return
-            job.date_finished = datetime.now()
-            if "item_scraped_count" in stats:
-                job.items_scraped = stats["item_scraped_count"]
-            if job.spider_status != SpiderStatus.CANCELED:
-                job.spider_status = SpiderStatus.FINISHED
-            self._webui_db.commit()
+            webui_db = self._webui_db()
+            try:
+                self._update_job(webui_db, stats, reason)
+            finally:
+                webui_db.close()
+            publish_job_event(self._redis, JobTable.JOBS, self._job_id)
             self.logger.info("Updated spider state for job id {}".format(self._job_id))
             # DB
+            self._seen_job_posts.flush()
             if self._db is not None:
                 self._db.close()
 
-    def response_received(self, response, request, spider):
-        if not SCRAPY_CRAWL:
-            if self._redis.sismember("{}:stop".format(self.__class__.name), self._task_id):
-                self.crawler.engine.close_spider(spider, "Requested spider task {} cancellation".format(self._task_id))
+    def _update_job(self, webui_db, stats: dict, reason: str):
+        """
+        Stores spider results and state to its job row
+        :param webui_db: WebUI DB session
+        :param dict stats: crawler stats
+        :param str reason: spider close reason
+        """
+        job = webui_db.query(Jobs).filter(Jobs.id == self._job_id).first()
+        if job is None:
+            self.logger.warning("Failed updating spider state for job id <{}>".format(self._job_id))
+            return
+        rates = stats.get(THROTTLE_RATES_STATS_KEY)
+        last_crawler = True
+        if self._distributed:
+            # Crawlers add up their items and rates, the last closed crawler finishes the job
+            pipe = self._redis.pipeline()
+            pipe.incrby(JOB_ITEMS_KEY.format(self._job_id), stats.get("item_scraped_count", 0))
+            pipe.expire(JOB_ITEMS_KEY.format(self._job_id), self.settings.getint("FRONTIER_EXPIRE", 7 * 86400))
+            pipe.decr(JOB_RUNNING_KEY.format(self._job_id))
+            items, _, running = pipe.execute()
+            job.items_scraped = max(job.items_scraped or 0, items)  # Counter grows, other crawlers may commit later
+            last_crawler = running <= 0
+            if rates:
+                crawler_id = self.settings.get("CRAWLER_ID")
+                merged = json.loads(job.rates) if job.rates else {}
+                merged.update({"{}/{}".format(slot, crawler_id): slot_rates for slot, slot_rates in rates.items()})
+                rates = merged
+        elif "item_scraped_count" in stats:
+            job.items_scraped = stats["item_scraped_count"]
+        if rates:
+            job.rates = json.dumps(rates, sort_keys=True)
+        if last_crawler:
+            job.date_finished = datetime.now()
+            if reason == "shutdown":  # Worker or process stopped, job can be resumed from its crawl state
+                job.spider_status = SpiderStatus.INTERRUPTED
+            elif job.spider_status != SpiderStatus.CANCELED:
+                job.spider_status = SpiderStatus.FINISHED
+        webui_db.commit()
+
+    @property
+    def seen_job_posts(self) -> SeenIndex:
+        """Index of already scraped job post IDs"""
+        return self._seen_job_posts
+
+    @property
+    def pending_job_posts(self) -> PendingQueue:
+        """Queue of discovered job posts waiting for their detail pages, None if job posts aren't saved to DB"""
+        return self._pending_job_posts
+
+    @property
+    def pagination_urls(self) -> set:
+        """Already requested pagination URLs, kept in the persistent spider state if the job is resumable"""
+        return self._crawl_state("pagination_urls", self._pagination_urls)
+
+    def _crawl_state(self, name: str, default: set) -> set:
+        """
+        Returns set from the spider state (loaded from JOBDIR by scrapy on spider open)
+        :param str name: state key
+        :param set default: in-memory set used if the crawl isn't persisted
+        :return: set
+        """
+        state = getattr(self, "state", None)
+        if state is None:
+            return default
+
+        return state.setdefault(name, default)
+
+    def _check_stop(self):
+        """Polls job cancellation requests in a thread pool so the Redis round trip doesn't block the reactor"""
+        d = deferToThread(self._redis.sismember, "{}:stop".format(self.__class__.name), self._task_id)
+        d.addCallback(self._stop_checked)
+        d.addErrback(lambda failure: self.logger.warning("Failed checking job cancellation, details: {}".format(
+            failure.getErrorMessage())))
+
+        return d
+
+    def _stop_checked(self, stop_requested):
+        """"""
+        if stop_requested and not self._stop_requested:
+            self._stop_requested = True
+            self._stop()
+
+    def _stop(self):
+        """Closes the spider after a job cancellation request"""
+        self.crawler.engine.close_spider(self, "Requested spider task {} cancellation".format(self._task_id))
 
     def start_requests(self):
         for url in self.__class__.start_urls:
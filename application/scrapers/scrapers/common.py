@@ -6,12 +6,12 @@ from enum import IntEnum
 
 class ScrapeType(IntEnum):
     """Scrape types"""
-    ALL, NEW, UNSCRAPED = range(3)
+    ALL, NEW, UNSCRAPED, CHANGED, PENDING = range(5)
 
 
 class SpiderStatus(IntEnum):
     """Spider statuses"""
-    PENDING, RUNNING, FINISHED, CANCELED = range(4)
+    PENDING, RUNNING, FINISHED, CANCELED, INTERRUPTED = range(5)
 
 
 class JobStatus(IntEnum):
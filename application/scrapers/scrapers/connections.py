@@ -0,0 +1,58 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from redis import Redis
+from sqlalchemy import create_engine, event
+
+# SQLite (WebUI DB) is written by WebUI, Celery tasks and every spider process
+SQLITE_JOURNAL_MODE = "WAL"  # readers don't block the writer and the writer doesn't block readers
+SQLITE_SYNCHRONOUS = "NORMAL"  # WAL commits survive process crashes, the last ones may be lost on power loss
+SQLITE_BUSY_TIMEOUT = 30000  # milliseconds writer waits for the lock before "database is locked" error
+
+# Per process connection caches, shared by all crawls run from the same (crawler worker) process
+_engines = {}
+_redis_clients = {}
+
+
+def get_engine(db_uri: str):
+    """
+    Returns cached SQLAlchemy engine (and its connection pool) for given DB URI, SQLite engines are tuned for
+    concurrent writers
+    :param str db_uri: database URI
+    :return: engine instance
+    """
+    if db_uri not in _engines:
+        engine = create_engine(db_uri, pool_recycle=3600)
+        if engine.dialect.name == "sqlite":
+            tune_sqlite(engine)
+        _engines[db_uri] = engine
+
+    return _engines[db_uri]
+
+
+def tune_sqlite(engine):
+    """
+    Sets journal mode, synchronous level and busy timeout on every new connection of SQLite engine
+    :param engine: SQLAlchemy engine instance
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode={}".format(SQLITE_JOURNAL_MODE))
+        cursor.execute("PRAGMA synchronous={}".format(SQLITE_SYNCHRONOUS))
+        cursor.execute("PRAGMA busy_timeout={}".format(SQLITE_BUSY_TIMEOUT))
+        cursor.close()
+
+
+def get_redis(host: str, port: int) -> Redis:
+    """
+    Returns cached Redis client (and its connection pool) for given host and port
+    :param str host: Redis host
+    :param int port: Redis port
+    :return: Redis client instance
+    """
+    key = (host, int(port))
+    if key not in _redis_clients:
+        _redis_clients[key] = Redis(host, port)
+
+    return _redis_clients[key]
@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+from re import IGNORECASE, UNICODE, compile
+from typing import Optional, Union
+
+from dateparser import parse
+
+UNITS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=30),
+    "year": timedelta(days=365),
+}
+# Relative date fast paths, common job board footer texts per locale
+NOW_REGEX = compile(
+    r"^(?:just posted|today|active today|heute|aujourd'hui|hoy|hoje|oggi|vandaag|idag|i dag|tänään|dzisiaj)$",
+    IGNORECASE | UNICODE
+)
+RELATIVE_DATE_REGEXES = (
+    # en: 3 days ago, 30+ days ago, 1 hour ago
+    (compile(r"^(\d+)\s*(minute|hour|day|week|month|year)s?\s+ago$", IGNORECASE | UNICODE), {}),
+    # de: vor 3 Tagen, vor 30+ Tagen
+    (compile(r"^vor\s+(\d+)\s*(minuten?|stunden?|tag(?:en)?|wochen?|monat(?:en)?|jahr(?:en)?)$", IGNORECASE | UNICODE), {
+        "minute": "minute", "minuten": "minute", "stunde": "hour", "stunden": "hour", "tag": "day", "tagen": "day",
+        "woche": "week", "wochen": "week", "monat": "month", "monaten": "month", "jahr": "year", "jahren": "year",
+    }),
+    # fr: il y a 3 jours, il y a 30+ jours
+    (compile(r"^il y a\s+(\d+)\s*(minutes?|heures?|jours?|semaines?|mois|ans?)$", IGNORECASE | UNICODE), {
+        "minute": "minute", "minutes": "minute", "heure": "hour", "heures": "hour", "jour": "day", "jours": "day",
+        "semaine": "week", "semaines": "week", "mois": "month", "an": "year", "ans": "year",
+    }),
+    # es, pt: hace 3 días, há 3 dias
+    (compile(r"^(?:hace|há)\s+(\d+)\s*(minutos?|horas?|días?|dias?|semanas?|mes(?:es)?|meses|años?|anos?)$",
+             IGNORECASE | UNICODE), {
+        "minuto": "minute", "minutos": "minute", "hora": "hour", "horas": "hour", "día": "day", "días": "day",
+        "dia": "day", "dias": "day", "semana": "week", "semanas": "week", "mes": "month", "meses": "month",
+        "año": "year", "años": "year", "ano": "year", "anos": "year",
+    }),
+    # it: 3 giorni fa
+    (compile(r"^(\d+)\s*(minut[oi]|or[ae]|giorn[oi]|settiman[ae]|mes[ei]|ann[oi])\s+fa$", IGNORECASE | UNICODE), {
+        "minuto": "minute", "minuti": "minute", "ora": "hour", "ore": "hour", "giorno": "day", "giorni": "day",
+        "settimana": "week", "settimane": "week", "mese": "month", "mesi": "month", "anno": "year", "anni": "year",
+    }),
+    # nl: 3 dagen geleden
+    (compile(r"^(\d+)\s*(minuten?|uur|dagen?|weken?|maanden?|jaren?|jaar)\s+geleden$", IGNORECASE | UNICODE), {
+        "minuut": "minute", "minuten": "minute", "uur": "hour", "dag": "day", "dagen": "day", "week": "week",
+        "weken": "week", "maand": "month", "maanden": "month", "jaar": "year", "jaren": "year",
+    }),
+)
+WHITESPACE_REGEX = compile(r"\s+", UNICODE)
+PARSE_BASES = (datetime(2000, 1, 1), datetime(2000, 7, 1))  # Two bases tell relative and absolute dates apart
+
+
+def normalize_relative_date(text: str) -> str:
+    """
+    Normalizes relative date text, so variants of the same text share a cache entry
+    :param str text: relative date text
+    :return: normalized text
+    """
+    return WHITESPACE_REGEX.sub(' ', text.replace('+', ' ')).strip().lower()
+
+
+@lru_cache(maxsize=1024)
+def _resolve(text: str) -> Union[timedelta, datetime, None]:
+    """
+    Resolves normalized relative date text
+    :param str text: normalized relative date text
+    :return: offset from the current time for relative dates, datetime for absolute dates or None
+    """
+    if NOW_REGEX.match(text):
+        return timedelta()
+    for regex, units in RELATIVE_DATE_REGEXES:
+        match = regex.match(text)
+        if match is not None:
+            unit = match.group(2).lower()
+            return int(match.group(1)) * UNITS[units.get(unit, unit)]
+    # Slow path, relative dates resolve differently for different bases while absolute dates don't
+    dates = [parse(text, settings={"RELATIVE_BASE": base}) for base in PARSE_BASES]
+    if dates[0] is None or dates[1] is None:
+        return None
+    if dates[0] == dates[1]:
+        return dates[0]
+
+    return PARSE_BASES[0] - dates[0]
+
+
+def resolve_relative_date(text: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Converts relative date text (3 days ago, 30+ days ago, just posted ...) to datetime
+    :param str text: relative date text
+    :param datetime now: time relative dates are anchored to, defaults to the current (crawl) time
+    :return: datetime or None if date can't be resolved
+    """
+    date = _resolve(normalize_relative_date(text))
+    if isinstance(date, timedelta):
+        date = (now or datetime.now()) - date
+
+    return date
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from json import dumps
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+JOB_EVENTS_CHANNEL = "jobs:events"
+JOB_STATS_KEY = "job:{}:stats"  # Redis hash with live crawl metrics of a job
+JOB_CRAWLER_STATS_KEY = "job:{}:stats:{}"  # Redis hash with live crawl metrics of one crawler of a distributed job
+JOB_CRAWLERS_KEY = "job:{}:crawlers"  # Redis set with IDs of crawlers publishing metrics of a distributed job
+JOB_RUNNING_KEY = "job:{}:running"  # Number of running crawlers of a distributed job
+JOB_ITEMS_KEY = "job:{}:items"  # Items scraped by all crawlers of a distributed job
+SUMMED_METRICS = ("requests", "responses", "items", "errors", "requests_per_second", "items_per_second", "queue",
+                  "in_progress", "memory")  # Other metrics of distributed job crawlers are aggregated by maximum
+SUMMED_METRICS_PREFIXES = ("status_", )  # Response status counters
+
+
+class JobTable:
+    """Tables with job rows shown in WebUI"""
+    JOBS = "jobs"
+    PERIODIC_JOBS = "periodic_jobs"
+
+
+def read_job_stats(redis, job_ids: list) -> list:
+    """
+    Reads live crawl metrics of jobs, metrics of distributed job crawlers are aggregated
+    :param redis: Redis client instance
+    :param list job_ids: job IDs
+    :return: list of metric dicts, empty dict for jobs without published metrics
+    """
+    pipe = redis.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(JOB_STATS_KEY.format(job_id))
+        pipe.smembers(JOB_CRAWLERS_KEY.format(job_id))
+    results = pipe.execute()
+    jobs_stats = [_decode(stats) for stats in results[0::2]]
+    crawlers = [(i, crawler_id.decode()) for i, crawler_ids in enumerate(results[1::2]) for crawler_id in crawler_ids]
+    if not crawlers:
+        return jobs_stats
+    pipe = redis.pipeline(transaction=False)
+    for i, crawler_id in crawlers:
+        pipe.hgetall(JOB_CRAWLER_STATS_KEY.format(job_ids[i], crawler_id))
+    crawlers_stats = {}
+    for (i, _), stats in zip(crawlers, pipe.execute()):
+        crawlers_stats.setdefault(i, []).append(_decode(stats))
+    for i, stats in crawlers_stats.items():
+        jobs_stats[i] = _aggregate([crawler_stats for crawler_stats in stats if crawler_stats])
+
+    return jobs_stats
+
+
+def _decode(stats: dict) -> dict:
+    """Returns Redis hash with decoded keys and values"""
+    return {key.decode(): value.decode() for key, value in stats.items()}
+
+
+def _aggregate(crawlers_stats: list) -> dict:
+    """
+    Aggregates metrics of distributed job crawlers
+    :param list crawlers_stats: metric dicts of job crawlers
+    :return: job metrics, finish reason is set only when all crawlers finished
+    """
+    if not crawlers_stats:
+        return {}
+    stats = {}
+    for crawler_stats in crawlers_stats:
+        for key, value in crawler_stats.items():
+            if key == "finish_reason":
+                continue
+            value = float(value)
+            if key in SUMMED_METRICS or key.startswith(SUMMED_METRICS_PREFIXES):
+                stats[key] = stats.get(key, 0) + value
+            else:
+                stats[key] = max(stats.get(key, value), value)
+    stats = {key: round(value, 3) if value % 1 else int(value) for key, value in stats.items()}
+    stats["crawlers"] = len(crawlers_stats)
+    if all("finish_reason" in crawler_stats for crawler_stats in crawlers_stats):
+        stats["finish_reason"] = crawlers_stats[0]["finish_reason"]
+
+    return stats
+
+
+def publish_job_event(redis, table: str, job_id: int, **data):
+    """
+    Notifies WebUI about a job state change, failures are only logged
+    :param redis: Redis client instance
+    :param str table: changed job row table name
+    :param int job_id: changed job row ID
+    :param data: additional event data
+    """
+    data.update({
+        "table": table,
+        "id": job_id,
+    })
+    try:
+        redis.publish(JOB_EVENTS_CHANNEL, dumps(data))
+    except Exception as e:  # TODO: Add specific exceptions
+        logger.warning("Failed publishing job ID {} event, details: {}".format(job_id, e))
@@ -0,0 +1,141 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import resource
+import sys
+from collections import deque
+from time import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
+try:  # main
+    from application.scrapers.scrapers.connections import get_redis
+    from application.scrapers.scrapers.events import (JOB_CRAWLER_STATS_KEY, JOB_CRAWLERS_KEY, JOB_STATS_KEY, JobTable,
+                                                      publish_job_event)
+except ImportError:  # scrapy crawl
+    sys.path.append("..")  # allow imports from application directory
+    from scrapers.connections import get_redis
+    from scrapers.events import JOB_CRAWLER_STATS_KEY, JOB_CRAWLERS_KEY, JOB_STATS_KEY, JobTable, publish_job_event
+
+
+class RedisStatsExtension:
+    """Periodically publishes live crawl metrics of a job to a Redis hash"""
+
+    def __init__(self, crawler, interval: float, latency_samples: int = 1000, expire: int = 86400):
+        """
+        :param crawler: scrapy crawler instance
+        :param float interval: publish interval in seconds
+        :param int latency_samples: number of the most recent download latencies used for percentiles
+        :param int expire: Redis hash expiration time in seconds
+        """
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._interval = interval
+        self._expire = expire
+        self._job_id = crawler.settings.get("JOB_ID")
+        self._key = JOB_STATS_KEY.format(self._job_id)
+        self._crawler_id = crawler.settings.get("CRAWLER_ID") if crawler.settings.getbool("DISTRIBUTED") else None
+        if self._crawler_id is not None:  # Each crawler of a distributed job publishes its own metrics
+            self._key = JOB_CRAWLER_STATS_KEY.format(self._job_id, self._crawler_id)
+        self._latencies = deque(maxlen=latency_samples)
+        self._previous = None
+        self._redis = None
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat("STATS_INTERVAL", 0)
+        if not interval or crawler.settings.get("JOB_ID") is None or crawler.settings.get("REDIS_HOST") is None:
+            raise NotConfigured
+        extension = cls(crawler, interval)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+
+        return extension
+
+    def spider_opened(self, spider):
+        self._redis = get_redis(self._crawler.settings.get("REDIS_HOST"), self._crawler.settings.get("REDIS_PORT"))
+        self._previous = time(), 0, 0
+        self._task = LoopingCall(self._publish)
+        self._task.start(self._interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        metrics = self._metrics()
+        metrics["finish_reason"] = reason
+        self._write(metrics)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self._latencies.append(latency)
+
+    def _publish(self):
+        """Writes current metrics in a thread pool so the Redis round trip doesn't block the reactor"""
+        d = deferToThread(self._write, self._metrics())
+        d.addErrback(lambda failure: self._crawler.spider.logger.warning(
+            "Failed publishing crawl stats, details: {}".format(failure.getErrorMessage())))
+
+        return d
+
+    def _write(self, metrics: dict):
+        """
+        Stores metrics to job's Redis hash and notifies WebUI
+        :param dict metrics: metric name to value mapping
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hset(self._key, mapping=metrics)
+        pipe.expire(self._key, self._expire)
+        if self._crawler_id is not None:
+            crawlers_key = JOB_CRAWLERS_KEY.format(self._job_id)
+            pipe.sadd(crawlers_key, self._crawler_id)
+            pipe.expire(crawlers_key, self._expire)
+        pipe.execute()
+        publish_job_event(self._redis, JobTable.JOBS, self._job_id, stats=True)
+
+    def _metrics(self) -> dict:
+        """Returns current crawl metrics"""
+        stats = self._stats.get_stats()
+        now = time()
+        requests = stats.get("downloader/request_count", 0)
+        items = stats.get("item_scraped_count", 0)
+        previous_time, previous_requests, previous_items = self._previous
+        elapsed = max(now - previous_time, 1e-6)
+        self._previous = now, requests, items
+        metrics = {
+            "updated": int(now),
+            "requests": requests,
+            "responses": stats.get("downloader/response_count", 0),
+            "items": items,
+            "errors": stats.get("log_count/ERROR", 0),
+            "requests_per_second": round((requests - previous_requests) / elapsed, 2),
+            "items_per_second": round((items - previous_items) / elapsed, 2),
+            "queue": self._queue_size(),
+            "in_progress": len(getattr(self._crawler.engine.downloader, "active", ())),
+            "memory": stats.get("memusage/max", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+        }
+        for key, value in stats.items():
+            if key.startswith("downloader/response_status_count/"):
+                metrics["status_" + key.rsplit('/', 1)[1]] = value
+        latencies = sorted(self._latencies)
+        for percentile in (50, 90, 99):
+            metrics["latency_p{}".format(percentile)] = round(
+                latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)], 3) if latencies else 0
+
+        return metrics
+
+    def _queue_size(self) -> int:
+        """Returns number of requests waiting in the scheduler"""
+        engine = self._crawler.engine
+        slot = getattr(engine, "slot", None) or getattr(engine, "_slot", None)
+        if slot is None or slot.scheduler is None:
+            return 0
+        try:
+            return len(slot.scheduler)
+        except TypeError:
+            return 0
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from cssselect import HTMLTranslator
+from lxml.etree import XPath
+
+XPATH_NAMESPACES = {"re": "http://exslt.org/regular-expressions"}  # Same as scrapy selectors
+
+
+class Field:
+    """Declarative extraction plan field"""
+
+    def __init__(self, xpath: str = None, css: str = None, many: bool = False, join: str = None):
+        """
+        :param str xpath: XPath expression
+        :param str css: CSS selector, used if XPath expression isn't set (::text and ::attr() aren't supported)
+        :param bool many: extract list of all matches instead of the first match
+        :param str join: extract all matches joined with given separator
+        """
+        if xpath is None and css is None:
+            raise ValueError("Field needs XPath expression or CSS selector!")
+        self.expression = xpath if xpath is not None else HTMLTranslator().css_to_xpath(css)
+        self.many = many
+        self.join = join
+
+    def value(self, matches: list):
+        """
+        Converts XPath matches to field value
+        :param list matches: XPath result, strings or elements
+        :return: string, list of strings or None
+        """
+        values = [match if isinstance(match, str) else ''.join(match.itertext()) for match in matches]
+        if self.join is not None:
+            return self.join.join(values)
+        if self.many:
+            return values
+
+        return values[0] if values else None
+
+
+class ExtractionPlan:
+    """Set of fields compiled once and extracted from an already parsed document tree in one pass"""
+
+    def __init__(self, fields: dict):
+        """
+        :param dict fields: field name: Field pairs
+        """
+        self.fields = [
+            (name, field, XPath(field.expression, namespaces=XPATH_NAMESPACES, smart_strings=False))
+            for name, field in fields.items()
+        ]
+
+    def extract(self, root) -> dict:
+        """
+        Extracts all fields
+        :param root: lxml document root, e.g. scrapy response.selector.root
+        :return: dict of field values
+        """
+        return {name: field.value(xpath(root)) for name, field, xpath in self.fields}
@@ -0,0 +1,208 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import pickle
+import sys
+from time import time
+
+from scrapy import signals
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet.task import LoopingCall
+
+try:  # Scrapy 2.6+
+    from scrapy.utils.request import request_from_dict
+
+    def request_to_dict(request, spider) -> dict:
+        return request.to_dict(spider=spider)
+except ImportError:
+    from scrapy.utils.reqser import request_from_dict as _request_from_dict, request_to_dict
+
+    def request_from_dict(d, spider=None):
+        return _request_from_dict(d, spider)
+
+try:  # main
+    from application.scrapers.scrapers.connections import get_redis
+except ImportError:  # scrapy crawl
+    sys.path.append("..")  # allow imports from application directory
+    from scrapers.connections import get_redis
+
+
+def register_crawlers(redis, key: str, crawler_ids: list, expire: int):
+    """
+    Registers all crawlers of a distributed job as active before any of them is started, so crawlers which finish
+    first don't remove the frontier or finish the job while other crawlers are still queued
+    :param redis: Redis client instance
+    :param str key: frontier Redis key prefix
+    :param list crawler_ids: IDs of the job crawlers
+    :param int expire: frontier expiration time in seconds
+    """
+    now = time()
+    pipe = redis.pipeline()
+    for crawler_id in crawler_ids:
+        pipe.hset(key + ":active", str(crawler_id), now)
+    pipe.expire(key + ":active", expire)
+    pipe.execute()
+
+
+class RedisDupeFilter(BaseDupeFilter):
+    """Request fingerprints shared by all crawlers of a job through a Redis set"""
+
+    def __init__(self, redis, key: str, fingerprint, expire: int):
+        """
+        :param redis: Redis client instance
+        :param str key: Redis set key name
+        :param fingerprint: function returning request fingerprint
+        :param int expire: Redis set expiration time in seconds (refreshed on every open)
+        """
+        self._redis = redis
+        self._key = key
+        self._fingerprint = fingerprint
+        self._expire = expire
+
+    @classmethod
+    def from_crawler(cls, crawler, redis, key: str):
+        fingerprinter = getattr(crawler, "request_fingerprinter", None)
+        if fingerprinter is not None:  # Scrapy 2.7+
+            fingerprint = fingerprinter.fingerprint
+        else:
+            from scrapy.utils.request import request_fingerprint as fingerprint
+
+        return cls(redis, key, fingerprint, crawler.settings.getint("FRONTIER_EXPIRE", 7 * 86400))
+
+    def open(self):
+        """Overridden"""
+        self._redis.expire(self._key, self._expire)
+
+    def request_seen(self, request) -> bool:
+        """Overridden, checking and adding the fingerprint is one atomic Redis command"""
+        fingerprint = self._fingerprint(request)
+        if isinstance(fingerprint, bytes):
+            fingerprint = fingerprint.hex()
+
+        return self._redis.sadd(self._key, fingerprint) == 0
+
+    def clear(self):
+        """Removes all fingerprints"""
+        self._redis.delete(self._key)
+
+
+class RedisScheduler:
+    """
+    Scrapy scheduler keeping pending requests of a job in a Redis sorted set (by request priority), so several crawler
+    processes on different workers share one frontier and dupefilter. Crawler isn't closed while the frontier has
+    requests or other crawlers of the job were active recently, since they may still add new requests.
+    """
+
+    def __init__(self, crawler, redis, key: str, crawler_id: str, idle_timeout: float, expire: int):
+        """
+        :param crawler: scrapy crawler instance
+        :param redis: Redis client instance
+        :param str key: frontier Redis key prefix
+        :param str crawler_id: ID of this crawler among the crawlers of the job
+        :param float idle_timeout: seconds crawler waits for other active crawlers before it closes
+        :param int expire: frontier expiration time in seconds (refreshed on every open)
+        """
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._redis = redis
+        self._requests_key = key + ":requests"
+        self._active_key = key + ":active"  # Crawler ID: timestamp of its last activity
+        self._crawler_id = crawler_id
+        self._idle_timeout = idle_timeout
+        self._expire = expire
+        self._last_active = 0.0
+        self._heartbeat = None
+        self.df = RedisDupeFilter.from_crawler(crawler, redis, key + ":seen")
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        key = settings.get("FRONTIER_KEY")
+        if not key:
+            raise ValueError("Frontier key isn't set!")
+        redis = get_redis(settings.get("REDIS_HOST"), settings.get("REDIS_PORT"))
+        scheduler = cls(
+            crawler,
+            redis,
+            key,
+            str(settings.get("CRAWLER_ID", 0)),
+            settings.getfloat("FRONTIER_IDLE_TIMEOUT", 30),
+            settings.getint("FRONTIER_EXPIRE", 7 * 86400),
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+
+        return scheduler
+
+    def __len__(self):
+        """Overridden"""
+        return self._redis.zcard(self._requests_key)
+
+    def open(self, spider):
+        self.spider = spider
+        self.df.open()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.expire(self._requests_key, self._expire)
+        pipe.hset(self._active_key, self._crawler_id, time())
+        pipe.expire(self._active_key, self._expire)
+        pipe.execute()
+        self._heartbeat = LoopingCall(self._beat)
+        self._heartbeat.start(max(1.0, self._idle_timeout / 3), now=False)
+        pending = len(self)
+        if pending:
+            spider.logger.info("Resuming crawl from shared frontier with {} pending request(s)".format(pending))
+
+    def close(self, reason: str):
+        if self._heartbeat is not None and self._heartbeat.running:
+            self._heartbeat.stop()
+        self._redis.hdel(self._active_key, self._crawler_id)
+        # Finished frontier is removed by the last crawler, otherwise it's kept for resuming the job
+        if reason == "finished" and not self._redis.hlen(self._active_key) and not len(self):
+            self._redis.delete(self._requests_key, self._active_key)
+            self.df.clear()
+
+    def has_pending_requests(self) -> bool:
+        return len(self) > 0
+
+    def enqueue_request(self, request) -> bool:
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+        data = pickle.dumps(request_to_dict(request, self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        self._redis.zadd(self._requests_key, {data: -request.priority})
+        self._stats.inc_value("scheduler/enqueued/redis", spider=self.spider)
+        self._active()
+
+        return True
+
+    def next_request(self):
+        popped = self._redis.zpopmin(self._requests_key)
+        if not popped:
+            return None
+        data, _ = popped[0]
+        self._stats.inc_value("scheduler/dequeued/redis", spider=self.spider)
+        self._active()
+
+        return request_from_dict(pickle.loads(data), spider=self.spider)
+
+    def spider_idle(self, spider):
+        """Keeps the crawler open while the frontier isn't empty or other crawlers of the job are still working"""
+        if len(self):
+            raise DontCloseSpider
+        now = time()
+        for crawler_id, last_active in self._redis.hgetall(self._active_key).items():
+            if crawler_id.decode() != self._crawler_id and now - float(last_active) < self._idle_timeout:
+                raise DontCloseSpider
+
+    def _active(self):
+        """Marks this crawler as active, Redis is updated at most once per second"""
+        now = time()
+        if now - self._last_active >= 1:
+            self._last_active = now
+            self._redis.hset(self._active_key, self._crawler_id, now)
+
+    def _beat(self):
+        """Marks this crawler as active while it has requests in progress"""
+        if self._crawler.engine is not None and self._crawler.engine.downloader.active:
+            self._active()
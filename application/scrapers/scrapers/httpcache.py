@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import logging
+from collections import OrderedDict
+from os import listdir, stat, utime
+from os.path import getsize, isdir, join
+from shutil import rmtree
+from time import time
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import FilesystemCacheStorage, RFC2616Policy
+
+logger = logging.getLogger(__name__)
+
+CACHE_CLASS_META_KEY = "cache_class"  # Request meta key with URL class name, e.g. listing or detail
+TIMESTAMP_HEADER = b"X-Httpcache-Timestamp"
+
+
+class TTLPolicy(RFC2616Policy):
+    """
+    HTTP cache policy with fixed time to live per URL class (request meta cache_class), stale responses are revalidated
+    with ETag/Last-Modified conditional requests. Requests without URL class follow RFC2616 policy.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self._ttls = settings.getdict("HTTPCACHE_TTLS")
+
+    def _ttl(self, request):
+        """
+        Returns time to live of request's URL class
+        :param request: scrapy request
+        :return: seconds or None if request doesn't have URL class
+        """
+        return self._ttls.get(request.meta.get(CACHE_CLASS_META_KEY))
+
+    def should_cache_response(self, response, request):
+        """Overridden"""
+        if self._ttl(request) is None:
+            return super().should_cache_response(response, request)
+
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        """Overridden"""
+        ttl = self._ttl(request)
+        if ttl is None:
+            return super().is_cached_response_fresh(cachedresponse, request)
+        timestamp = cachedresponse.headers.get(TIMESTAMP_HEADER)
+        if timestamp is not None and time() - float(timestamp) < ttl:
+            return True
+        self._set_conditional_validators(request, cachedresponse)
+
+        return False
+
+
+class TTLHttpCacheMiddleware(HttpCacheMiddleware):
+    """HTTP cache middleware which restarts time to live of cached responses revalidated by the server (304)"""
+
+    def process_response(self, request, response, spider):
+        """Overridden"""
+        cachedresponse = request.meta.get("cached_response")
+        result = super().process_response(request, response, spider)
+        if cachedresponse is not None and result is cachedresponse and hasattr(self.storage, "touch_response"):
+            self.storage.touch_response(spider, request)
+
+        return result
+
+
+class LRUFilesystemCacheStorage(FilesystemCacheStorage):
+    """Filesystem HTTP cache storage bounded by size, least recently used responses are evicted first"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self._max_size = settings.getint("HTTPCACHE_MAX_SIZE", 0)
+        self._entries = OrderedDict()  # Response dir path: size in bytes, least recently used first
+        self._size = 0
+
+    def open_spider(self, spider):
+        """Overridden, indexes cached responses of the spider by last access time"""
+        super().open_spider(spider)
+        spider_dir = join(self.cachedir, spider.name)
+        entries = []
+        if isdir(spider_dir):
+            for prefix in listdir(spider_dir):
+                for key in listdir(join(spider_dir, prefix)):
+                    path = join(spider_dir, prefix, key)
+                    try:
+                        entries.append((_last_access(path), path, _dir_size(path)))
+                    except OSError:
+                        continue
+        for _, path, size in sorted(entries):
+            self._entries[path] = size
+            self._size += size
+        logger.info("HTTP cache has {} response(s), {:.1f} MB".format(len(self._entries), self._size / 1024 / 1024))
+
+    def retrieve_response(self, spider, request):
+        """Overridden"""
+        path = self._get_request_path(spider, request)
+        try:
+            response = super().retrieve_response(spider, request)
+            if response is None:
+                return None
+            # Responses are stamped with the time they were stored, TTL policy doesn't depend on the Date header
+            response.headers[TIMESTAMP_HEADER] = str(stat(join(path, "pickled_meta")).st_mtime)
+            utime(join(path, "response_body"))  # Last access time
+        except OSError:  # Evicted by other crawl process
+            return None
+        if path in self._entries:
+            self._entries.move_to_end(path)
+
+        return response
+
+    def touch_response(self, spider, request):
+        """
+        Restamps cached response with current time after successful revalidation
+        :param spider: scrapy spider
+        :param request: scrapy request
+        """
+        try:
+            utime(join(self._get_request_path(spider, request), "pickled_meta"))
+        except OSError:  # Evicted by other crawl process
+            pass
+
+    def store_response(self, spider, response, request):
+        """Overridden"""
+        super().store_response(spider, response, request)
+        path = self._get_request_path(spider, request)
+        self._size -= self._entries.pop(path, 0)
+        try:
+            self._entries[path] = _dir_size(path)
+        except OSError:
+            return
+        self._size += self._entries[path]
+        self._evict()
+
+    def _evict(self):
+        """Removes least recently used responses while the cache is larger than maximum size"""
+        if self._max_size <= 0:
+            return
+        evicted = 0
+        while self._size > self._max_size and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            rmtree(path, ignore_errors=True)
+            self._size -= size
+            evicted += 1
+        if evicted:
+            logger.debug("Evicted {} response(s) from HTTP cache".format(evicted))
+
+
+def _dir_size(path: str) -> int:
+    """
+    Returns total size of the files in a directory
+    :param str path: directory path
+    :return: size in bytes
+    """
+    return sum(getsize(join(path, file_name)) for file_name in listdir(path))
+
+
+def _last_access(path: str) -> float:
+    """
+    Returns last access time of cached response (response body file modification time)
+    :param str path: response directory path
+    :return: timestamp
+    """
+    return stat(join(path, "response_body")).st_mtime
+
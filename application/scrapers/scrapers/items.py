@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from dataclasses import dataclass
+
 from scrapy import Field, Item
 
 
@@ -11,3 +13,21 @@ class JobPostItem(Item):
     Description = Field()
     Date_Added = Field()
     Date_Job_Posted = Field()
+    Fingerprint = Field()
+    Duplicate_Of = Field()
+
+
+@dataclass
+class JobPostRecord:
+    """Slotted job post item, lighter than dict backed JobPostItem and consumed by pipelines as it is"""
+    __slots__ = ("Job_Post_ID", "URL", "Title", "Location", "Description", "Date_Added", "Date_Job_Posted", "Fingerprint",
+                 "Duplicate_Of")
+    Job_Post_ID: str
+    URL: str
+    Title: str
+    Location: str
+    Description: str
+    Date_Added: str
+    Date_Job_Posted: str
+    Fingerprint: int  # Set by near-duplicate pipeline
+    Duplicate_Of: str
@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
+from itertools import count
 from logging import DEBUG, getLogger
 from random import choice
+import sys
 
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.threads import deferToThread
+
+try:  # main
+    from application.scrapers.scrapers.proxies import ProxyPool
+except ImportError:  # scrapy crawl
+    sys.path.append("..")  # allow imports from application directory
+    from scrapers.proxies import ProxyPool
 
 
 logger = getLogger(__name__)
@@ -106,36 +118,189 @@ class ScrapersDownloaderMiddleware(object):
 
 
 class RotatingUserAgentMiddleware:
-    """Rotates user agent on each request"""
+    """Keeps one user agent per proxy (or download slot without proxies) session, session gets a new user agent after
+    a ban or configured number of requests"""
+
+    BAN_STATUSES = (403, 407, 429)
 
-    def __init__(self, user_agents):
+    def __init__(self, user_agents, stats, max_sessions: int = 1000, session_requests: int = 100,
+                 session_cookies: bool = False):
         """
         :param list user_agents: list of browser user agent strings
+        :param stats: scrapy stats collector
+        :param int max_sessions: maximum number of sessions, least recently used sessions are dropped
+        :param int session_requests: number of requests after session gets a new user agent, 0 disables rotation
+        :param bool session_cookies: use separate cookie jar for each session
         """
         self._enabled = True if user_agents else False
         self._user_agents = user_agents
+        self._stats = stats
+        self._max_sessions = max_sessions
+        self._session_requests = session_requests
+        self._session_cookies = session_cookies
+        self._sessions = OrderedDict()  # Session key: [user agent, number of requests, cookie jar ID]
+        self._cookie_jars = count()
 
     @classmethod
     def from_crawler(cls, crawler):
-        user_agents = crawler.settings.get("USER_AGENTS")
+        settings = crawler.settings
+
+        return cls(
+            settings.getlist("USER_AGENTS"),
+            crawler.stats,
+            settings.getint("USER_AGENT_SESSIONS", 1000),
+            settings.getint("USER_AGENT_SESSION_REQUESTS", 100),
+            settings.getbool("USER_AGENT_SESSION_COOKIES", False),
+        )
+
+    @staticmethod
+    def _session_key(request) -> str:
+        """Returns session key of a request, proxy or download slot"""
+        proxy = request.meta.get("proxy")
+        if proxy:
+            return proxy
+
+        return request.meta.get("download_slot") or urlparse_cached(request).hostname
+
+    def _new_session(self, key: str) -> list:
+        """
+        Starts new session with random user agent
+        :param str key: session key
+        :return: session
+        """
+        session = [choice(self._user_agents), 0, next(self._cookie_jars)]
+        self._sessions[key] = session
+        if len(self._sessions) > self._max_sessions:
+            self._sessions.popitem(last=False)
+        self._stats.inc_value("useragent/sessions")
 
-        return cls(user_agents)
+        return session
 
     def process_request(self, request, spider):
         if self._enabled:
-            # if "proxy" in request.meta:
-            #     proxy = request.meta["proxy"]
-            #     if proxy in self._proxies:
-            #         user_agent = self._proxies[proxy]
-            #     else:
-            #         user_agent = choice(self._user_agents)
-            #         self._proxies[proxy] = user_agent
-            # else:
-            #     user_agent = choice(self._user_agents)
-            user_agent = choice(self._user_agents)
-            logger.debug(user_agent)
-            # request.headers["User-Agent"] = user_agent
-            # request.headers["User-Agent"] = user_agent
-            # print(user_agent)
-            # print(self._proxies)
-            request.headers.setdefault("user-agent", user_agent)
+            key = self._session_key(request)
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._new_session(key)
+            elif 0 < self._session_requests <= session[1]:
+                self._stats.inc_value("useragent/rotations")
+                session = self._new_session(key)
+            else:
+                self._sessions.move_to_end(key)
+            session[1] += 1
+            # Retried requests come back with user agent of their previous session
+            request.headers["User-Agent"] = session[0]
+            if self._session_cookies:
+                request.meta["cookiejar"] = session[2]
+            logger.debug("Session '{}' user agent '{}'".format(key, session[0]))
+
+    def process_response(self, request, response, spider):
+        if self._enabled and response.status in self.BAN_STATUSES:
+            key = self._session_key(request)
+            session = self._sessions.get(key)
+            # Rotate only if the banned user agent is still in use, parallel requests may report the same ban
+            if session is not None and request.headers.get("User-Agent", b'').decode() == session[0]:
+                del self._sessions[key]
+                self._stats.inc_value("useragent/ban_rotations")
+                logger.debug("Session '{}' banned, rotating user agent".format(key))
+
+        return response
+
+
+class ProxyPoolMiddleware:
+    """Routes requests through proxies picked from the proxy pool by score, banned or failed requests are retried
+    through other proxies"""
+
+    BAN_STATUSES = (403, 407, 429)
+
+    def __init__(self, crawler, proxies):
+        """
+        :param crawler: scrapy crawler instance
+        :param list proxies: proxy URLs
+        """
+        settings = crawler.settings
+        self._stats = crawler.stats
+        self._pool = ProxyPool(proxies, settings.get("PROXY_STATS_FILE"), settings.getfloat("PROXY_BAN_COOLDOWN", 300))
+        self._max_retries = settings.getint("PROXY_MAX_RETRIES", 5)
+        self._check_url = settings.get("PROXY_CHECK_URL")
+        self._check_timeout = settings.getfloat("PROXY_CHECK_TIMEOUT", 10)
+        self._check_max_age = settings.getfloat("PROXY_CHECK_MAX_AGE", 600)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        proxies = crawler.settings.getlist("PROXY_LIST")
+        if not proxies or not crawler.settings.get("PROXY_STATS_FILE"):
+            raise NotConfigured
+        middleware = cls(crawler, proxies)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+
+        return middleware
+
+    def spider_opened(self, spider):
+        """Health checks proxies which weren't used recently before the crawl starts"""
+        if not self._check_url:
+            return None
+        spider.logger.info("Checking {} proxies ...".format(len(self._pool)))
+        d = deferToThread(self._pool.health_check, self._check_url, self._check_timeout, self._check_max_age)
+        d.addErrback(lambda failure: spider.logger.warning(
+            "Failed checking proxies, details: {}".format(failure.getErrorMessage())))
+
+        return d
+
+    def spider_closed(self, spider):
+        self._pool.save()
+
+    def process_request(self, request, spider):
+        if "proxy_pool" in request.meta:  # Retried requests have their proxy replaced in _retry
+            return None
+        proxy = self._pool.choose()
+        request.meta["proxy"] = proxy
+        request.meta["proxy_pool"] = proxy
+        self._stats.inc_value("proxies/requests")
+
+        return None
+
+    def process_response(self, request, response, spider):
+        proxy = request.meta.get("proxy_pool")
+        if proxy is None:
+            return response
+        if response.status in self.BAN_STATUSES:
+            self._pool.record_ban(proxy)
+            self._stats.inc_value("proxies/bans")
+            return self._retry(request, proxy, "ban ({})".format(response.status), spider) or response
+        self._pool.record_success(proxy, request.meta.get("download_latency"))
+
+        return response
+
+    def process_exception(self, request, exception, spider):
+        proxy = request.meta.get("proxy_pool")
+        if proxy is None:
+            return None
+        self._pool.record_failure(proxy)
+        self._stats.inc_value("proxies/failures")
+
+        return self._retry(request, proxy, exception.__class__.__name__, spider)
+
+    def _retry(self, request, proxy: str, reason: str, spider):
+        """
+        Creates request retry through other proxy
+        :param request: failed request
+        :param str proxy: failed proxy
+        :param str reason: failure reason
+        :param spider: spider instance
+        :return: new request or None if the request was retried too many times
+        """
+        retries = request.meta.get("proxy_retries", 0) + 1
+        if retries > self._max_retries:
+            spider.logger.warning("Gave up retrying '{}' through proxies, last {}".format(request.url, reason))
+            return None
+        new_proxy = self._pool.choose(exclude=(proxy, ))
+        spider.logger.debug("Retrying '{}' through {} after {} of {}".format(request.url, new_proxy, reason, proxy))
+        retry = request.replace(dont_filter=True, meta=dict(request.meta))
+        retry.meta["proxy"] = new_proxy
+        retry.meta["proxy_pool"] = new_proxy
+        retry.meta["proxy_retries"] = retries
+        self._stats.inc_value("proxies/retries")
+
+        return retry
@@ -1,10 +1,17 @@
 # -*- coding: UTF-8 -*-
 #!/usr/bin/env python
 
+import sys
 
-from sqlalchemy import Column, create_engine
+from sqlalchemy import Column, create_engine, inspect, text
+from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import DateTime, Integer, String, Text
+try:
+    from application.scrapers.scrapers.connections import get_engine
+except ImportError:
+    sys.path.append("..")  # allow imports from application directory
+    from scrapers.connections import get_engine
 
 
 Base = declarative_base()
@@ -22,6 +29,23 @@ class JobPosts(Base):
     description = Column(Text(), nullable=False)
     date_added = Column(DateTime, nullable=False)
     date_job_posted = Column(DateTime, nullable=False)
+    simhash = Column(BIGINT(unsigned=True))  # Title, location and description fingerprint
+    duplicate_of = Column(String(32), index=True)  # Job post ID of the near-duplicate original
+    content_hash = Column(String(32))  # Title, location and description hash, unchanged job posts aren't rewritten
+
+
+class PendingJobPosts(Base):
+    """Pending Job Post table model, job posts found on listing pages whose detail pages weren't scraped yet"""
+    __tablename__ = "pending_job_posts"
+
+    id = Column(Integer, primary_key=True)
+    job_post_id = Column(String(32), unique=True, nullable=False)
+    url = Column(String(512), nullable=False)
+    country = Column(String(8))  # Download slot of the detail page
+    date_added = Column(DateTime, nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0)  # Number of times detail page was claimed
+    claimed_by = Column(String(64), index=True)  # Task ID of the crawler fetching the detail page
+    claimed_until = Column(DateTime, index=True)  # Claim expiration, detail page is claimed again after it
 
 
 def create_db(db_uri: str, db_name: str):
@@ -45,6 +69,41 @@ def create_tables(db_uri: str):
     Base.metadata.create_all(engine)
 
 
+def upgrade_tables(db_uri: str):
+    """Adds columns and indexes missing in tables created by older versions"""
+    upgrade_schema(get_engine(db_uri), Base.metadata)
+
+
+def upgrade_schema(engine, metadata):
+    """
+    Adds columns and indexes missing in existing tables and creates missing tables, SQLite can only add nullable
+    columns
+    :param engine: SQLAlchemy engine instance
+    :param metadata: SQLAlchemy metadata of the tables
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    indexes_created = False
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}".format(
+                        quote(table.name), quote(column.name), column.type.compile(engine.dialect))))
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    indexes_created = True
+        if indexes_created and engine.dialect.name == "sqlite":
+            connection.execute(text("ANALYZE"))  # Query planner statistics for the new indexes
+    metadata.create_all(engine)
+
+
 def table_exists(db_uri: str, table: str):
     engine = create_engine(db_uri)
     return engine.dialect.has_table(engine, table)
@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.mysql import insert
+
+try:  # main
+    from application.scrapers.scrapers.models import PendingJobPosts
+except ImportError:  # scrapy crawl
+    sys.path.append("..")  # allow imports from application directory
+    from scrapers.models import PendingJobPosts
+
+
+class PendingQueue:
+    """
+    Work queue of job posts found on listing pages, kept in the pending_job_posts table. Discovery crawls push unseen
+    job posts, detail crawls claim batches of them for a lease time, so several crawlers drain the queue in parallel
+    and detail pages of crashed crawls are claimed again after their lease expires.
+    """
+
+    def __init__(self, db_session, lease: float = 3600, max_attempts: int = 3):
+        """
+        :param db_session: job posts DB session
+        :param float lease: seconds claimed job post isn't given to other crawlers
+        :param int max_attempts: number of claims after job post is removed from the queue
+        """
+        self._db = db_session
+        self._lease = lease
+        self._max_attempts = max_attempts
+
+    def __len__(self):
+        """Overridden"""
+        return self._db.query(PendingJobPosts.id).count()
+
+    def push(self, job_posts: list) -> int:
+        """
+        Adds discovered job posts, job posts already in the queue are ignored
+        :param list job_posts: list of (job post ID, URL, country) tuples
+        :return: number of pushed job posts
+        """
+        if not job_posts:
+            return 0
+        now = datetime.now()
+        rows = [
+            {"job_post_id": job_post_id, "url": url, "country": country, "date_added": now, "attempts": 0}
+            for job_post_id, url, country in job_posts
+        ]
+        statement = insert(PendingJobPosts.__table__).values(rows)
+        self._db.execute(statement.on_duplicate_key_update(job_post_id=statement.inserted.job_post_id))
+        self._db.commit()
+
+        return len(rows)
+
+    def claim(self, owner: str, limit: int) -> list:
+        """
+        Claims oldest unclaimed job posts, a job post is claimed by only one crawler at a time
+        :param str owner: claiming crawler ID, e.g. task ID
+        :param int limit: maximum number of job posts
+        :return: list of (job post ID, URL, country) tuples
+        """
+        now = datetime.now()
+        # Job posts whose detail pages failed too many times
+        self._db.query(PendingJobPosts).filter(PendingJobPosts.attempts >= self._max_attempts).filter(
+            PendingJobPosts.claimed_until < now).delete(synchronize_session=False)
+        available = or_(PendingJobPosts.claimed_until.is_(None), PendingJobPosts.claimed_until < now)
+        ids = [job_post_id for job_post_id, in self._db.query(PendingJobPosts.id).filter(available).order_by(
+            PendingJobPosts.date_added).limit(limit)]
+        if not ids:
+            self._db.commit()
+            return []
+        # Claim condition is checked again by the update, job posts claimed by other crawler meanwhile are skipped
+        self._db.query(PendingJobPosts).filter(PendingJobPosts.id.in_(ids)).filter(available).update({
+            PendingJobPosts.claimed_by: owner,
+            PendingJobPosts.claimed_until: now + timedelta(seconds=self._lease),
+            PendingJobPosts.attempts: PendingJobPosts.attempts + 1,
+        }, synchronize_session=False)
+        self._db.commit()
+
+        return self._db.query(PendingJobPosts.job_post_id, PendingJobPosts.url, PendingJobPosts.country).filter(
+            PendingJobPosts.id.in_(ids)).filter(PendingJobPosts.claimed_by == owner).all()
+
+    def remove(self, job_post_ids: list):
+        """
+        Removes scraped job posts, changes are committed by the caller
+        :param list job_post_ids: job post IDs
+        """
+        if job_post_ids:
+            self._db.query(PendingJobPosts).filter(PendingJobPosts.job_post_id.in_(job_post_ids)).delete(
+                synchronize_session=False)
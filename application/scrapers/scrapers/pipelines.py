@@ -2,17 +2,29 @@
 
 import logging
 import sys
+from hashlib import blake2b
 from urllib.parse import parse_qs, urlparse
 
-from sqlalchemy import create_engine
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.orm import sessionmaker
+from twisted.internet.task import LoopingCall
 
 
 try:  # main
-    from application.scrapers.scrapers.models import JobPosts
+    from application.scrapers.scrapers.common import ScrapeType
+    from application.scrapers.scrapers.connections import get_engine, get_redis
+    from application.scrapers.scrapers.models import JobPosts, upgrade_tables
+    from application.scrapers.scrapers.pending import PendingQueue
+    from application.scrapers.scrapers.simhash import NearDuplicateIndex, simhash
 except ImportError:  # scrapy crawl
     sys.path.append("..")  # allow imports from application directory
-    from scrapers.models import JobPosts
+    from scrapers.common import ScrapeType
+    from scrapers.connections import get_engine, get_redis
+    from scrapers.models import JobPosts, upgrade_tables
+    from scrapers.pending import PendingQueue
+    from scrapers.simhash import NearDuplicateIndex, simhash
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +38,75 @@ class ScrapersPipeline:
         return item
 
 
+class NearDuplicatePipeline(ScrapersPipeline):
+    """
+    Detects reposts of the same job post under other job post IDs or countries by SimHash fingerprint of its title,
+    location and description. Near-duplicates are dropped or linked to the original job post (duplicate_of column),
+    fingerprints of original job posts are kept in a persistent Redis index shared by all jobs.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        mode = settings.get("NEAR_DUPLICATE_MODE")
+        if mode not in ("drop", "link"):
+            raise NotConfigured
+        key = settings.get("NEAR_DUPLICATE_REDIS_KEY")
+        if not key:
+            raise NotConfigured
+        index = NearDuplicateIndex(
+            get_redis(settings.get("REDIS_HOST"), settings.get("REDIS_PORT")),
+            key,
+            settings.getint("NEAR_DUPLICATE_DISTANCE", 5),
+        )
+
+        return cls(crawler, index, mode)
+
+    def __init__(self, crawler, index: NearDuplicateIndex, mode: str):
+        """
+        :param crawler: scrapy crawler instance
+        :param NearDuplicateIndex index: fingerprint index
+        :param str mode: drop or link near-duplicates
+        """
+        self._stats = crawler.stats
+        self._settings = crawler.settings
+        self._index = index
+        self._mode = mode
+
+    def open_spider(self, spider):
+        # Index is loaded once from job posts fingerprinted before, later job posts are added as they are scraped
+        db_uri = self._settings.get("DB_URI")
+        if db_uri is None or self._index.loaded:
+            return
+        try:
+            DBSession = sessionmaker(bind=get_engine(db_uri))
+            db_session = DBSession()
+            query = db_session.query(JobPosts.job_post_id, JobPosts.simhash).filter(
+                JobPosts.simhash.isnot(None), JobPosts.duplicate_of.is_(None))
+            count = self._index.load(query.yield_per(10000))
+            db_session.close()
+            logger.info("Loaded {} job post fingerprint(s) to near-duplicate index".format(count))
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.error("Failed loading job post fingerprints, details: {}".format(e))
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        job_post_id = MySQLPipeline._job_post_id(adapter)
+        fingerprint = simhash(' '.join((adapter.get("Title") or '', adapter.get("Location") or '',
+                                        adapter.get("Description") or '')))
+        duplicate_of = self._index.find(fingerprint, job_post_id)
+        if duplicate_of is not None:
+            self._stats.inc_value("dedup/near_duplicates")
+            if self._mode == "drop":
+                raise DropItem("Job post '{}' is near-duplicate of '{}'".format(job_post_id, duplicate_of))
+        elif job_post_id is not None:
+            self._index.add(fingerprint, job_post_id)
+        adapter["Fingerprint"] = fingerprint
+        adapter["Duplicate_Of"] = duplicate_of
+
+        return item
+
+
 class MySQLPipeline(ScrapersPipeline):
     """Scrapy pipeline for MySQL"""
 
@@ -44,38 +125,193 @@ class MySQLPipeline(ScrapersPipeline):
         #     passw=self._settings.get("DB_PASS"),
         # )
         # self._engine = create_engine(db_uri)
-        self._engine = create_engine(self._settings["DB_URI"])
+        self._engine = get_engine(self._settings["DB_URI"])
         self._db_session = None
+        # Buffered mode, items are written in batches when batch size is greater than 1
+        self._batch_size = self._settings.getint("DB_BATCH_SIZE", 1)
+        self._flush_interval = self._settings.getfloat("DB_FLUSH_INTERVAL", 0)
+        self._buffer = []
+        self._flush_task = None
+        # Changed job posts scrape, known job posts are written only if their content hash changed
+        self._skip_unchanged = self._settings.getint("SCRAPE_TYPE", ScrapeType.ALL) == ScrapeType.CHANGED
+        # Pending job posts scrape, scraped job posts are removed from the pending queue
+        self._drain_pending = self._settings.getint("SCRAPE_TYPE", ScrapeType.ALL) == ScrapeType.PENDING
 
     def open_spider(self, spider):
+        try:  # Tables created by older versions
+            upgrade_tables(self._settings["DB_URI"])
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.error("Failed upgrading job posts table, details: {}".format(e))
         DBSession = sessionmaker(bind=self._engine)
         self._db_session = DBSession()
         # self._db_session = self._engine.connect()
+        if self._batch_size > 1 and self._flush_interval > 0:
+            self._flush_task = LoopingCall(self._flush)
+            self._flush_task.start(self._flush_interval, now=False)
 
     def close_spider(self, spider):
+        if self._flush_task is not None and self._flush_task.running:
+            self._flush_task.stop()
+        self._flush()
         self._db_session.close()
 
     def process_item(self, item, spider):
+        row = MySQLPipeline._item_to_row(item)
+        seen_job_posts = getattr(spider, "seen_job_posts", None)
+        if seen_job_posts is not None:
+            seen_job_posts.add(row["job_post_id"])
+        if self._batch_size > 1:
+            self._buffer.append(row)
+            if len(self._buffer) >= self._batch_size:
+                self._flush()
+            return item
+        if not self._changed_rows([row]):
+            return item
         try:
-            job_post = JobPosts(
-                job_post_id=MySQLPipeline._get_job_post_id(item["URL"]),
-                url=item["URL"],
-                title=item["Title"],
-                location=item["Location"],
-                description=item["Description"],
-                date_added=item["Date_Added"],
-                date_job_posted=item["Date_Job_Posted"],
-            )
-            self._db_session.add(job_post)
+            self._write([row])
             self._db_session.commit()
             # self._db_session.flush()
-            logger.info("Successfully added job post '{}' to DB".format(item["Title"]))
+            self._stats.inc_value("db/items_inserted")
+            logger.info("Successfully added job post '{}' to DB".format(row["title"]))
         except Exception as e:  # TODO: Add specific exceptions
             logger.error("Failed inserting job post to DB, details: {}".format(e))
             self._db_session.rollback()
+            self._stats.inc_value("db/items_failed")
             
         return item
 
+    def _flush(self):
+        """Writes buffered job posts with one multi-row insert, retrying the rows one by one if the batch fails"""
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        rows = self._changed_rows(rows)
+        if not rows:
+            return
+        try:
+            self._write(rows)
+            self._db_session.commit()
+            self._stats.inc_value("db/items_inserted", len(rows))
+            self._stats.inc_value("db/batches")
+            logger.info("Successfully added {} job post(s) to DB".format(len(rows)))
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.warning("Failed inserting batch of {} job post(s) to DB, retrying one by one, details: {}".format(
+                len(rows), e))
+            self._db_session.rollback()
+            for row in rows:
+                try:
+                    self._write([row])
+                    self._db_session.commit()
+                    self._stats.inc_value("db/items_inserted")
+                except Exception as e:  # TODO: Add specific exceptions
+                    logger.error("Failed inserting job post '{}' to DB, details: {}".format(row["url"], e))
+                    self._db_session.rollback()
+                    self._stats.inc_value("db/items_failed")
+
+    def _write(self, rows: list):
+        """
+        Executes upsert of given rows, drained pending job posts are removed in the same transaction
+        :param list rows: list of job_posts row dicts
+        """
+        self._db_session.execute(MySQLPipeline._upsert_statement(rows))
+        if self._drain_pending:
+            PendingQueue(self._db_session).remove([row["job_post_id"] for row in rows])
+
+    def _changed_rows(self, rows: list) -> list:
+        """
+        Filters out rows of known job posts with unchanged content, if enabled
+        :param list rows: list of job_posts row dicts
+        :return: rows of new and changed job posts
+        """
+        if not self._skip_unchanged:
+            return rows
+        try:
+            stored = dict(self._db_session.query(JobPosts.job_post_id, JobPosts.content_hash).filter(
+                JobPosts.job_post_id.in_([row["job_post_id"] for row in rows])))
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.warning("Failed reading job post content hashes, details: {}".format(e))
+            self._db_session.rollback()
+            return rows
+        changed = []
+        for row in rows:
+            content_hash = stored.get(row["job_post_id"])
+            if content_hash is None:
+                changed.append(row)
+            elif content_hash != row["content_hash"]:
+                self._stats.inc_value("db/items_changed")
+                changed.append(row)
+        if len(changed) < len(rows):
+            self._stats.inc_value("db/items_unchanged", len(rows) - len(changed))
+            logger.debug("Skipped {} unchanged job post(s)".format(len(rows) - len(changed)))
+
+        return changed
+
+    @staticmethod
+    def _upsert_statement(rows: list):
+        """
+        Returns INSERT ... ON DUPLICATE KEY UPDATE statement for given rows
+        :param list rows: list of job_posts row dicts
+        :return: insert statement
+        """
+        statement = insert(JobPosts.__table__).values(rows)
+
+        return statement.on_duplicate_key_update(
+            url=statement.inserted.url,
+            title=statement.inserted.title,
+            location=statement.inserted.location,
+            description=statement.inserted.description,
+            date_job_posted=statement.inserted.date_job_posted,
+            simhash=statement.inserted.simhash,
+            duplicate_of=statement.inserted.duplicate_of,
+            content_hash=statement.inserted.content_hash,
+        )
+
+    @staticmethod
+    def _item_to_row(item) -> dict:
+        """
+        Converts scraped item to job_posts row dict
+        :param item: job post record or item
+        :return: row dict
+        """
+        adapter = ItemAdapter(item)
+
+        return {
+            "job_post_id": MySQLPipeline._job_post_id(adapter),
+            "url": adapter["URL"],
+            "title": adapter["Title"],
+            "location": adapter["Location"],
+            "description": adapter["Description"],
+            "date_added": adapter["Date_Added"],
+            "date_job_posted": adapter["Date_Job_Posted"],
+            "simhash": adapter.get("Fingerprint"),
+            "duplicate_of": adapter.get("Duplicate_Of"),
+            "content_hash": MySQLPipeline._content_hash(adapter["Title"], adapter["Location"], adapter["Description"]),
+        }
+
+    @staticmethod
+    def _job_post_id(adapter: ItemAdapter) -> str:
+        """
+        Returns job post ID of a job post record or parsed from URL of a job post item
+        :param ItemAdapter adapter: adapted job post record or item
+        :return: job post ID or None
+        """
+        job_post_id = adapter.get("Job_Post_ID")
+
+        return job_post_id if job_post_id is not None else MySQLPipeline._get_job_post_id(adapter["URL"])
+
+    @staticmethod
+    def _content_hash(title: str, location: str, description: str) -> str:
+        """
+        Returns hash of job post content, posted date isn't included since it's resolved from relative time
+        :param str title: job post title
+        :param str location: job post location
+        :param str description: job post description
+        :return: hex digest
+        """
+        content = '\x1f'.join((title or '', location or '', description or ''))
+
+        return blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
     @staticmethod
     def _get_job_post_id(url: str) -> str:
         try:
@@ -0,0 +1,250 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fcntl import LOCK_EX, LOCK_UN, flock
+from os import replace
+from os.path import isfile
+from random import choices
+from time import perf_counter, time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SMOOTHING = 0.2  # Weight of the newest latency sample in the moving average
+BAN_HALF_LIFE = 60 * 60  # seconds for proxy ban score to halve
+
+
+class ProxyStats:
+    """Proxy usage history"""
+    __slots__ = ("requests", "successes", "failures", "bans", "ban_score", "latency", "last_ban", "last_check")
+
+    def __init__(self, requests: int = 0, successes: int = 0, failures: int = 0, bans: int = 0,
+                 ban_score: float = 0.0, latency: float = None, last_ban: float = 0.0, last_check: float = 0.0):
+        """
+        :param int requests: number of requests
+        :param int successes: number of successful responses
+        :param int failures: number of connection errors and timeouts
+        :param int bans: number of bans
+        :param float ban_score: ban score at the time of the last ban, decays over time
+        :param float latency: moving average of response latency in seconds
+        :param float last_ban: timestamp of the last ban
+        :param float last_check: timestamp of the last health check
+        """
+        self.requests = requests
+        self.successes = successes
+        self.failures = failures
+        self.bans = bans
+        self.ban_score = ban_score
+        self.latency = latency
+        self.last_ban = last_ban
+        self.last_check = last_check
+
+    def to_dict(self) -> dict:
+        """Returns stats as a dict"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def current_ban_score(self, now: float) -> float:
+        """
+        Returns ban score decayed since the last ban
+        :param float now: current timestamp
+        """
+        return self.ban_score * 0.5 ** ((now - self.last_ban) / BAN_HALF_LIFE)
+
+    def success_rate(self) -> float:
+        """Returns smoothed share of successful requests, unused proxies start at 0.5"""
+        return (self.successes + 1) / (self.requests + 2)
+
+    def score(self, now: float) -> float:
+        """
+        Returns proxy selection weight, higher is better
+        :param float now: current timestamp
+        """
+        latency = self.latency if self.latency is not None else 1.0
+
+        return self.success_rate() / (1 + latency) / (1 + self.current_ban_score(now))
+
+
+class ProxyPool:
+    """
+    Proxies weighted by their latency, success rate and ban history. History is persisted to a JSON file, so it's
+    shared by all scrape jobs.
+    """
+
+    def __init__(self, proxies: list, stats_file: str, ban_cooldown: float = 300):
+        """
+        :param list proxies: proxy URLs
+        :param str stats_file: proxy stats JSON file path
+        :param float ban_cooldown: seconds banned proxy isn't used while other proxies are available
+        """
+        self._proxies = list(dict.fromkeys(proxies))
+        self._stats_file = stats_file
+        self._ban_cooldown = ban_cooldown
+        self._stats = {proxy: ProxyStats() for proxy in self._proxies}
+        self._changes = {}  # Proxy: counters changed since the last save
+        self.load()
+
+    def __len__(self):
+        """Overridden"""
+        return len(self._proxies)
+
+    def load(self):
+        """Loads proxy stats from the stats file"""
+        for proxy, stats in ProxyPool.read_stats(self._stats_file).items():
+            if proxy in self._stats:
+                self._stats[proxy] = stats
+
+    def save(self):
+        """Adds changed proxy counters to the stats file, file is locked so parallel jobs don't overwrite each other"""
+        if not self._changes:
+            return
+        with open(self._stats_file + ".lock", 'w') as lock:
+            flock(lock, LOCK_EX)
+            try:
+                stats = ProxyPool.read_stats(self._stats_file)
+                for proxy, changes in self._changes.items():
+                    saved = stats.setdefault(proxy, ProxyStats())
+                    current = self._stats[proxy]
+                    for name in ("requests", "successes", "failures", "bans"):
+                        setattr(saved, name, getattr(saved, name) + changes.get(name, 0))
+                    for name in ("ban_score", "latency", "last_ban", "last_check"):
+                        if name in changes:
+                            setattr(saved, name, getattr(current, name))
+                    self._stats[proxy] = saved
+                with open(self._stats_file + ".tmp", 'w') as f:
+                    json.dump({proxy: s.to_dict() for proxy, s in stats.items()}, f, indent=2, sort_keys=True)
+                replace(self._stats_file + ".tmp", self._stats_file)
+                self._changes = {}
+            finally:
+                flock(lock, LOCK_UN)
+
+    @staticmethod
+    def read_stats(stats_file: str) -> dict:
+        """
+        Reads proxy stats file
+        :param str stats_file: proxy stats JSON file path
+        :return: dict of proxy: ProxyStats pairs
+        """
+        if not isfile(stats_file):
+            return {}
+        try:
+            with open(stats_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed reading proxy stats file, details: {}".format(e))
+            return {}
+
+        return {proxy: ProxyStats(**stats) for proxy, stats in data.items()}
+
+    def choose(self, exclude=()) -> str:
+        """
+        Picks a proxy at random weighted by proxy scores, proxies banned recently are skipped if possible
+        :param exclude: proxies which shouldn't be picked, e.g. proxy which just failed
+        :return: proxy URL or None if pool is empty
+        """
+        now = time()
+        proxies = [proxy for proxy in self._proxies if proxy not in exclude] or self._proxies
+        available = [proxy for proxy in proxies if now - self._stats[proxy].last_ban >= self._ban_cooldown]
+        if available:
+            proxies = available
+        if not proxies:
+            return None
+
+        return choices(proxies, weights=[self._stats[proxy].score(now) for proxy in proxies])[0]
+
+    def _change(self, proxy: str, **counters) -> ProxyStats:
+        """
+        Records changed proxy stats
+        :param str proxy: proxy URL
+        :param counters: counter name: increment pairs, other names only mark the value as changed
+        :return: proxy stats
+        """
+        stats = self._stats.setdefault(proxy, ProxyStats())
+        changes = self._changes.setdefault(proxy, {})
+        for name, value in counters.items():
+            changes[name] = changes.get(name, 0) + value
+
+        return stats
+
+    def record_success(self, proxy: str, latency: float = None):
+        """
+        Records successful response
+        :param str proxy: proxy URL
+        :param float latency: response latency in seconds
+        """
+        stats = self._change(proxy, requests=1, successes=1, latency=0)
+        stats.requests += 1
+        stats.successes += 1
+        if latency is not None:
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += LATENCY_SMOOTHING * (latency - stats.latency)
+
+    def record_failure(self, proxy: str):
+        """
+        Records connection error or timeout
+        :param str proxy: proxy URL
+        """
+        stats = self._change(proxy, requests=1, failures=1)
+        stats.requests += 1
+        stats.failures += 1
+
+    def record_ban(self, proxy: str):
+        """
+        Records ban response
+        :param str proxy: proxy URL
+        """
+        now = time()
+        stats = self._change(proxy, requests=1, bans=1, ban_score=0, last_ban=0)
+        stats.requests += 1
+        stats.bans += 1
+        stats.ban_score = stats.current_ban_score(now) + 1
+        stats.last_ban = now
+
+    def health_check(self, url: str, timeout: float, max_age: float, workers: int = 16) -> int:
+        """
+        Checks proxies which weren't used or checked recently by downloading given URL through them (blocking)
+        :param str url: check URL
+        :param float timeout: check timeout in seconds
+        :param float max_age: seconds after proxy needs a new check
+        :param int workers: number of parallel checks
+        :return: number of healthy proxies among the checked ones
+        """
+        from requests import get
+
+        def check(proxy):
+            start = perf_counter()
+            try:
+                response = get(url, proxies={"http": proxy, "https": proxy}, timeout=timeout)
+                return proxy, response.status_code, perf_counter() - start
+            except Exception:  # TODO: Add specific exceptions
+                return proxy, None, None
+
+        now = time()
+        proxies = [proxy for proxy in self._proxies if now - self._stats[proxy].last_check >= max_age]
+        if not proxies:
+            return 0
+        healthy = 0
+        with ThreadPoolExecutor(max_workers=min(workers, len(proxies))) as executor:
+            for proxy, status, latency in executor.map(check, proxies):
+                if status is None:
+                    self.record_failure(proxy)
+                elif status in (403, 407, 429):
+                    self.record_ban(proxy)
+                else:
+                    self.record_success(proxy, latency)
+                    healthy += 1
+                self._change(proxy, last_check=0)
+                self._stats[proxy].last_check = now
+        logger.info("Checked {} proxies, {} healthy".format(len(proxies), healthy))
+
+        return healthy
+
+    def stats(self) -> list:
+        """Returns list of (proxy, stats, score) tuples sorted by score"""
+        now = time()
+        rows = [(proxy, self._stats[proxy], self._stats[proxy].score(now)) for proxy in self._proxies]
+
+        return sorted(rows, key=lambda row: row[2], reverse=True)
@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+
+class SeenIndex:
+    """In-memory index of already scraped job post IDs, optionally shared between spiders through a Redis set"""
+
+    def __init__(self, redis=None, key: str = None, expire: int = 86400, push_size: int = 100):
+        """
+        :param redis: Redis client instance or None for a local only index
+        :param str key: Redis set key name
+        :param int expire: Redis set expiration time in seconds (refreshed on every push)
+        :param int push_size: number of new IDs buffered before they are pushed to Redis
+        """
+        self._ids = set()
+        self._redis = redis if key else None
+        self._key = key
+        self._expire = expire
+        self._push_size = push_size
+        self._pending = []
+
+    def __contains__(self, job_post_id):
+        """Overridden"""
+        return job_post_id in self._ids
+
+    def __len__(self):
+        """Overridden"""
+        return len(self._ids)
+
+    def load(self, job_post_ids):
+        """
+        Bulk loads known job post IDs
+        :param job_post_ids: iterable of job post ID strings
+        """
+        self._ids.update(job_post_ids)
+        if self._redis is not None:  # IDs added by other running spiders
+            self._ids.update(job_post_id.decode() for job_post_id in self._redis.sscan_iter(self._key, count=10000))
+
+    def add(self, job_post_id: str):
+        """
+        Adds newly scraped job post ID
+        :param str job_post_id: job post ID
+        """
+        if job_post_id is None or job_post_id in self._ids:
+            return
+        self._ids.add(job_post_id)
+        if self._redis is not None:
+            self._pending.append(job_post_id)
+            if len(self._pending) >= self._push_size:
+                self.flush()
+
+    def flush(self):
+        """Pushes buffered job post IDs to shared Redis set"""
+        if self._redis is None or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.sadd(self._key, *pending)
+        pipe.expire(self._key, self._expire)
+        pipe.execute()
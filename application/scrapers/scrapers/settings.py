@@ -98,6 +98,8 @@ DB_PORT = 3306
 DB_NAME = "job_posts"
 DB_USER = "dummy"
 DB_PASS = "dummy"
+DB_BATCH_SIZE = 50
+DB_FLUSH_INTERVAL = 5  # seconds
 
 # Redis
 REDIS_HOST = HOST
@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from hashlib import blake2b
+from itertools import combinations
+from re import UNICODE, compile
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3  # words per shingle
+KEY_BLOCKS = 2  # fingerprint blocks per index table key, more blocks make wider keys and more tables
+MAX_CANDIDATES = 100  # fingerprints compared per index table lookup
+WORD_REGEX = compile(r"\w+", UNICODE)
+
+
+def simhash(text: str) -> int:
+    """
+    Calculates SimHash fingerprint of a text from its word shingles, similar texts get fingerprints which differ in
+    few bits
+    :param str text: text
+    :return: 64 bit fingerprint
+    """
+    words = WORD_REGEX.findall(text.lower())
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = [int.from_bytes(blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big") for shingle in shingles]
+    threshold = len(hashes) / 2
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        mask = 1 << bit
+        if sum(1 for h in hashes if h & mask) > threshold:
+            fingerprint |= mask
+
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Returns number of different bits of two fingerprints"""
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    """
+    Index of job post fingerprints in Redis sets. Fingerprint is split into max_distance + key_blocks blocks, so
+    fingerprints within max_distance bits share key_blocks whole blocks at least (pigeonhole). Every combination of
+    key_blocks blocks is one index table and only posts with the same blocks in one of the tables are compared, wide
+    table keys keep the compared sets small as the index grows.
+    """
+
+    def __init__(self, redis, key: str, max_distance: int = 5, key_blocks: int = KEY_BLOCKS,
+                 max_candidates: int = MAX_CANDIDATES):
+        """
+        :param redis: Redis client instance
+        :param str key: Redis key prefix
+        :param int max_distance: maximum number of different bits of near-duplicate fingerprints
+        :param int key_blocks: fingerprint blocks per table key
+        :param int max_candidates: maximum number of fingerprints compared per table
+        """
+        self._redis = redis
+        self._max_distance = max_distance
+        self._max_candidates = max_candidates
+        blocks = max_distance + key_blocks
+        self._key = "{}:{}b{}".format(key, blocks, key_blocks)  # Tables of other layouts are kept apart
+        block_masks, offset = [], 0
+        for block in range(blocks):
+            bits = FINGERPRINT_BITS // blocks + (1 if block < FINGERPRINT_BITS % blocks else 0)
+            block_masks.append(((1 << bits) - 1) << offset)
+            offset += bits
+        self._table_masks = [sum(masks) for masks in combinations(block_masks, key_blocks)]
+
+    @property
+    def loaded(self) -> bool:
+        """Index was already loaded from job posts DB"""
+        return bool(self._redis.exists(self._key + ":loaded"))
+
+    def _table_keys(self, fingerprint: int) -> list:
+        """Returns Redis set keys of fingerprint in all index tables"""
+        return [
+            "{}:{}:{:x}".format(self._key, table, fingerprint & mask) for table, mask in enumerate(self._table_masks)
+        ]
+
+    def find(self, fingerprint: int, job_post_id: str = None) -> str:
+        """
+        Finds indexed near-duplicate of a job post
+        :param int fingerprint: job post fingerprint
+        :param str job_post_id: job post ID, the post itself isn't its duplicate
+        :return: job post ID of the closest near-duplicate or None
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        for key in self._table_keys(fingerprint):
+            pipe.srandmember(key, self._max_candidates)
+        best, best_distance = None, self._max_distance + 1
+        for members in pipe.execute():
+            for member in members:
+                indexed_fingerprint, indexed_id = member.decode().split(':', 1)
+                if indexed_id == job_post_id:
+                    continue
+                distance = hamming_distance(fingerprint, int(indexed_fingerprint, 16))
+                if distance < best_distance:
+                    best, best_distance = indexed_id, distance
+
+        return best
+
+    def add(self, fingerprint: int, job_post_id: str, pipe=None):
+        """
+        Adds job post fingerprint to the index
+        :param int fingerprint: job post fingerprint
+        :param str job_post_id: job post ID
+        :param pipe: Redis pipeline used for bulk loading, changes are written immediately if not set
+        """
+        member = "{:016x}:{}".format(fingerprint, job_post_id)
+        redis = pipe if pipe is not None else self._redis.pipeline(transaction=False)
+        for key in self._table_keys(fingerprint):
+            redis.sadd(key, member)
+        if pipe is None:
+            redis.execute()
+
+    def load(self, fingerprints, batch_size: int = 1000) -> int:
+        """
+        Bulk loads fingerprints of already stored job posts and marks the index as loaded
+        :param fingerprints: iterable of (job post ID, fingerprint) pairs
+        :param int batch_size: number of job posts per Redis pipeline
+        :return: number of loaded fingerprints
+        """
+        count = 0
+        pipe = self._redis.pipeline(transaction=False)
+        for job_post_id, fingerprint in fingerprints:
+            self.add(fingerprint, job_post_id, pipe)
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.set(self._key + ":loaded", 1)
+        pipe.execute()
+
+        return count
@@ -1,29 +1,32 @@
 # -*- coding: utf-8 -*-
 
+from math import ceil
 from re import compile, sub, UNICODE
 import sys
 from time import strftime
 from urllib.parse import parse_qs, quote, urljoin, urlparse
 
-from dateparser import parse
 from scrapy import Request
 
 try:  # main
     from config import COUNTRIES, TIMESTAMP_FORMAT
     from application.scrapers.scrapers.basespider import BaseSpider
     from application.scrapers.scrapers.common import ScrapeType
-    from application.scrapers.scrapers.items import JobPostItem
-    from application.scrapers.scrapers.models import JobPosts
+    from application.scrapers.scrapers.dates import resolve_relative_date
+    from application.scrapers.scrapers.extraction import Field
+    from application.scrapers.scrapers.items import JobPostRecord
 except ImportError:  # scrapy crawl
     sys.path.append("..")  # allow imports from application directory
     from scrapers.basespider import BaseSpider
     from scrapers.common import ScrapeType
-    from scrapers.items import JobPostItem
-    from scrapers.models import JobPosts
+    from scrapers.dates import resolve_relative_date
+    from scrapers.extraction import Field
+    from scrapers.items import JobPostRecord
     from scrapers.settings import COUNTRIES, TIMESTAMP_FORMAT
 
 
 ALPHANUMSPACE_REGEX = compile(r"\W+ ", UNICODE)
+NUMBER_REGEX = compile(r"\d[\d,.\s]*")
 
 
 class IndeedSpider(BaseSpider):
@@ -34,13 +37,50 @@ class IndeedSpider(BaseSpider):
     base_url = "https://www.indeed.com/"
     pagination_xpath = "//div[@class='pagination']/a/@href"
     item_xpath = "//h2[@class='jobtitle']/a/@href"  # 10 items per page
+    search_count_xpath = "//div[@id='searchCount']//text()"  # Page 1 of 1,234 jobs
+    page_size = 10
+    max_pages = 100  # Indeed doesn't list more than ~1000 results per search
+    extraction_plans = {
+        "listing": {
+            "job_post_urls": Field(item_xpath, many=True),
+            "next_pages_urls": Field(pagination_xpath, many=True),
+            "search_count": Field(search_count_xpath, join=''),
+        },
+        "job_post": {
+            "title": Field("//title/text()"),
+            "description": Field("//div[contains(@class, 'jobsearch-JobComponent-description')]//text()", join=''),
+            "posted": Field("//div[@class='jobsearch-JobMetadataFooter']/text()"),
+        },
+    }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._scraped_job_post_count = 0
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """Overridden, allows requests to all selected country domains"""
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        allowed_domains = list(cls.allowed_domains)
+        country_urls = crawler.settings.getdict("COUNTRY_URLS")
+        countries = crawler.settings.get("SELECTED_COUNTRIES", [])
+        if crawler.settings.getint("SCRAPE_TYPE", ScrapeType.ALL) == ScrapeType.PENDING:
+            countries = list(COUNTRIES)  # Pending job posts were discovered by jobs with other target countries
+        for country in countries:
+            if country in COUNTRIES:
+                allowed_domains.append(urlparse(country_urls.get(country, COUNTRIES[country][1])).hostname)
+        spider.allowed_domains = allowed_domains
+
+        return spider
+
     def start_requests(self):
         """Overridden"""
+        if self._scrape_type in (ScrapeType.UNSCRAPED, ScrapeType.PENDING) and self.pending_job_posts is None:
+            self.logger.warning("In order to discover or scrape pending job posts please enable saving to DB")
+            return
+        if self._scrape_type == ScrapeType.PENDING:
+            yield from self._pending_requests()
+            return
         countries = self.settings.get("SELECTED_COUNTRIES", [])
         keywords = self.settings.get("KEYWORDS", [])
         if not keywords or not countries:
@@ -48,80 +88,153 @@ class IndeedSpider(BaseSpider):
             return
         self.logger.info("Target keywords: '{}'".format(', '.join(keywords)))
         self.logger.info("Target countries: '{}'".format(', '.join(countries)))
+        country_urls = self.settings.getdict("COUNTRY_URLS")  # Country site URL overrides, e.g. a mock job board
+        start_urls = []  # Class attribute is shared by all crawls run from the same crawler worker process
         for country in countries:
             if country in COUNTRIES:
                 query = '+'.join([quote(kw) for kw in keywords])
-                start_url = urljoin(COUNTRIES[country][1], "jobs?q={query}&l=".format(query=query))
-                self.__class__.start_urls.append(start_url)
-        for url in self.__class__.start_urls:
-            yield Request(url, self.parse)
+                country_url = country_urls.get(country, COUNTRIES[country][1])
+                start_url = urljoin(country_url, "jobs?q={query}&l=".format(query=query))
+                start_urls.append((country, start_url))
+        for country, url in start_urls:
+            # Each country domain is downloaded through its own slot with its own concurrency and delay budget
+            yield Request(url, self.parse, meta={
+                "download_slot": country,
+                "cache_class": "listing",
+                "search_url": url,
+                "start": 0,
+            })
 
     def parse(self, response):
         """Overridden"""
         # if self._scraped_job_post_count > 4:
         #     return
-        job_post_urls = response.xpath(self.__class__.item_xpath).extract()
+        download_slot = response.meta.get("download_slot")
+        page = self.extract(response, "listing")
+        job_post_urls = page["job_post_urls"]
         self.logger.info("Scraping {} job posts ...".format(len(job_post_urls)))
+        discovered = []  # Unscraped job posts scrape only queues detail pages for pending job posts scrapes
         for i, job_post_url in enumerate(job_post_urls):
-            job_post_url = urljoin(self.__class__.base_url, job_post_url)
+            job_post_url = response.urljoin(job_post_url)
             job_post_id = self._get_job_post_id(job_post_url)
             if job_post_id is None:
                 continue
-            if self._db is not None:
-                job_post = self._db.query(JobPosts).filter_by(job_post_id=job_post_id).first()
-                if job_post is not None:
-                    self.logger.info("Skipping already scraped job post '{}'".format(job_post_url))
-                    continue
-            item = JobPostItem()
-            yield Request(job_post_url, self._parse_job_post, meta={"item": item})
+            # Changed job posts scrape revisits known job posts, pipeline writes only the changed ones
+            if job_post_id in self._seen_job_posts and self._scrape_type != ScrapeType.CHANGED:
+                self.logger.info("Skipping already scraped job post '{}'".format(job_post_url))
+                continue
+            if self._scrape_type == ScrapeType.UNSCRAPED:
+                discovered.append((job_post_id, job_post_url, download_slot))
+                continue
+            yield Request(job_post_url, self._parse_job_post, meta={
+                "job_post_id": job_post_id,
+                "download_slot": download_slot,
+                "cache_class": "detail",
+            })
             # if i > 0:
             #     break
+        if discovered:
+            self.crawler.stats.inc_value("pending/pushed", self.pending_job_posts.push(discovered))
         # Pagination
-        if self.__class__.pagination_xpath is not None:
-            # Go to the next pagination page
-            if self._scrape_type == ScrapeType.ALL:
-                next_pages_url = response.xpath(self.__class__.pagination_xpath).extract()
-                if next_pages_url is not None:
-                    for url in next_pages_url:
-                        url = urljoin(self.__class__.base_url, url)  # Fix relative URL paths
-                        # Skip already visited pagination URLs
-                        if url in self._pagination_urls:
-                            continue
-                        self.logger.info("Scraping next pagination page \"{}\"".format(url))
-                        # Scrape pagination page
-                        yield Request(url)
-                        self._pagination_urls.add(url)
-                        break
+        if self._scrape_type not in (ScrapeType.ALL, ScrapeType.CHANGED, ScrapeType.UNSCRAPED):
+            return
+        if response.meta.get("start") == 0:
+            # Fan out all result pages of the search at once using the known page size offsets
+            pages = self._get_page_count(page["search_count"], response.url)
+            if pages is not None:
+                search_url = response.meta["search_url"]
+                self.logger.info("Scraping {} pagination pages of \"{}\"".format(pages - 1, search_url))
+                for page_number in range(1, pages):
+                    start = page_number * self.__class__.page_size
+                    url = "{}&start={}".format(search_url, start)
+                    self.pagination_urls.add(url)
+                    yield Request(url, self.parse, meta={
+                        "download_slot": download_slot,
+                        "cache_class": "listing",
+                        "start": start,
+                    })
+                return
+        elif response.meta.get("start") is not None:
+            return
+        # Search result count is unknown, go to the next pagination page
+        for url in page["next_pages_urls"]:
+            url = response.urljoin(url)  # Fix relative URL paths
+            # Skip already visited pagination URLs
+            if url in self.pagination_urls:
+                continue
+            self.logger.info("Scraping next pagination page \"{}\"".format(url))
+            # Scrape pagination page
+            yield Request(url, meta={
+                "download_slot": download_slot,
+                "cache_class": "listing",
+                "start": None,
+            })
+            self.pagination_urls.add(url)
+            break
+
+    def _pending_requests(self):
+        """Requests detail pages of job posts claimed from the pending job posts queue"""
+        owner = "{}:{}".format(self._task_id, self.settings.get("CRAWLER_ID", 0))
+        job_posts = self.pending_job_posts.claim(owner, self.settings.getint("PENDING_BATCH_SIZE", 500))
+        self.logger.info("Claimed {} pending job posts".format(len(job_posts)))
+        # Job posts scraped meanwhile by other scrape types
+        scraped = [job_post_id for job_post_id, _, _ in job_posts if job_post_id in self._seen_job_posts]
+        if scraped:
+            self.pending_job_posts.remove(scraped)
+            self._db.commit()
+        for job_post_id, url, country in job_posts:
+            if job_post_id in self._seen_job_posts:
+                continue
+            yield Request(url, self._parse_job_post, meta={
+                "job_post_id": job_post_id,
+                "download_slot": country,
+                "cache_class": "detail",
+            })
+
+    def _get_page_count(self, search_count: str, url: str):
+        """
+        Calculates number of result pages from the search result count
+        :param str search_count: search result count text
+        :param str url: search result page URL
+        :return: number of pages or None if the search result count is missing
+        """
+        numbers = NUMBER_REGEX.findall(search_count)
+        if not numbers:
+            self.logger.warning("Failed extracting search result count from '{}'!".format(url))
+            return None
+        job_count = max(int(sub(r"\D", '', number)) for number in numbers)  # Page number comes first or last
+
+        return max(1, min(ceil(job_count / self.__class__.page_size), self.__class__.max_pages))
 
     def _parse_job_post(self, response):
-        item = response.meta["item"]
         self.logger.info("Scraping job post '{}' ...".format(response.url))
-        title = response.xpath("//title/text()").extract_first()
-        title, location = title.rsplit('-', 1)[0].rsplit('-', 1)
-        item["Title"] = title.strip()
-        item["URL"] = response.url
-        description = response.xpath(
-            "//div[contains(@class, 'jobsearch-JobComponent-description')]//text()"
-        ).extract()
-        item["Description"] = ''.join(description).strip()
-        item["Location"] = location.strip()
-        item["Date_Added"] = strftime(TIMESTAMP_FORMAT)
+        job_post = self.extract(response, "job_post")
+        title, location = job_post["title"].rsplit('-', 1)[0].rsplit('-', 1)
         # Convert relative to absolute date
         date_job_posted = None
-        relative_time_job_posted = response.xpath("//div[@class='jobsearch-JobMetadataFooter']/text()").extract_first()
+        relative_time_job_posted = job_post["posted"]
         if isinstance(relative_time_job_posted, str):
             relative_time_job_posted = sub(ALPHANUMSPACE_REGEX, '', relative_time_job_posted)
-            date_job_posted = parse(relative_time_job_posted)
+            date_job_posted = resolve_relative_date(relative_time_job_posted)
             if date_job_posted is not None:
                 date_job_posted = date_job_posted.strftime(TIMESTAMP_FORMAT)
         if date_job_posted is None:
-            self.logger.warning("Failed extracting posted date for job '{}'!".format(item["URL"]))
+            self.logger.warning("Failed extracting posted date for job '{}'!".format(response.url))
             return
-        item["Date_Job_Posted"] = date_job_posted
         self.logger.info("Successfully scraped '{}'".format(response.url))
         self._scraped_job_post_count += 1
 
-        yield item
+        yield JobPostRecord(
+            Job_Post_ID=response.meta.get("job_post_id") or self._get_job_post_id(response.url),
+            URL=response.url,
+            Title=title.strip(),
+            Location=location.strip(),
+            Description=job_post["description"].strip(),
+            Date_Added=strftime(TIMESTAMP_FORMAT),
+            Date_Job_Posted=date_job_posted,
+            Fingerprint=None,
+            Duplicate_Of=None,
+        )
 
     def _get_job_post_id(self, url: str) -> str:
         try:
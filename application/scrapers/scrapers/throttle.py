@@ -0,0 +1,228 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import logging
+from time import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)  # Target site asks to slow down
+BAN_STATUSES = (403, 407)  # Target site or proxy blocked the request
+LATENCY_SMOOTHING = 0.2  # Weight of the newest latency sample in the moving average
+LATENCY_TOLERANCE = 2.0  # Latency this many times the baseline (lowest seen) latency is treated as congestion
+BASELINE_DRIFT = 0.05  # Share of the gap between current and baseline latency baseline moves per window
+BACKOFF_FACTOR = 2.0  # Delay multiplier and concurrency divisor after a throttle or ban response
+SPEEDUP_FACTOR = 0.75  # Delay multiplier after a window of clean responses
+RATES_STATS_KEY = "throttle/rates"  # Stats key with reached rates per download slot, stored to the jobs table
+
+
+class SlotThrottle:
+    """Throttle state and reached rates of one download slot"""
+    __slots__ = ("delay", "concurrency", "latency", "min_latency", "window", "last_backoff", "started", "updated",
+                 "delay_time", "concurrency_time", "responses", "throttled", "bans")
+
+    def __init__(self, delay: float, concurrency: int, now: float):
+        """
+        :param float delay: starting download delay in seconds
+        :param int concurrency: starting number of concurrent requests
+        :param float now: current timestamp
+        """
+        self.delay = delay
+        self.concurrency = concurrency
+        self.latency = None  # Moving average of response latency in seconds
+        self.min_latency = None
+        self.window = 0  # Clean responses since the last adjustment
+        self.last_backoff = 0.0
+        self.started = now
+        self.updated = now
+        self.delay_time = 0.0  # Delay integrated over time, for time weighted average
+        self.concurrency_time = 0.0
+        self.responses = 0
+        self.throttled = 0
+        self.bans = 0
+
+    def advance(self, now: float):
+        """
+        Accumulates current delay and concurrency up to given time
+        :param float now: current timestamp
+        """
+        elapsed = now - self.updated
+        self.delay_time += self.delay * elapsed
+        self.concurrency_time += self.concurrency * elapsed
+        self.updated = now
+
+    def rates(self) -> dict:
+        """Returns rates reached so far"""
+        elapsed = self.updated - self.started
+        return {
+            "delay": round(self.delay, 3),
+            "concurrency": self.concurrency,
+            "avg_delay": round(self.delay_time / elapsed, 3) if elapsed > 0 else round(self.delay, 3),
+            "avg_concurrency": round(self.concurrency_time / elapsed, 2) if elapsed > 0 else self.concurrency,
+            "requests_per_second": round(self.responses / elapsed, 2) if elapsed > 0 else 0,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "responses": self.responses,
+            "throttled": self.throttled,
+            "bans": self.bans,
+        }
+
+
+class AdaptiveThrottle:
+    """
+    Tunes delay and concurrency of every download slot (one per target country/domain) from response latency,
+    429/503 responses and bans, within configured floors and ceilings. Throttle and ban responses halve the rate at
+    once, windows of clean responses first shorten the delay down to its floor and then add one concurrent request.
+    """
+
+    def __init__(self, crawler, min_delay: float, max_delay: float, min_concurrency: int, max_concurrency: int):
+        """
+        :param crawler: scrapy crawler instance
+        :param float min_delay: delay floor in seconds
+        :param float max_delay: delay ceiling in seconds
+        :param int min_concurrency: concurrent requests floor per slot
+        :param int max_concurrency: concurrent requests ceiling per slot
+        """
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._min_delay = min_delay
+        self._max_delay = max(min_delay, max_delay)
+        self._min_concurrency = max(1, min_concurrency)
+        self._max_concurrency = max(self._min_concurrency, max_concurrency)
+        self._slots = {}  # Download slot key: SlotThrottle
+        self._rates = {}  # Download slot key: reached rates
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0),
+            settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60),
+            settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY", 1),
+            settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 8),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        # Raw responses, before downloader middlewares retry bans through other proxies
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+
+        return extension
+
+    def spider_opened(self, spider):
+        self._stats.set_value(RATES_STATS_KEY, self._rates)
+
+    def spider_closed(self, spider):
+        now = time()
+        for key, slot_throttle in self._slots.items():
+            slot_throttle.advance(now)
+            self._rates[key] = slot_throttle.rates()
+            spider.logger.info("Download slot '{}' reached rates {}".format(key, self._rates[key]))
+
+    def response_downloaded(self, response, request, spider):
+        key, slot = self._slot(request, spider)
+        if slot is None:
+            return
+        now = time()
+        slot_throttle = self._slots.get(key)
+        if slot_throttle is None:
+            slot_throttle = SlotThrottle(self._clamp_delay(slot.delay), self._clamp_concurrency(slot.concurrency), now)
+            self._slots[key] = slot_throttle
+        slot_throttle.advance(now)
+        slot_throttle.responses += 1
+        latency = request.meta.get("download_latency")
+        if response.status in THROTTLE_STATUSES or response.status in BAN_STATUSES:
+            if response.status in THROTTLE_STATUSES:
+                slot_throttle.throttled += 1
+            else:
+                slot_throttle.bans += 1
+            self._backoff(key, slot_throttle, now)
+        elif response.status < 400 and latency is not None:
+            self._observe(key, slot_throttle, latency, now)
+        # Idle slots are recreated by the downloader with default delay and concurrency, so they're set every time
+        slot.delay = slot_throttle.delay
+        slot.concurrency = slot_throttle.concurrency
+        self._rates[key] = slot_throttle.rates()
+
+    def _slot(self, request, spider) -> tuple:
+        """
+        Returns download slot of a request
+        :param request: scrapy request
+        :param spider: spider instance
+        :return: slot key and downloader slot, slot is None if it doesn't exist anymore
+        """
+        downloader = self._crawler.engine.downloader
+        key = request.meta.get("download_slot")
+        if key is None:
+            get_slot_key = getattr(downloader, "get_slot_key", None) or getattr(downloader, "_get_slot_key")
+            key = get_slot_key(request, spider)
+
+        return key, downloader.slots.get(key)
+
+    def _backoff(self, key: str, slot_throttle: SlotThrottle, now: float):
+        """
+        Halves slot rate, responses of requests sent before the previous backoff don't back off again
+        :param str key: slot key
+        :param SlotThrottle slot_throttle: slot throttle state
+        :param float now: current timestamp
+        """
+        slot_throttle.window = 0
+        if now - slot_throttle.last_backoff < max(slot_throttle.delay, slot_throttle.latency or 1.0):
+            return
+        slot_throttle.last_backoff = now
+        slot_throttle.concurrency = self._clamp_concurrency(int(slot_throttle.concurrency / BACKOFF_FACTOR))
+        slot_throttle.delay = self._clamp_delay(max(slot_throttle.delay * BACKOFF_FACTOR, slot_throttle.latency or 1.0))
+        self._stats.inc_value("throttle/backoffs")
+        logger.debug("Slot '{}' backed off to delay {:.2f} s, concurrency {}".format(
+            key, slot_throttle.delay, slot_throttle.concurrency))
+
+    def _observe(self, key: str, slot_throttle: SlotThrottle, latency: float, now: float):
+        """
+        Adds latency sample and speeds up or slows down the slot after a window of clean responses
+        :param str key: slot key
+        :param SlotThrottle slot_throttle: slot throttle state
+        :param float latency: response latency in seconds
+        :param float now: current timestamp
+        """
+        if slot_throttle.latency is None:
+            slot_throttle.latency = latency
+        else:
+            slot_throttle.latency += LATENCY_SMOOTHING * (latency - slot_throttle.latency)
+        if slot_throttle.min_latency is None or slot_throttle.latency < slot_throttle.min_latency:
+            slot_throttle.min_latency = slot_throttle.latency
+        slot_throttle.window += 1
+        # One window is a round of responses from all concurrent requests
+        if slot_throttle.window < max(2, slot_throttle.concurrency):
+            return
+        slot_throttle.window = 0
+        # Baseline follows lasting latency changes, e.g. slower proxies, so the slot doesn't slow down forever
+        slot_throttle.min_latency += BASELINE_DRIFT * (slot_throttle.latency - slot_throttle.min_latency)
+        if slot_throttle.latency > slot_throttle.min_latency * LATENCY_TOLERANCE:
+            # Site slows down, step back before it starts throttling
+            if slot_throttle.concurrency > self._min_concurrency:
+                slot_throttle.concurrency -= 1
+            else:
+                slot_throttle.delay = self._clamp_delay(
+                    max(slot_throttle.delay / SPEEDUP_FACTOR, slot_throttle.latency / slot_throttle.concurrency))
+        elif slot_throttle.delay > self._min_delay:
+            # Scrapy sends one request per delay, so concurrency grows only after the delay reaches its floor
+            delay = slot_throttle.delay * SPEEDUP_FACTOR
+            slot_throttle.delay = self._clamp_delay(delay if delay >= 0.05 else 0)
+        elif slot_throttle.concurrency < self._max_concurrency:
+            slot_throttle.concurrency += 1
+        else:
+            return
+        logger.debug("Slot '{}' adjusted to delay {:.2f} s, concurrency {}, latency {:.2f} s".format(
+            key, slot_throttle.delay, slot_throttle.concurrency, slot_throttle.latency))
+
+    def _clamp_delay(self, delay: float) -> float:
+        """Returns delay within floor and ceiling"""
+        return min(self._max_delay, max(self._min_delay, delay))
+
+    def _clamp_concurrency(self, concurrency: int) -> int:
+        """Returns concurrency within floor and ceiling"""
+        return min(self._max_concurrency, max(self._min_concurrency, concurrency))
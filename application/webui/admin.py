@@ -3,10 +3,12 @@
 
 import atexit
 from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timedelta
+from json import dumps
 from os import remove
-from os.path import isfile, join
+from os.path import getsize, isfile, join
 from pprint import pprint
+from time import time
 
 from apscheduler.jobstores.base import ConflictingIdError, JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -17,15 +19,19 @@ from requests import get
 from requests.auth import HTTPBasicAuth
 from sqlalchemy_utils import create_database, database_exists
 
-from application.misc import feed_file_path, log_file_path, text_file_to_lines
+from application.feeds import FeedIndex
+from application.misc import feed_file_path, log_file_path, read_text_chunk, text_file_to_lines
 from application.scrapers.scrapers.common import JobStatus, OK, ScrapeType, SpiderStatus
-from application.scrapers.scrapers.models import create_tables, table_exists
+from application.scrapers.scrapers.events import JobTable, publish_job_event, read_job_stats
+from application.scrapers.scrapers.models import create_tables, table_exists, upgrade_tables
+from application.scrapers.scrapers.proxies import ProxyPool
 from application.webui.base import app, db, scheduler
-from application.webui.misc import Settings, list_files, remove_files, text_to_unique_lines
-from application.webui.models import Jobs, PeriodicJobs, SettingsStatus
-from config import (COUNTRIES, FEEDS_DIR, LOG_DIR, PROXIES_FILE, SETTINGS, SETTINGS_FILE, SPIDERS, USER_AGENTS_FILE,
-                    WEBUI_LOG_FILE)
-from tasks import run_job, run_periodic_job
+from application.webui.misc import Settings, clear_dir, job_crashed, list_files, remove_files, text_to_unique_lines
+from application.webui.models import Jobs, PeriodicJobs, SettingsStatus, archive_jobs
+from config import (COUNTRIES, CRAWL_STALE_AFTER, FEEDS_DIR, HTTP_CACHE_DIR, JOBS_ARCHIVE_INTERVAL, JOBS_RETENTION_DAYS,
+                    LOG_CHUNK_SIZE, LOG_DIR, PROXIES_FILE, PROXY_STATS_FILE, SETTINGS, SETTINGS_FILE,
+                    SPIDERS, USER_AGENTS_FILE, WEBUI_DB_URI, WEBUI_LOG_FILE)
+from tasks import remove_crawl_state, resume_job, run_job, run_periodic_job
 
 # Settings
 settings = Settings(**SETTINGS)
@@ -37,9 +43,40 @@ scheduler.start()
 atexit.register(lambda: scheduler.shutdown())
 
 
+def _publish_job_event(table: str, job_id: int):
+    """Notifies connected WebUI clients about a job state change"""
+    publish_job_event(Redis(settings.key("redis_host"), settings.key("redis_port")), table, job_id)
+
+
+def _archive_jobs(retention_days: int) -> int:
+    """
+    Moves completed jobs older than retention time to the archive table
+    :param int retention_days: days completed jobs are kept in the jobs table
+    :return: number of archived jobs
+    """
+    job_ids = archive_jobs(WEBUI_DB_URI, datetime.now() - timedelta(days=retention_days))
+    for job_id in job_ids:
+        remove_crawl_state(job_id)
+    if job_ids:
+        app.logger.info("Archived {} completed job(s)".format(len(job_ids)))
+
+    return len(job_ids)
+
+
 @app.before_first_request
 def _initialize():
     """"""
+    # Jobs retention
+    if JOBS_RETENTION_DAYS is not None:
+        scheduler.add_job(
+            func=_archive_jobs,
+            trigger=IntervalTrigger(seconds=JOBS_ARCHIVE_INTERVAL),
+            id="_archive_jobs",
+            args=(JOBS_RETENTION_DAYS,),
+            name="Archive completed jobs",
+            replace_existing=True,
+            next_run_time=datetime.now(),
+        )
     # Periodic Job init/update
     periodic_jobs = db.session.query(PeriodicJobs).all()
     current = dict()
@@ -89,6 +126,13 @@ def _initialize():
                     "timeout": settings.key("timeout"),
                     "retries": settings.key("retries"),
                     "concurrent_requests": settings.key("concurrent_requests"),
+                    "http_cache": settings.key("http_cache"),
+                    "adaptive_throttle": settings.key("adaptive_throttle"),
+                    "throttle_min_delay": settings.key("throttle_min_delay"),
+                    "throttle_max_delay": settings.key("throttle_max_delay"),
+                    "throttle_min_concurrency": settings.key("throttle_min_concurrency"),
+                    "throttle_max_concurrency": settings.key("throttle_max_concurrency"),
+                    "distributed_crawlers": settings.key("distributed_crawlers"),
                     #
                     "scrape_type": job.scrape_type,
                     "save_to_feed": bool(job.file),
@@ -228,6 +272,7 @@ def _jobs_completed_delete():
                 db.session.delete(job)
                 db.session.commit()
                 deleted_jobs.append(job_id)
+                remove_crawl_state(job_id)
                 log_files.append(log_file_path(job.spider_name, job.date_started))
                 feed_files.append(feed_file_path(job.spider_name, job.date_started))
             except Exception as e:
@@ -247,6 +292,8 @@ def _jobs_completed_delete():
             if not db.session.commit():
                 log_files = []
                 feed_files = []
+            for job_id in deleted_jobs:
+                remove_crawl_state(job_id)
         except Exception as e:
             app.logger.error("Failed truncating WebUI jobs table!", exc_info=True)
             flash("Failed truncating WebUI jobs table! Details: {}".format(e), "error")
@@ -261,6 +308,8 @@ def _jobs_completed_delete():
             app.logger.warning("Can't locate the log file {}!".format(log_file))
     # Delete feed files
     for feed_file in feed_files:
+        if isfile(feed_file + ".idx"):  # Feed index
+            remove(feed_file + ".idx")
         if isfile(feed_file):
             try:
                 remove(feed_file)
@@ -331,6 +380,13 @@ def _job_add():
                 "timeout": settings.key("timeout"),
                 "retries": settings.key("retries"),
                 "concurrent_requests": settings.key("concurrent_requests"),
+                "http_cache": settings.key("http_cache"),
+                "adaptive_throttle": settings.key("adaptive_throttle"),
+                "throttle_min_delay": settings.key("throttle_min_delay"),
+                "throttle_max_delay": settings.key("throttle_max_delay"),
+                "throttle_min_concurrency": settings.key("throttle_min_concurrency"),
+                "throttle_max_concurrency": settings.key("throttle_max_concurrency"),
+                "distributed_crawlers": settings.key("distributed_crawlers"),
                 # "countries": settings.key("countries"),
                 # Job specific
                 "spider": None,
@@ -373,6 +429,7 @@ def _job_add():
                 flash(msg, "success")
                 # Run jobs
                 for job, spider_params in jobs:
+                    _publish_job_event(JobTable.JOBS, job.id)
                     task_id = run_job.delay(job.id, spider_params)
                 #             flash("Job id {} already exists".format(j.id), "danger")
                 #         except Exception as e:
@@ -449,6 +506,13 @@ def _periodic_jobs_add():
                 "timeout": settings.key("timeout"),
                 "retries": settings.key("retries"),
                 "concurrent_requests": settings.key("concurrent_requests"),
+                "http_cache": settings.key("http_cache"),
+                "adaptive_throttle": settings.key("adaptive_throttle"),
+                "throttle_min_delay": settings.key("throttle_min_delay"),
+                "throttle_max_delay": settings.key("throttle_max_delay"),
+                "throttle_min_concurrency": settings.key("throttle_min_concurrency"),
+                "throttle_max_concurrency": settings.key("throttle_max_concurrency"),
+                "distributed_crawlers": settings.key("distributed_crawlers"),
                 # Job specific
                 "spider": None,
                 "spider_name": None,
@@ -492,6 +556,7 @@ def _periodic_jobs_add():
                             name=job.spider_name,
                             replace_existing=True,
                         )
+                        _publish_job_event(JobTable.PERIODIC_JOBS, job.id)
                         flash("Successfully added periodic job {}".format(job.id), "success")
                     except ConflictingIdError:
                         job.enabled = OK.NO
@@ -536,6 +601,13 @@ def _periodic_job_start(job_id):
                 "timeout": settings.key("timeout"),
                 "retries": settings.key("retries"),
                 "concurrent_requests": settings.key("concurrent_requests"),
+                "http_cache": settings.key("http_cache"),
+                "adaptive_throttle": settings.key("adaptive_throttle"),
+                "throttle_min_delay": settings.key("throttle_min_delay"),
+                "throttle_max_delay": settings.key("throttle_max_delay"),
+                "throttle_min_concurrency": settings.key("throttle_min_concurrency"),
+                "throttle_max_concurrency": settings.key("throttle_max_concurrency"),
+                "distributed_crawlers": settings.key("distributed_crawlers"),
                 #
                 "scrape_type": job.scrape_type,
                 "save_to_feed": bool(job.file),
@@ -555,6 +627,7 @@ def _periodic_job_start(job_id):
             )
             job.enabled = OK.YES
             db.session.commit()
+            _publish_job_event(JobTable.PERIODIC_JOBS, job.id)
             msg = "Successfully added periodic job ID {}".format(job.id)
             app.logger.info(msg)
             flash(msg, "success")
@@ -587,10 +660,41 @@ def _job_stop(job_id):
         app.logger.info("Stopping '{}' spider, job id {} ... Redis response '{}'".format(job.spider_name, job.task_id, r))
         job.spider_status = SpiderStatus.CANCELED.value
         db.session.commit()
+        _publish_job_event(JobTable.JOBS, job.id)
     
     return redirect("/jobs/active/{}".format(job_id))
 
 
+@app.route("/jobs/<int:job_id>/resume")
+def _job_resume(job_id):
+    """Resumes a canceled, interrupted or crashed job from its persistent crawl state"""
+    job = db.session.query(Jobs).filter(Jobs.id == job_id).first()
+    if job is None:
+        flash("Can't find the job id {} in db".format(job_id), "danger")
+        return redirect(request.referrer or "/jobs/active")
+    if not job.params:
+        flash("Job id {} was started by an older version and can't be resumed".format(job_id), "warning")
+        return redirect(request.referrer or "/jobs/active")
+    if job.spider_status in (SpiderStatus.PENDING, SpiderStatus.FINISHED):
+        flash("Only canceled, interrupted or crashed jobs can be resumed", "warning")
+        return redirect(request.referrer or "/jobs/active")
+    if job.spider_status in (SpiderStatus.RUNNING, SpiderStatus.CANCELED):  # Canceled crawl may be still closing
+        try:
+            redis = Redis(settings.key("redis_host"), settings.key("redis_port"))
+            stats = read_job_stats(redis, [job_id])[0]
+        except ConnectionError as e:
+            flash("Can't check if the job id {} is still running, details: {}".format(job_id, e), "danger")
+            return redirect(request.referrer or "/jobs/active")
+        if "finish_reason" not in stats and not job_crashed(job.date_started, stats, CRAWL_STALE_AFTER):
+            flash("Job id {} is still running".format(job_id), "warning")
+            return redirect(request.referrer or "/jobs/active")
+    resume_job.delay(job.id)
+    flash("Resuming the job id {}".format(job_id), "info")
+    app.logger.info("Resuming '{}' spider, job id {}".format(job.spider_name, job_id))
+
+    return redirect("/jobs/active")
+
+
 @app.route("/periodic-jobs/<int:job_id>/stop")
 def _periodic_job_stop(job_id):
     """Disables saved periodic job in WebUI DB and removes it from job scheduler"""
@@ -613,6 +717,7 @@ def _periodic_job_stop(job_id):
         finally:
             job.enabled = OK.NO
             db.session.commit()
+            _publish_job_event(JobTable.PERIODIC_JOBS, job.id)
 
     return redirect("/jobs/periodic")
 
@@ -659,6 +764,8 @@ def _project_settings():
                     if not table_exists(db_uri, db_table):
                         create_tables(db_uri)
                         flash("Successfully created table '{}'".format(db_table), "success")
+                    else:
+                        upgrade_tables(db_uri)
             else:
                 flash("Please provide all DB connection details!", "warning")
         except Exception as e:
@@ -696,9 +803,14 @@ def _project_maintenance():
                     feed_files = list_files(FEEDS_DIR)
                     removed_files = remove_files(feed_files)
                     results.append("Removed total {} spider feed file(s)".format(len(removed_files)))
-                # # Clear Scrapy cache
-                # if key == "clear_cache":
-                #     pass
+                # Clear Scrapy HTTP cache
+                if key == "clear_cache":
+                    removed_files = clear_dir(HTTP_CACHE_DIR)
+                    results.append("Removed total {} HTTP cache file(s)".format(removed_files))
+                # Archive completed jobs
+                if key == "archive_jobs":
+                    archived = _archive_jobs(JOBS_RETENTION_DAYS if JOBS_RETENTION_DAYS is not None else 0)
+                    results.append("Archived total {} completed job(s)".format(archived))
                 # # Clear DB data
                 # if key == "drop_db":
                 #     pass
@@ -762,24 +874,28 @@ def _project_proxies():
             with open(PROXIES_FILE, 'r') as f:
                 proxies = f.read().strip()
     
+    proxy_stats = ProxyPool(text_file_to_lines(PROXIES_FILE), PROXY_STATS_FILE).stats()
+    
     return render_template(
         "project_proxies.html",
         proxies=proxies,
+        proxy_stats=proxy_stats,
+        now=time(),
     )
 
 
 @app.route("/jobs/<int:job_id>/log")
 def _job_log(job_id):
-    """Shows a job's log file contents"""
+    """Shows the tail of a job's log file, the rest is loaded by job log chunk endpoint"""
     job = db.session.query(Jobs).filter(Jobs.id == job_id).first()
     refresh = False
+    log_lines, start, end = [], 0, 0
     if job is None:
         flash("Can't find the job id {} in db".format(job_id), "danger")
     else:
         log_file = log_file_path(job.spider_name, job.date_started)
-        log_lines = []
         if isfile(log_file):
-            log_lines = text_file_to_lines(log_file)
+            log_lines, start, end = read_text_chunk(log_file, getsize(log_file), LOG_CHUNK_SIZE, backward=True)
             if SpiderStatus(job.spider_status) == SpiderStatus.RUNNING:
                 refresh = True
         else:
@@ -789,23 +905,60 @@ def _job_log(job_id):
 
     return render_template(
         "job_log.html",
+        job_id=job_id,
         log_lines=log_lines,
+        start=start,
+        end=end,
         refresh=refresh,
     )
 
 
-@app.route("/spiders/<int:job_id>/feed")
-def _job_feed(job_id):
-    """Shows a job's JSON feed"""
+@app.route("/jobs/<int:job_id>/log/chunk")
+def _job_log_chunk(job_id):
+    """
+    Returns a JSON with log file lines from given byte offset (offset and backward query arguments), returns at once
+    so following clients poll for new lines of a running job
+    """
+    job = db.session.query(Jobs).filter(Jobs.id == job_id).first()
+    if job is None:
+        return jsonify({"error": "Can't find the job id {} in db".format(job_id)}), 404
+    log_file = log_file_path(job.spider_name, job.date_started)
+    if not isfile(log_file):
+        return jsonify({"error": "Can't locate the log file"}), 404
+    offset = request.args.get("offset", 0, type=int)
+    backward = bool(request.args.get("backward", 0, type=int))
+    running = SpiderStatus(job.spider_status) == SpiderStatus.RUNNING
+    lines, start, end = read_text_chunk(log_file, offset, LOG_CHUNK_SIZE, backward=backward)
+
+    return jsonify({
+        "lines": lines,
+        "start": start,
+        "end": end,
+        "size": getsize(log_file),
+        "running": running,
+    })
+
+
+@app.route("/spiders/<int:job_id>/feed", defaults={"page": 1})
+@app.route("/spiders/<int:job_id>/feed/<int:page>")
+def _job_feed(job_id, page):
+    """Shows one page of a job's JSON feed items"""
     job = db.session.query(Jobs).filter(Jobs.id == job_id).first()
     refresh = False
+    feed_items, pages = [], 0
     if job is None:
         flash("Can't find the job id {} in db".format(job_id), "danger")
     else:
         feed_file = feed_file_path(job.spider_name, job.date_started)
-        feed_lines = []
         if isfile(feed_file):
-            feed_lines = text_file_to_lines(feed_file)
+            feed_index = FeedIndex(feed_file)
+            feed_index.update()
+            ipp = settings.key("ipp")
+            pages = max(1, (len(feed_index) + ipp - 1) // ipp)
+            page = max(1, min(page, pages))
+            feed_items = [
+                dumps(item, ensure_ascii=False) for item in feed_index.items((page - 1) * ipp, ipp)
+            ]
             if SpiderStatus(job.spider_status) == SpiderStatus.RUNNING:
                 refresh = True
         else:
@@ -815,7 +968,10 @@ def _job_feed(job_id):
 
     return render_template(
         "spider_feed.html",
-        feed_lines=feed_lines,
+        job_id=job_id,
+        feed_items=feed_items,
+        page=page,
+        pages=pages,
         refresh=refresh,
     )
 
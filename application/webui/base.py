@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 #!/usr/bin/env python
 
+import json
 import logging
 from datetime import datetime, timedelta
 from os.path import isfile
@@ -9,8 +10,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 from application.scrapers.scrapers.common import ScrapeType
+from application.scrapers.scrapers.connections import tune_sqlite
 from application.webui.misc import StaticFilesFilter
-from application.webui.models import init_db
+from application.webui.models import init_db, upgrade_db
 from config import (DEBUG, ROOT_DIR, TIMESTAMP_FORMAT, WEBUI_DB_FILE, WEBUI_DB_URI, WEBUI_SECRET_KEY, WEBUI_STATIC_DIR,
                     WEBUI_TEMPLATES_DIR, __title__, __version__)
 
@@ -33,12 +35,16 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["DATABASE_CONNECT_OPTIONS"] = {}
 
 db = SQLAlchemy(app)
+with app.app_context():
+    tune_sqlite(db.engine)  # WAL journal and busy timeout, same as Celery tasks and spiders
 
 # WebUI DB
 if not isfile(WEBUI_DB_FILE):
     print("Rebuilding database ...")
     init_db(WEBUI_DB_URI)  # TODO
     print("Done.")
+else:
+    upgrade_db(WEBUI_DB_URI)
 
 # # Settings
 # settings = Settings(**SETTINGS)
@@ -95,12 +101,22 @@ def utility_processor():
             if date > datetime.now():
                 return date
 
+    def job_rates(rates):
+        """Returns (download slot, reached rates) pairs from job rates JSON"""
+        if not rates:
+            return []
+        try:
+            return sorted(json.loads(rates).items())
+        except ValueError:
+            return []
+
     return dict(
         time_delta=time_delta,
         readable_time=readable_time,
         str_date=str_date,
         add_time=add_time,
         next_date_event=next_date_event,
+        job_rates=job_rates,
     )
 
 
@@ -1,10 +1,13 @@
 # -*- coding: UTF-8 -*-
 #!/usr/bin/env python
 
+from datetime import datetime
 from logging import Filter
-from os import listdir, makedirs, remove
-from os.path import exists, isfile, join, splitext
+from os import listdir, makedirs, remove, walk
+from os.path import exists, isdir, isfile, join, splitext
 from pickle import dump, load
+from shutil import rmtree
+from time import time
 
 
 class Data:
@@ -107,7 +110,7 @@ class Settings:
         """
         with open(file_path, "rb") as f:
             data = load(f)
-        self._data = data
+        self._data.update(data)  # Keys added after the file was saved keep their default values
 
 
 def text_to_unique_lines(text: str) -> set:
@@ -162,6 +165,42 @@ def remove_files(files: list) -> list:
     return removed_files
 
 
+def clear_dir(dir_path: str) -> int:
+    """
+    Removes all files and subdirectories from directory
+    :param str dir_path: full path to target directory
+    :return: number of removed files
+    """
+    if not isdir(dir_path):
+        return 0
+    count = sum(len(file_names) for _, _, file_names in walk(dir_path))
+    for file_name in listdir(dir_path):
+        file_path = join(dir_path, file_name)
+        if isdir(file_path):
+            rmtree(file_path)
+        else:
+            remove(file_path)
+
+    return count
+
+
+def job_crashed(date_started: datetime, stats: dict, stale_after: float) -> bool:
+    """
+    Checks if running job stopped publishing live metrics (see RedisStatsExtension), e.g. after its process was killed
+    :param datetime date_started: job start time
+    :param dict stats: job live metrics
+    :param float stale_after: seconds without metrics update after job counts as crashed
+    :return: True if job crashed
+    """
+    updated = float(stats.get("updated", 0)) if stats else 0
+    if updated:
+        return time() - updated > stale_after
+    if date_started is None:
+        return False
+
+    return (datetime.now() - date_started).total_seconds() > stale_after
+
+
 def ensure_dir(dir_path: str) -> bool:
     """
     Create directory path if it doesn't exists
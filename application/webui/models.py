@@ -1,11 +1,13 @@
 # -*- coding: UTF-8 -*-
 
-from sqlalchemy import Column, create_engine
+from sqlalchemy import Column, Index, inspect, select, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.types import DateTime, Integer, String
+from sqlalchemy.types import DateTime, Integer, String, Text
 from sqlalchemy.dialects.mysql import INTEGER
 
 from application.scrapers.scrapers.common import ScrapeType, SpiderStatus, OK
+from application.scrapers.scrapers.connections import get_engine
+from application.scrapers.scrapers.models import upgrade_schema
 
 
 Base = declarative_base()
@@ -18,10 +20,8 @@ class BaseTable(Base):
     id = Column(Integer, primary_key=True)
 
 
-class Jobs(BaseTable):
-    """Jobs table model"""
-    __tablename__ = "jobs"
-
+class JobsColumns:
+    """Columns shared by jobs and archived jobs tables"""
     task_id = Column(String(100))
     spider_name = Column(String(100), nullable=False, index=True)
     spider_status = Column(INTEGER, nullable=False, default=SpiderStatus.PENDING)
@@ -32,6 +32,28 @@ class Jobs(BaseTable):
     items_scraped = Column(INTEGER, default=0)
     date_started = Column(DateTime)
     date_finished = Column(DateTime)
+    rates = Column(Text)  # JSON, delay and concurrency reached per download slot (adaptive throttle)
+    params = Column(Text)  # JSON, scrapy spider parameters used to resume the job
+
+
+class Jobs(JobsColumns, BaseTable):
+    """Jobs table model"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Active and completed jobs pages filter jobs by status and sort them by ID or start date
+        Index("ix_jobs_spider_status_id", "spider_status", "id"),
+        Index("ix_jobs_spider_status_date_started", "spider_status", "date_started"),
+        # Job IDs of archived jobs aren't reused, they name Redis keys, crawl states and archived rows
+        {"sqlite_autoincrement": True},
+    )
+
+
+class JobsArchive(JobsColumns, BaseTable):
+    """Archived jobs table model, completed jobs are moved here after retention time so jobs table stays small"""
+    __tablename__ = "jobs_archive"
+    __table_args__ = (
+        Index("ix_jobs_archive_date_finished", "date_finished"),
+    )
 
 
 class PeriodicJobs(BaseTable):
@@ -60,5 +82,70 @@ class SettingsStatus(BaseTable):
 
 def init_db(db_uri):
     """Create new database and tables"""
-    engine = create_engine(db_uri)
+    engine = get_engine(db_uri)
     Base.metadata.create_all(engine)
+
+
+def upgrade_db(db_uri):
+    """
+    Adds columns and indexes missing in tables created by older versions, SQLite can only add nullable columns
+    """
+    engine = get_engine(db_uri)
+    if engine.dialect.name == "sqlite":
+        _upgrade_sqlite_autoincrement(engine)
+    upgrade_schema(engine, Base.metadata)
+
+
+def _upgrade_sqlite_autoincrement(engine):
+    """
+    Rebuilds SQLite tables created without AUTOINCREMENT which require it, IDs continue after the highest job ID in
+    the jobs and archived jobs tables
+    :param engine: SQLAlchemy engine instance
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables or not table.dialect_options["sqlite"]["autoincrement"]:
+            continue
+        with engine.begin() as connection:
+            sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                     name=table.name).scalar()
+            if "AUTOINCREMENT" in sql.upper():
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            columns = ', '.join(column.name for column in table.columns if column.name in existing)
+            for index in inspector.get_indexes(table.name):  # Index names are kept by the renamed table
+                connection.execute(text("DROP INDEX IF EXISTS {}".format(index["name"])))
+            connection.execute(text("ALTER TABLE {0} RENAME TO _{0}_old".format(table.name)))
+            table.create(connection)
+            connection.execute(text("INSERT INTO {0} ({1}) SELECT {1} FROM _{0}_old".format(table.name, columns)))
+            connection.execute(text("DROP TABLE _{}_old".format(table.name)))
+            last_id = connection.execute(text("SELECT MAX(id) FROM {}".format(table.name))).scalar() or 0
+            if table.name == Jobs.__tablename__ and JobsArchive.__tablename__ in tables:
+                last_id = max(last_id, connection.execute(text("SELECT MAX(id) FROM {}".format(
+                    JobsArchive.__tablename__))).scalar() or 0)
+            connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), name=table.name)
+            connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                               name=table.name, seq=last_id)
+
+
+def archive_jobs(db_uri, before) -> list:
+    """
+    Moves finished and canceled jobs to the archive table, interrupted jobs are kept since they can be resumed
+    :param str db_uri: WebUI DB URI
+    :param datetime before: jobs finished before this date are archived
+    :return: list of archived job IDs
+    """
+    engine = get_engine(db_uri)
+    jobs = Jobs.__table__
+    condition = jobs.c.spider_status.in_([SpiderStatus.FINISHED, SpiderStatus.CANCELED]) & \
+        (jobs.c.date_finished < before)
+    with engine.begin() as connection:
+        job_ids = [job_id for job_id, in connection.execute(select([jobs.c.id]).where(condition))]
+        if job_ids:
+            columns = [column.name for column in jobs.columns]
+            connection.execute(JobsArchive.__table__.insert().from_select(
+                columns, select([jobs.c[name] for name in columns]).where(condition)))
+            connection.execute(jobs.delete().where(condition))
+
+    return job_ids
@@ -2,16 +2,27 @@
 #!/usr/bin/env python
 
 from datetime import datetime
+from json import dumps, loads
 from os.path import isfile, join
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import sleep
 
-from flask import jsonify
+from flask import Response, jsonify
 from jinja2 import Template
+from redis import ConnectionError, Redis
 
 from config import (
-    WEBUI_TEMPLATES_DIR, DATA_DIR
+    WEBUI_TEMPLATES_DIR, DATA_DIR, CRAWL_STALE_AFTER
 )
+
+JOB_EVENTS_RECONNECT_DELAY = 1  # seconds before the first Redis reconnect, doubled up to the maximum
+JOB_EVENTS_MAX_RECONNECT_DELAY = 60  # seconds
+from application.webui.admin import settings
 from application.webui.base import app, db, utility_processor
+from application.webui.misc import job_crashed
 from application.scrapers.scrapers.common import SpiderStatus, ScrapeType
+from application.scrapers.scrapers.events import JOB_EVENTS_CHANNEL, JobTable, read_job_stats
 from application.webui.models import Jobs, PeriodicJobs
 
 
@@ -30,23 +41,103 @@ with open(template_file) as f:
     enabled_jobs_template = Template(f.read())
 
 
+def next_job_row(job: Jobs) -> dict:
+    """Returns next jobs table row data"""
+    return {
+        "id": job.id,
+        "spider_name": job.spider_name,
+        "scrape_type": ScrapeType(job.scrape_type),
+        "use_proxies": bool(job.use_proxies),
+        "save_to_file": bool(job.file),
+        "save_to_db": bool(job.db),
+    }
+
+
+def running_job_row(job: Jobs, stats: dict) -> dict:
+    """Returns running jobs table row data"""
+    return {
+        "id": job.id,
+        "spider_name": job.spider_name,
+        "scrape_type": ScrapeType(job.scrape_type),
+        "use_proxies": bool(job.use_proxies),
+        "date_started": job.date_started,
+        "save_to_file": bool(job.file),
+        "save_to_db": bool(job.db),
+        "stats": stats,
+        "resumable": bool(job.params) and job_crashed(job.date_started, stats, CRAWL_STALE_AFTER),
+    }
+
+
+def running_jobs_stats(job_ids: list) -> list:
+    """
+    Returns live crawl metrics published by the spiders (see RedisStatsExtension)
+    :param list job_ids: running job IDs
+    :return: list of metric dicts, empty dict for jobs without published metrics
+    """
+    if not job_ids:
+        return []
+    try:
+        return read_job_stats(Redis(settings.key("redis_host"), settings.key("redis_port")), job_ids)
+    except Exception as e:  # TODO: Add specific exceptions
+        app.logger.warning("Failed reading running jobs stats, details: {}".format(e))
+        return [{} for _ in job_ids]
+
+
+def enabled_job_row(job: PeriodicJobs) -> dict:
+    """Returns enabled periodic jobs table row data"""
+    return {
+        "id": job.id,
+        "spider_name": job.spider_name,
+        "scrape_type": ScrapeType(job.scrape_type),
+        "use_proxies": bool(job.use_proxies),
+        "date_started": job.date_started,
+        "save_to_file": bool(job.file),
+        "save_to_db": bool(job.db),
+        "repeat_time": job.repeat_time,
+    }
+
+
+def render_next_jobs(next_jobs: list) -> str:
+    """Returns rendered next jobs table rows"""
+    return next_jobs_template.render(
+        next_jobs=next_jobs,
+        scrape_type=ScrapeType,
+    )
+
+
+def render_running_jobs(running_jobs: list) -> str:
+    """Returns rendered running jobs table rows"""
+    util_proc = utility_processor()
+
+    return running_jobs_template.render(
+        running_jobs=running_jobs,
+        now=datetime.now(),
+        time_delta=util_proc["time_delta"],
+        str_date=util_proc["str_date"],
+        scrape_type=ScrapeType,
+    )
+
+
+def render_enabled_jobs(enabled_jobs: list) -> str:
+    """Returns rendered enabled periodic jobs table rows"""
+    util_proc = utility_processor()
+
+    return enabled_jobs_template.render(
+        enabled_jobs=enabled_jobs,
+        now=datetime.now(),
+        str_date=util_proc["str_date"],
+        next_date_event=util_proc["next_date_event"],
+        scrape_type=ScrapeType,
+    )
+
+
 @app.route("/xhr/next-jobs-table")
 def _xhr_next_jobs_table():
     """Returns a JSON with a list of next jobs data and a rendered next jobs table"""
     next_jobs = list()
     for job in db.session.query(Jobs).filter(Jobs.spider_status == SpiderStatus.PENDING).all():
-        next_jobs.append({
-            "id": job.id,
-            "spider_name": job.spider_name,
-            "scrape_type": ScrapeType(job.scrape_type),
-            "use_proxies": bool(job.use_proxies),
-            "save_to_file": bool(job.file),
-            "save_to_db": bool(job.db),
-        })
-    html = next_jobs_template.render(
-        next_jobs=next_jobs,
-        scrape_type=ScrapeType,
-    )
+        next_jobs.append(next_job_row(job))
+    html = render_next_jobs(next_jobs)
     
     return jsonify({
         "next_jobs": next_jobs,
@@ -58,24 +149,10 @@ def _xhr_next_jobs_table():
 def _xhr_running_jobs_table():
     """Returns a JSON with a list of running jobs data and a rendered running jobs table"""
     running_jobs = list()
-    for job in db.session.query(Jobs).filter(Jobs.spider_status == SpiderStatus.RUNNING).all():
-        running_jobs.append({
-            "id": job.id,
-            "spider_name": job.spider_name,
-            "scrape_type": ScrapeType(job.scrape_type),
-            "use_proxies": bool(job.use_proxies),
-            "date_started": job.date_started,
-            "save_to_file": bool(job.file),
-            "save_to_db": bool(job.db),
-        })
-    util_proc = utility_processor()
-    html = running_jobs_template.render(
-        running_jobs=running_jobs,
-        now=datetime.now(),
-        time_delta=util_proc["time_delta"],
-        str_date=util_proc["str_date"],
-        scrape_type=ScrapeType,
-    )
+    jobs = db.session.query(Jobs).filter(Jobs.spider_status == SpiderStatus.RUNNING).all()
+    for job, stats in zip(jobs, running_jobs_stats([job.id for job in jobs])):
+        running_jobs.append(running_job_row(job, stats))
+    html = render_running_jobs(running_jobs)
     
     return jsonify({
         "running_jobs": running_jobs,
@@ -88,26 +165,141 @@ def _xhr_enabled_jobs_table():
     """Returns a JSON with a list of enabled periodic jobs data and a rendered enabled jobs table"""
     enabled_jobs = list()
     for job in db.session.query(PeriodicJobs).filter(PeriodicJobs.enabled == 1).all():
-        enabled_jobs.append({
-            "id": job.id,
-            "spider_name": job.spider_name,
-            "scrape_type": ScrapeType(job.scrape_type),
-            "use_proxies": bool(job.use_proxies),
-            "date_started": job.date_started,
-            "save_to_file": bool(job.file),
-            "save_to_db": bool(job.db),
-            "repeat_time": job.repeat_time,
-        })
-    util_proc = utility_processor()
-    html = enabled_jobs_template.render(
-        enabled_jobs=enabled_jobs,
-        now=datetime.now(),
-        str_date=util_proc["str_date"],
-        next_date_event=util_proc["next_date_event"],
-        scrape_type=ScrapeType,
-    )
+        enabled_jobs.append(enabled_job_row(job))
+    html = render_enabled_jobs(enabled_jobs)
     
     return jsonify({
         "enabled_jobs": enabled_jobs,
         "html": html,
     })
+
+
+class JobEventsHub:
+    """
+    Listens to job state change events with one Redis subscription and forwards the changed table rows to all
+    connected WebUI clients, so every change is queried and rendered only once
+    """
+
+    def __init__(self):
+        self._clients = set()
+        self._lock = Lock()
+        self._thread = None
+
+    def subscribe(self) -> Queue:
+        """
+        Registers a new client, starts listening to Redis on first client
+        :return: client's event queue
+        """
+        queue = Queue(maxsize=100)
+        with self._lock:
+            self._clients.add(queue)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._listen, name="job-events", daemon=True)
+                self._thread.start()
+
+        return queue
+
+    def unsubscribe(self, queue: Queue):
+        """
+        Removes disconnected client
+        :param Queue queue: client's event queue
+        """
+        with self._lock:
+            self._clients.discard(queue)
+
+    def _listen(self):
+        """Forwards job events to clients, reconnects to Redis when the connection drops (runs in a separate thread)"""
+        delay = JOB_EVENTS_RECONNECT_DELAY
+        reconnect = False
+        while True:
+            try:
+                pubsub = Redis(settings.key("redis_host"), settings.key("redis_port")).pubsub(
+                    ignore_subscribe_messages=True)
+                pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                if reconnect:  # Events may have been missed while disconnected
+                    self._broadcast(dumps({"reload": True}))
+                delay = JOB_EVENTS_RECONNECT_DELAY
+                for message in pubsub.listen():
+                    try:
+                        event = self._render(loads(message["data"]))
+                    except Exception as e:  # TODO: Add specific exceptions
+                        app.logger.warning("Failed rendering job event, details: {}".format(e))
+                        event = dumps({"reload": True})  # Let clients reload whole tables instead
+                    self._broadcast(event)
+            except ConnectionError as e:
+                app.logger.warning("Job events listener lost Redis connection, reconnecting in {}s, details: {}".format(
+                    delay, e))
+            except Exception as e:  # TODO: Add specific exceptions
+                app.logger.warning("Job events listener failed, restarting in {}s, details: {}".format(delay, e))
+            sleep(delay)
+            delay = min(delay * 2, JOB_EVENTS_MAX_RECONNECT_DELAY)
+            reconnect = True
+
+    def _broadcast(self, event: str):
+        """
+        Puts event to all clients' queues
+        :param str event: JSON string
+        """
+        with self._lock:
+            clients = list(self._clients)
+        for queue in clients:
+            try:
+                queue.put_nowait(event)
+            except Full:  # Slow client, let it reload whole tables instead
+                with queue.mutex:
+                    queue.queue.clear()
+                queue.put_nowait(dumps({"reload": True}))
+
+    @staticmethod
+    def _render(event: dict) -> str:
+        """
+        Converts job event to changed WebUI table rows
+        :param dict event: job event data
+        :return: JSON string with table IDs mapped to rendered row HTML or None for removed rows
+        """
+        rows = {}
+        with app.app_context():
+            try:
+                if event["table"] == JobTable.JOBS:
+                    job = db.session.query(Jobs).get(event["id"])
+                    status = SpiderStatus(job.spider_status) if job is not None else None
+                    rows["next-jobs"] = render_next_jobs([next_job_row(job)]) \
+                        if status == SpiderStatus.PENDING else None
+                    rows["running-jobs"] = render_running_jobs([
+                        running_job_row(job, running_jobs_stats([job.id])[0])
+                    ]) if status == SpiderStatus.RUNNING else None
+                elif event["table"] == JobTable.PERIODIC_JOBS:
+                    job = db.session.query(PeriodicJobs).get(event["id"])
+                    rows["enabled-jobs"] = render_enabled_jobs([enabled_job_row(job)]) \
+                        if job is not None and job.enabled else None
+            finally:
+                db.session.remove()
+
+        return dumps({
+            "id": event["id"],
+            "rows": rows,
+        })
+
+
+job_events_hub = JobEventsHub()
+
+
+@app.route("/xhr/jobs-events")
+def _xhr_jobs_events():
+    """Server-sent events stream with changed job table rows"""
+    queue = job_events_hub.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = queue.get(timeout=15)
+                except Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "data: {}\n\n".format(event)
+        finally:
+            job_events_hub.unsubscribe(queue)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
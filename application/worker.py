@@ -0,0 +1,180 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import json
+import logging
+from datetime import datetime
+from threading import BoundedSemaphore, Event, Thread
+
+from config import CRAWLER_QUEUE, WEBUI_DB_URI
+
+logger = logging.getLogger(__name__)
+
+
+class JobLogFilter(logging.Filter):
+    """Passes only log records emitted by given crawler's spider"""
+
+    def __init__(self, crawler):
+        """
+        :param crawler: scrapy crawler instance
+        """
+        super().__init__()
+        self._crawler = crawler
+
+    def filter(self, record):
+        """Overridden"""
+        spider = getattr(self._crawler, "spider", None)
+
+        return spider is not None and getattr(record, "spider", None) is spider
+
+
+class CrawlerWorker:
+    """
+    Persistent crawler worker, takes crawl specs from a Redis queue and runs them in parallel with one long-lived
+    reactor and CrawlerRunner instead of starting a new process for each scrape job
+    """
+
+    def __init__(self, redis_host: str, redis_port: int, concurrency: int):
+        """
+        :param str redis_host: Redis host
+        :param int redis_port: Redis port
+        :param int concurrency: maximum number of parallel crawls
+        """
+        self._redis_host = redis_host
+        self._redis_port = redis_port
+        self._slots = BoundedSemaphore(concurrency)
+        self._stopping = Event()
+        self._reactor = None
+        self._runner = None
+        self._webui_db = None
+
+    def run(self):
+        """Runs the reactor, blocks until the worker is stopped"""
+        from scrapy.crawler import CrawlerRunner
+        from scrapy.utils.log import configure_logging
+        from sqlalchemy.orm import sessionmaker
+        from twisted.internet import reactor
+
+        from application.scrapers.scrapers.connections import get_engine
+
+        configure_logging(install_root_handler=False)
+        logging.root.setLevel(logging.INFO)
+        self._reactor = reactor
+        self._webui_db = sessionmaker(bind=get_engine(WEBUI_DB_URI))
+        self._runner = CrawlerRunner()
+        reactor.addSystemEventTrigger("before", "shutdown", self._stop)
+        Thread(target=self._poll, name="crawler-queue", daemon=True).start()
+        logger.info("Crawler worker started")
+        reactor.run()
+
+    def _poll(self):
+        """Pops crawl specs from the queue while there are free crawl slots (runs in a separate thread)"""
+        from application.scrapers.scrapers.connections import get_redis
+
+        redis = get_redis(self._redis_host, self._redis_port)
+        while not self._stopping.is_set():
+            self._slots.acquire()
+            try:
+                data = redis.blpop(CRAWLER_QUEUE, timeout=5)
+            except Exception as e:  # TODO: Add specific exceptions
+                logger.error("Failed reading crawler queue, details: {}".format(e))
+                data = None
+                self._stopping.wait(5)
+            if data is None:
+                self._slots.release()
+                continue
+            self._reactor.callFromThread(self._crawl, json.loads(data[1].decode()))
+
+    def _crawl(self, params: dict):
+        """
+        Starts one crawl (runs in the reactor thread)
+        :param dict params: scrapy spider parameters
+        """
+        from scrapy.crawler import Crawler
+
+        from application.scrapers.scrapers.common import ScrapeType
+        from application.spiders import SPIDERS
+        from tasks import crawler_settings
+
+        try:
+            params["scrape_type"] = ScrapeType(params["scrape_type"])
+            scrapy_settings = crawler_settings(params)
+            log_file = scrapy_settings.get("LOG_FILE")
+            scrapy_settings["LOG_FILE"] = None  # Job log file handler is attached below
+            crawler = Crawler(SPIDERS[params["spider"]], scrapy_settings)
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.error("Failed starting job ID {}, details: {}".format(params.get("job_id"), e), exc_info=True)
+            self._job_finished(None, params, None, None)
+            return
+        handler = None
+        if log_file:
+            handler = logging.FileHandler(log_file, encoding=scrapy_settings.get("LOG_ENCODING"))
+            handler.setFormatter(logging.Formatter(
+                fmt=scrapy_settings.get("LOG_FORMAT"),
+                datefmt=scrapy_settings.get("LOG_DATEFORMAT"),
+            ))
+            handler.setLevel(scrapy_settings.get("LOG_LEVEL"))
+            handler.addFilter(JobLogFilter(crawler))
+            logging.root.addHandler(handler)
+        logger.info("Starting job ID {}".format(params["job_id"]))
+        d = self._runner.crawl(crawler)
+        d.addBoth(self._job_finished, params, handler, crawler)
+
+    def _job_finished(self, result, params: dict, handler, crawler):
+        """
+        Releases crawl slot and reports job completion to WebUI DB (runs in the reactor thread)
+        :param result: crawl result or failure
+        :param dict params: scrapy spider parameters
+        :param handler: job log file handler
+        :param crawler: scrapy crawler instance or None if the crawl didn't start
+        """
+        from twisted.python.failure import Failure
+
+        from application.scrapers.scrapers.common import SpiderStatus
+        from application.scrapers.scrapers.connections import get_redis
+        from application.scrapers.scrapers.events import JobTable, publish_job_event
+        from application.webui.models import Jobs
+        from tasks import remove_crawl_state
+
+        self._slots.release()
+        if handler is not None:
+            logging.root.removeHandler(handler)
+            handler.close()
+        # Crawl state is kept only for jobs which can be resumed
+        if crawler is not None and crawler.stats.get_value("finish_reason") == "finished":
+            remove_crawl_state(params["job_id"])
+        if isinstance(result, Failure):
+            logger.error("Job ID {} failed, details: {}".format(params.get("job_id"), result.getErrorMessage()))
+        # Spider updates its job on close, only jobs which failed before or during spider start are left running
+        db_session = self._webui_db()
+        try:
+            job = db_session.query(Jobs).filter(Jobs.id == params.get("job_id")).first()
+            if job is not None and job.spider_status in (SpiderStatus.PENDING, SpiderStatus.RUNNING):
+                job.spider_status = SpiderStatus.FINISHED
+                job.date_finished = datetime.now()
+                db_session.commit()
+                publish_job_event(get_redis(self._redis_host, self._redis_port), JobTable.JOBS, job.id)
+        except Exception as e:  # TODO: Add specific exceptions
+            logger.error("Failed updating job ID {}, details: {}".format(params.get("job_id"), e))
+            db_session.rollback()
+        finally:
+            db_session.close()
+        logger.info("Finished job ID {}".format(params.get("job_id")))
+
+    def _stop(self):
+        """Stops taking new crawl specs and gracefully stops running crawls"""
+        self._stopping.set()
+
+        return self._runner.stop()
+
+
+def run_crawler_worker(redis_host: str, redis_port: int, concurrency: int):
+    """
+    Crawler worker process entry point
+    :param str redis_host: Redis host
+    :param int redis_port: Redis port
+    :param int concurrency: maximum number of parallel crawls
+    """
+    import tasks  # noqa: F401, installs the asyncio reactor before twisted.internet.reactor is imported
+
+    CrawlerWorker(redis_host, redis_port, concurrency).run()
@@ -0,0 +1,181 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+"""
+Local mock job board serving Indeed-shaped listing and job post pages
+
+Run from the project directory:
+    python -m benchmarks.mockboard [-p PORT] [-j JOBS] [-l LATENCY] [-e ERROR_RATE] [-b BAN_RATE]
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import random, uniform
+from threading import Lock, Thread
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.pages import job_key, job_post_page, listing_page
+
+MOCKBOARD_PORT = 4040
+
+
+class MockBoardHandler(BaseHTTPRequestHandler):
+    """Mock job board request handler"""
+
+    def do_GET(self):
+        """Overridden"""
+        board = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/_stats":
+            self._send(200, json.dumps(board.stats()), "application/json")
+            return
+        if board.latency:
+            sleep(max(0.0, uniform(board.latency - board.jitter, board.latency + board.jitter)))
+        if board.banned():
+            self._send(429, "Too Many Requests")
+            return
+        if board.error_rate and random() < board.error_rate:
+            self._send(500, "Internal Server Error")
+            return
+        if url.path == "/jobs":
+            start = int(query.get("start", ["0"])[0])
+            if start >= board.jobs and start > 0:
+                self._send(404, "Not Found")
+                return
+            self._send(200, listing_page(query.get("q", [''])[0], start, board.jobs, board.page_size))
+            return
+        if url.path in ("/rc/clk", "/viewjob"):
+            number = board.job_numbers.get(query.get("jk", [''])[0])
+            if number is not None:
+                self._send(200, job_post_page(number))
+                return
+        self._send(404, "Not Found")
+
+    def _send(self, status: int, body: str, content_type: str = "text/html; charset=utf-8"):
+        """
+        Sends response
+        :param int status: HTTP status code
+        :param str body: response body
+        :param str content_type: response content type
+        """
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if urlparse(self.path).path != "/_stats":
+            self.server.count(status)
+
+    def log_message(self, format, *args):
+        """Overridden, request logging is disabled"""
+        pass
+
+
+class MockBoardServer(ThreadingHTTPServer):
+    """Mock job board HTTP server"""
+    daemon_threads = True
+
+    def __init__(self, port: int = MOCKBOARD_PORT, jobs: int = 1000, page_size: int = 10, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, ban_rate: float = 0.0, ban_time: float = 5.0):
+        """
+        :param int port: listening port
+        :param int jobs: number of job posts in search results
+        :param int page_size: number of job posts per listing page
+        :param float latency: average response latency in seconds
+        :param float jitter: maximum latency deviation in seconds
+        :param float error_rate: share of requests answered with HTTP 500
+        :param float ban_rate: share of requests which start a ban, all requests are answered with HTTP 429 while ban
+        lasts
+        :param float ban_time: ban duration in seconds
+        """
+        super().__init__(("127.0.0.1", port), MockBoardHandler)
+        self.jobs = jobs
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = min(jitter, latency)
+        self.error_rate = error_rate
+        self.ban_rate = ban_rate
+        self.ban_time = ban_time
+        self.job_numbers = {job_key(number): number for number in range(jobs)}
+        self._lock = Lock()
+        self._statuses = Counter()
+        self._banned_until = 0.0
+
+    @property
+    def url(self) -> str:
+        """Mock job board base URL"""
+        return "http://127.0.0.1:{}/".format(self.server_address[1])
+
+    def banned(self) -> bool:
+        """Checks if the client is banned, starts a new ban at random"""
+        with self._lock:
+            now = time()
+            if now < self._banned_until:
+                return True
+            if self.ban_rate and random() < self.ban_rate:
+                self._banned_until = now + self.ban_time
+                return True
+
+        return False
+
+    def count(self, status: int):
+        """
+        Counts served response
+        :param int status: HTTP status code
+        """
+        with self._lock:
+            self._statuses[status] += 1
+
+    def stats(self) -> dict:
+        """Returns served responses count by HTTP status code"""
+        with self._lock:
+            return {
+                "requests": sum(self._statuses.values()),
+                "statuses": {str(status): count for status, count in sorted(self._statuses.items())},
+            }
+
+    def reset_stats(self):
+        """Resets served responses counters"""
+        with self._lock:
+            self._statuses.clear()
+            self._banned_until = 0.0
+
+    def start(self) -> Thread:
+        """Serves requests from a background thread"""
+        thread = Thread(target=self.serve_forever, name="mockboard", daemon=True)
+        thread.start()
+
+        return thread
+
+
+def main() -> int:
+    """Mock job board main entry point"""
+    parser = ArgumentParser(description="Mock job board")
+    parser.add_argument("-p", type=int, dest="port", default=MOCKBOARD_PORT, help="Listening port")
+    parser.add_argument("-j", type=int, dest="jobs", default=1000, help="Number of job posts")
+    parser.add_argument("-l", type=float, dest="latency", default=0.05, help="Average response latency in seconds")
+    parser.add_argument("--jitter", type=float, dest="jitter", default=0.02, help="Latency deviation in seconds")
+    parser.add_argument("-e", type=float, dest="error_rate", default=0.0, help="Share of HTTP 500 responses")
+    parser.add_argument("-b", type=float, dest="ban_rate", default=0.0, help="Share of requests starting a 429 ban")
+    parser.add_argument("--ban-time", type=float, dest="ban_time", default=5.0, help="Ban duration in seconds")
+    args = parser.parse_args()
+    server = MockBoardServer(args.port, args.jobs, latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate, ban_rate=args.ban_rate, ban_time=args.ban_time)
+    print("Serving mock job board at {}jobs?q=python&l=".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
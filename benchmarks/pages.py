@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+from hashlib import md5
+from html import escape
+from random import Random
+from urllib.parse import quote
+
+TITLES = ("Python Developer", "Senior Software Engineer", "Data Engineer", "Backend Developer", "DevOps Engineer",
+          "Machine Learning Engineer", "Full Stack Developer", "QA Automation Engineer", "Site Reliability Engineer")
+LOCATIONS = ("New York, NY", "San Francisco, CA", "Austin, TX", "Seattle, WA", "Remote", "Boston, MA", "Chicago, IL")
+COMPANIES = ("Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises")
+POSTED = ("Just posted", "Today", "1 day ago", "3 days ago", "7 days ago", "14 days ago", "30+ days ago")
+WORDS = ("python", "scrapy", "experience", "team", "design", "build", "systems", "data", "cloud", "services", "we",
+         "are", "looking", "for", "engineer", "with", "strong", "skills", "in", "and", "the", "to", "of", "develop")
+
+
+def job_key(number: int) -> str:
+    """
+    Creates Indeed-like job key
+    :param int number: job post number
+    :return: 16 hex digits job key
+    """
+    return md5(str(number).encode()).hexdigest()[:16]
+
+
+def listing_page(query: str, start: int, total: int, page_size: int = 10) -> str:
+    """
+    Creates Indeed-shaped search results page
+    :param str query: search query
+    :param int start: offset of the first job post on the page
+    :param int total: total number of job posts in search results
+    :param int page_size: number of job posts per page
+    :return: page HTML
+    """
+    page = start // page_size + 1
+    pages = (total + page_size - 1) // page_size
+    results = []
+    for number in range(start, min(start + page_size, total)):
+        rnd = Random(number)
+        results.append(
+            '<div class="jobsearch-SerpJobCard row result" data-jk="{jk}">'
+            '<h2 class="jobtitle"><a href="/rc/clk?jk={jk}&amp;fccid={fccid}&amp;vjs=3" target="_blank">{title}</a>'
+            '</h2><div class="sjcl"><span class="company">{company}</span>'
+            '<div class="location">{location}</div></div>'
+            '<div class="summary">{summary}</div><span class="date">{posted}</span></div>'.format(
+                jk=job_key(number),
+                fccid=job_key(-number),
+                title=escape(rnd.choice(TITLES)),
+                company=escape(rnd.choice(COMPANIES)),
+                location=escape(rnd.choice(LOCATIONS)),
+                summary=' '.join(rnd.choice(WORDS) for _ in range(30)),
+                posted=rnd.choice(POSTED),
+            )
+        )
+    links = []
+    for number in range(max(1, page - 4), min(pages, page + 4) + 1):
+        if number == page:
+            links.append('<b>{}</b>'.format(number))
+        else:
+            links.append('<a href="/jobs?q={q}&amp;start={start}">{number}</a>'.format(
+                q=quote(query), start=(number - 1) * page_size, number=number
+            ))
+
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>{query} Jobs - Indeed.com</title></head><body>'
+        '<div id="searchCount">Page {page} of {total:,} jobs</div><div id="resultsCol">{results}</div>'
+        '<div class="pagination">{links}</div></body></html>'.format(
+            query=escape(query), page=page, total=total, results=''.join(results), links=''.join(links),
+        )
+    )
+
+
+def job_post_page(number: int) -> str:
+    """
+    Creates Indeed-shaped job post page
+    :param int number: job post number
+    :return: page HTML
+    """
+    rnd = Random(number)
+    paragraphs = []
+    for _ in range(rnd.randint(4, 12)):
+        paragraphs.append('<p>{}</p>'.format(' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80)))))
+    items = ''.join('<li>{}</li>'.format(' '.join(rnd.choice(WORDS) for _ in range(8))) for _ in range(6))
+
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title} - {location} - Indeed.com</title></head>'
+        '<body><div class="jobsearch-JobComponent icl-u-xs-mt--md"><h3>{title}</h3>'
+        '<div class="jobsearch-InlineCompanyRating"><div>{company}</div><div>{location}</div></div>'
+        '<div class="jobsearch-JobComponent-description icl-u-xs-mt--md">{paragraphs}<ul>{items}</ul></div>'
+        '<div class="jobsearch-JobMetadataFooter">{posted}<span> - </span><a href="#">save job</a></div>'
+        '</div></body></html>'.format(
+            title=escape(rnd.choice(TITLES)),
+            company=escape(rnd.choice(COMPANIES)),
+            location=escape(rnd.choice(LOCATIONS)),
+            paragraphs=''.join(paragraphs),
+            items=items,
+            posted=rnd.choice(POSTED),
+        )
+    )
@@ -0,0 +1,243 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+"""
+Offline parsing benchmark, replays recorded pages through spider callbacks
+
+Run from the project directory:
+    python -m benchmarks.parsing [-s SPIDER] [-r ROUNDS] [--save-baseline]
+"""
+
+import json
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import contextmanager
+from os.path import dirname, isfile, join, realpath
+from time import perf_counter
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from application.scrapers.scrapers.common import ScrapeType
+from application.spiders import SPIDERS
+
+BENCHMARKS_DIR = dirname(realpath(__file__))
+FIXTURES_DIR = join(BENCHMARKS_DIR, "fixtures")
+BASELINE_FILE = join(BENCHMARKS_DIR, "baseline.json")
+TOLERANCE = 0.2  # Allowed slowdown against the baseline
+
+
+class TimedHtmlResponse(HtmlResponse):
+    """HTML response which measures time spent in each XPath query passed to response.xpath"""
+    timings = None
+
+    def xpath(self, query, **kwargs):
+        """Overridden"""
+        start = perf_counter()
+        result = super().xpath(query, **kwargs)
+        if self.timings is not None:
+            timing = self.timings[query]
+            timing[0] += 1
+            timing[1] += perf_counter() - start
+
+        return result
+
+
+def timed_xpath(xpath, expression: str, timings):
+    """
+    Wraps compiled XPath so its calls are measured
+    :param xpath: compiled lxml XPath
+    :param str expression: XPath expression
+    :param timings: XPath timings dict
+    :return: wrapped XPath
+    """
+    def wrapper(root):
+        start = perf_counter()
+        result = xpath(root)
+        timing = timings[expression]
+        timing[0] += 1
+        timing[1] += perf_counter() - start
+
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def timed_extraction_plans(spider_class, timings):
+    """
+    Measures XPath calls of the spider's compiled extraction plans while active
+    :param spider_class: spider class
+    :param timings: XPath timings dict
+    """
+    plans = [spider_class.extraction_plan(name) for name in spider_class.extraction_plans]
+    fields = [plan.fields for plan in plans]
+    for plan in plans:
+        plan.fields = [
+            (name, field, timed_xpath(xpath, field.expression, timings)) for name, field, xpath in plan.fields
+        ]
+    try:
+        yield
+    finally:
+        for plan, plan_fields in zip(plans, fields):
+            plan.fields = plan_fields
+
+
+def load_fixtures(spider_name: str) -> list:
+    """
+    Loads recorded pages listed in the spider's fixtures index file
+    :param str spider_name: spider name
+    :return: list of fixture dicts (url, callback, meta, body)
+    """
+    fixtures_dir = join(FIXTURES_DIR, spider_name)
+    with open(join(fixtures_dir, "index.json"), encoding="utf-8") as f:
+        fixtures = json.load(f)
+    for fixture in fixtures:
+        with open(join(fixtures_dir, fixture["file"]), "rb") as f:
+            fixture["body"] = f.read()
+
+    return fixtures
+
+
+def create_spider(spider_name: str):
+    """
+    Creates spider instance which isn't attached to a running crawl
+    :param str spider_name: spider name
+    :return: spider instance
+    """
+    spider_class = {spider.name: spider for spider in SPIDERS}[spider_name]
+    crawler = get_crawler(spider_class, {"SELECTED_COUNTRIES": [], "KEYWORDS": []})
+    spider = spider_class.from_crawler(crawler)
+    spider._scrape_type = ScrapeType.ALL
+
+    return spider
+
+
+def replay(spider, fixtures: list, timings=None) -> tuple:
+    """
+    Passes recorded pages through spider callbacks
+    :param spider: spider instance
+    :param list fixtures: fixtures
+    :param timings: XPath timings dict or None
+    :return: number of scraped items and number of follow up requests
+    """
+    items = requests = 0
+    spider.pagination_urls.clear()
+    for fixture in fixtures:
+        meta = dict(fixture.get("meta", {}))
+        response = TimedHtmlResponse(
+            url=fixture["url"],
+            body=fixture["body"],
+            encoding="utf-8",
+            request=Request(fixture["url"], meta=meta),
+        )
+        response.timings = timings
+        for result in getattr(spider, fixture["callback"])(response) or ():
+            if isinstance(result, Request):
+                requests += 1
+            else:
+                items += 1
+
+    return items, requests
+
+
+def run(spider_name: str, rounds: int) -> dict:
+    """
+    Runs the benchmark
+    :param str spider_name: spider name
+    :param int rounds: number of fixture corpus replays
+    :return: benchmark results
+    """
+    fixtures = load_fixtures(spider_name)
+    spider = create_spider(spider_name)
+    replay(spider, fixtures)  # Warm up
+    # Throughput
+    items = requests = 0
+    start = perf_counter()
+    for _ in range(rounds):
+        round_items, round_requests = replay(spider, fixtures)
+        items += round_items
+        requests += round_requests
+    elapsed = perf_counter() - start
+    # XPath timings and allocations are measured separately, so they don't skew the throughput
+    timings = defaultdict(lambda: [0, 0.0])
+    with timed_extraction_plans(spider.__class__, timings):
+        replay(spider, fixtures, timings)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    replay(spider, fixtures)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+    return {
+        "spider": spider_name,
+        "pages": len(fixtures) * rounds,
+        "items": items,
+        "requests": requests,
+        "seconds": round(elapsed, 4),
+        "pages_per_second": round(len(fixtures) * rounds / elapsed, 2),
+        "items_per_second": round(items / elapsed, 2),
+        "allocated_blocks": allocations,
+        "peak_memory_kb": round(peak / 1024, 1),
+        "xpath_ms": {query: round(total * 1000 / count, 4) for query, (count, total) in sorted(timings.items())},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares benchmark results against the baseline
+    :param dict results: benchmark results
+    :param dict baseline: baseline benchmark results
+    :param float tolerance: allowed relative slowdown
+    :return: list of regression messages
+    """
+    regressions = []
+    for key in ("pages_per_second", "items_per_second"):
+        if baseline.get(key) and results[key] < baseline[key] * (1 - tolerance):
+            regressions.append("{}: {} (baseline {})".format(key, results[key], baseline[key]))
+    for query, ms in results["xpath_ms"].items():
+        baseline_ms = baseline.get("xpath_ms", {}).get(query)
+        if baseline_ms and ms > baseline_ms * (1 + tolerance):
+            regressions.append("XPath {}: {} ms per call (baseline {} ms)".format(query, ms, baseline_ms))
+
+    return regressions
+
+
+def main() -> int:
+    """Parsing benchmark main entry point"""
+    parser = ArgumentParser(description="Offline spider parsing benchmark")
+    parser.add_argument("-s", dest="spider", default="indeed", help="Spider name")
+    parser.add_argument("-r", type=int, dest="rounds", default=50, help="Number of fixture corpus replays")
+    parser.add_argument("-t", type=float, dest="tolerance", default=TOLERANCE, help="Allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--baseline", dest="baseline", default=BASELINE_FILE, help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", dest="save_baseline",
+                        help="Save results as the new baseline")
+    args = parser.parse_args()
+    results = run(args.spider, args.rounds)
+    print(json.dumps(results, indent=4))
+    baselines = {}
+    if isfile(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[args.spider] = results
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=4, sort_keys=True)
+        print("Saved baseline to {}".format(args.baseline))
+        return 0
+    if args.spider not in baselines:
+        print("No baseline for spider '{}', run with --save-baseline to create it".format(args.spider))
+        return 0
+    regressions = compare(results, baselines[args.spider], args.tolerance)
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+"""
+End-to-end crawl throughput benchmark, runs real crawls through tasks.run_crawler against the local mock job board
+
+Run from the project directory (Redis from the WebUI settings has to be running):
+    python -m benchmarks.throughput [-c 1,2,4,8] [-d 0,0.5] [-j JOBS] [-l LATENCY] [-a] [--db]
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+from itertools import product
+from os.path import join
+from tempfile import mkdtemp
+from time import perf_counter
+
+from config import SETTINGS
+from application.feeds import FeedIndex
+from application.scrapers.scrapers.common import ScrapeType
+from application.spiders import SPIDERS
+from benchmarks.mockboard import MockBoardServer
+from tasks import run_crawler_process, settings
+
+COUNTRY = "us"
+
+
+def setting(name: str) -> object:
+    """
+    Returns WebUI setting, settings file saved by an older version falls back to the default value
+    :param str name: setting name
+    :return: setting value
+    """
+    return settings.key(name) if name in settings else SETTINGS[name]
+
+
+def crawl_params(spider: int, concurrent_requests: int, delay: float, board_url: str, output_dir: str,
+                 run: int, save_to_db: bool, adaptive_throttle: bool = False) -> dict:
+    """
+    Creates scrapy spider parameters for one benchmark crawl
+    :param int spider: spider index
+    :param int concurrent_requests: concurrent requests
+    :param float delay: download delay
+    :param str board_url: mock job board URL
+    :param str output_dir: feed and log files directory
+    :param int run: benchmark crawl number
+    :param bool save_to_db: save job posts to MySQL DB from the WebUI settings
+    :param bool adaptive_throttle: tune delay and concurrency within the WebUI settings floors and ceilings
+    :return: scrapy spider parameters
+    """
+    return {
+        "db_host": setting("db_host"),
+        "db_port": setting("db_port"),
+        "db_name": setting("db_name"),
+        "db_user": setting("db_user"),
+        "db_pass": setting("db_pass"),
+        "redis_host": setting("redis_host"),
+        "redis_port": setting("redis_port"),
+        "delay": delay,
+        "timeout": setting("timeout"),
+        "retries": setting("retries"),
+        "concurrent_requests": concurrent_requests,
+        "adaptive_throttle": adaptive_throttle,
+        "throttle_min_delay": setting("throttle_min_delay"),
+        "throttle_max_delay": setting("throttle_max_delay"),
+        "throttle_min_concurrency": setting("throttle_min_concurrency"),
+        "throttle_max_concurrency": setting("throttle_max_concurrency"),
+        "spider": spider,
+        "spider_name": "indeed",
+        "scrape_type": ScrapeType.ALL,
+        "save_to_feed": True,
+        "save_to_db": save_to_db,
+        "use_proxies": False,
+        "keywords": ["python"],
+        "selected_countries": [COUNTRY],
+        "country_urls": {COUNTRY: board_url},
+        "log": join(output_dir, "crawl_{}.log".format(run)),
+        "feed_file": join(output_dir, "crawl_{}.json".format(run)),
+        "job_id": -run,  # Benchmark crawls don't have WebUI jobs
+        "resumable": False,
+        "task_id": "throughput-{}".format(run),
+    }
+
+
+def main() -> int:
+    """Throughput benchmark main entry point"""
+    parser = ArgumentParser(description="End-to-end crawl throughput benchmark")
+    parser.add_argument("-c", dest="concurrency", default="1,2,4,8", help="Comma separated concurrent requests values")
+    parser.add_argument("-d", dest="delays", default="0", help="Comma separated download delay values")
+    parser.add_argument("-j", type=int, dest="jobs", default=300, help="Number of job posts on the mock board")
+    parser.add_argument("-l", type=float, dest="latency", default=0.05, help="Mock board latency in seconds")
+    parser.add_argument("-e", type=float, dest="error_rate", default=0.0, help="Mock board share of HTTP 500")
+    parser.add_argument("-b", type=float, dest="ban_rate", default=0.0, help="Mock board share of 429 bans")
+    parser.add_argument("--db", action="store_true", dest="save_to_db",
+                        help="Save job posts to MySQL DB from the WebUI settings (use a test DB)")
+    parser.add_argument("-a", action="store_true", dest="adaptive_throttle",
+                        help="Adaptive throttle, -c and -d values are starting rates")
+    parser.add_argument("--json", action="store_true", dest="json", help="Print results as JSON")
+    args = parser.parse_args()
+    spider = [spider_class.name for spider_class in SPIDERS].index("indeed")
+    server = MockBoardServer(0, args.jobs, latency=args.latency, jitter=args.latency / 2,
+                             error_rate=args.error_rate, ban_rate=args.ban_rate)
+    server.start()
+    output_dir = mkdtemp(prefix="throughput-")
+    results = []
+    try:
+        configurations = product(
+            [int(value) for value in args.concurrency.split(',')],
+            [float(value) for value in args.delays.split(',')],
+        )
+        for run, (concurrent_requests, delay) in enumerate(configurations, 1):
+            server.reset_stats()
+            params = crawl_params(spider, concurrent_requests, delay, server.url, output_dir, run, args.save_to_db,
+                                  args.adaptive_throttle)
+            start = perf_counter()
+            run_crawler_process(params).join()
+            elapsed = perf_counter() - start
+            feed_index = FeedIndex(params["feed_file"])
+            feed_index.update()
+            stats = server.stats()
+            results.append({
+                "concurrent_requests": concurrent_requests,
+                "delay": delay,
+                "seconds": round(elapsed, 2),
+                "items": len(feed_index),
+                "items_per_second": round(len(feed_index) / elapsed, 2),
+                "requests_per_second": round(stats["requests"] / elapsed, 2),
+                "statuses": stats["statuses"],
+            })
+            if not args.json:
+                result = results[-1]
+                print("concurrency {:>3} delay {:>5} | {:>8} s | {:>6} items | {:>8} items/s | {:>8} req/s | {}".format(
+                    concurrent_requests, delay, result["seconds"], result["items"], result["items_per_second"],
+                    result["requests_per_second"], result["statuses"],
+                ))
+    finally:
+        server.shutdown()
+        server.server_close()
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print("Crawl logs and feeds saved to {}".format(output_dir))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,6 +47,11 @@ DELAY = 3  # seconds
 TIMEOUT = 30  # seconds
 RETRIES = 2
 CONCURRENT_REQUESTS = 1
+ADAPTIVE_THROTTLE = 0  # tune delay and concurrency per target domain from latency, 429/503 responses and bans, 1 enables it
+THROTTLE_MIN_DELAY = 0.0  # seconds, adaptive throttle delay floor
+THROTTLE_MAX_DELAY = 60.0  # seconds, adaptive throttle delay ceiling
+THROTTLE_MIN_CONCURRENCY = 1  # adaptive throttle concurrent requests per domain floor
+THROTTLE_MAX_CONCURRENCY = 8  # adaptive throttle concurrent requests per domain ceiling
 SPIDERS = (
     ("indeed", "https://www.indeed.com/"),
     ("testspider", "https://httpbin.org/"),
@@ -54,17 +59,56 @@ SPIDERS = (
 )
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
              "Chrome/63.0.3239.132 Safari/537.36"
-ROTATING_PROXY_LIST_PATH = PROXIES_FILE
-ROTATING_PROXY_BACKOFF_BASE = 30
-ROTATING_PROXY_BACKOFF_CAP = 60
+USER_AGENT_SESSIONS = 1000  # maximum number of proxy/download slot user agent sessions kept per spider
+USER_AGENT_SESSION_REQUESTS = 100  # requests after session gets a new user agent, sessions also rotate on a ban
+USER_AGENT_SESSION_COOKIES = False  # separate cookie jar per user agent session (enables cookies)
+PROXY_STATS_FILE = join(DATA_DIR, "proxy_stats.json")  # proxy latency, success rate and ban history
+PROXY_BAN_COOLDOWN = 300  # seconds banned proxy is skipped while other proxies are available
+PROXY_MAX_RETRIES = 5  # retries of one request through other proxies after a ban or connection error
+PROXY_CHECK_URL = "https://www.indeed.com/robots.txt"  # proxy health check before a crawl, None disables checks
+PROXY_CHECK_TIMEOUT = 10  # seconds
+PROXY_CHECK_MAX_AGE = 60 * 10  # seconds after proxy needs a new health check
 EXTENSIONS = {
     "scrapy.extensions.telnet.TelnetConsole": None,  # Disable telnet console to avoid port errors
+    "application.scrapers.scrapers.extensions.RedisStatsExtension": 500,  # Live job metrics
+    "application.scrapers.scrapers.throttle.AdaptiveThrottle": 510,  # Adaptive delay and concurrency
 }
+STATS_INTERVAL = 5  # seconds between live job metrics updates
 SAVE_TO_FEED = False
 SAVE_TO_DB = False
 USE_PROXIES = False
 SCRAPE_TYPE = 0
+DB_BATCH_SIZE = 50  # job posts per one multi-row insert, 1 disables buffering
+DB_FLUSH_INTERVAL = 5  # seconds
+SEEN_INDEX_REDIS_KEY = "{db}:job_posts:seen"  # shared scraped job post IDs, None disables sharing
+NEAR_DUPLICATE_MODE = None  # "drop" or "link" reposted job posts to the original, None disables detection
+NEAR_DUPLICATE_DISTANCE = 5  # maximum number of different SimHash fingerprint bits of near-duplicate job posts
+NEAR_DUPLICATE_REDIS_KEY = "{db}:job_posts:simhash"  # Redis key prefix of persistent fingerprint index
+PENDING_BATCH_SIZE = 500  # pending job post detail pages claimed by one pending job posts scrape (per crawler)
+PENDING_LEASE = 60 * 60  # seconds claimed pending job post isn't given to other crawlers
+PENDING_MAX_ATTEMPTS = 3  # claims of one pending job post after it's removed from the queue
+STOP_CHECK_INTERVAL = 2  # seconds between job cancellation checks
+CRAWL_STATE_DIR = join(DATA_DIR, "crawls")  # per job request queue, dupefilter and spider state, kept for resuming
+CRAWL_STALE_AFTER = 60  # seconds without live job metrics after running job counts as crashed and can be resumed
 SPIDER_LOG_DIR = join(LOG_DIR, "spiders")
+HTTP_CACHE = 0  # on-disk HTTP cache for crawler responses, 1 enables it
+HTTP_CACHE_DIR = join(DATA_DIR, "httpcache")
+HTTP_CACHE_TTLS = {  # seconds cached responses are used without revalidation, per URL class
+    "listing": 60 * 15,  # search results pages
+    "detail": 60 * 60 * 24,  # job post pages
+}
+HTTP_CACHE_MAX_SIZE = 1024 * 1024 * 512  # bytes per spider, least recently used responses are evicted first
+
+# Crawler workers
+CRAWLER_WORKER_MODE = False  # hand jobs over to persistent crawler workers instead of one process per job
+CRAWLER_WORKERS = 2  # number of crawler worker processes
+CRAWLER_WORKER_CONCURRENCY = 4  # number of parallel crawls per crawler worker process
+CRAWLER_QUEUE = "crawler:queue"  # Redis list with pending crawl specs
+DISTRIBUTED_CRAWLERS = 1  # crawler processes sharing one job frontier across workers, 1 disables distributed mode
+FRONTIER_REDIS_KEY = "job:{}:frontier"  # Redis key prefix of distributed job pending requests and dupefilter
+FRONTIER_IDLE_TIMEOUT = 30  # seconds idle crawler waits for other active crawlers of the job before it closes
+FRONTIER_EXPIRE = 60 * 60 * 24 * 7  # seconds unfinished distributed job frontier is kept for resuming
+CRAWLER_LOG_FILE = join(LOG_DIR, "crawlers", "crawlers {}.log".format(strftime(TIMESTAMP_FORMAT2)))
 
 # WebUI
 WEBUI_HOST = "127.0.0.1"  # Dev
@@ -81,9 +125,13 @@ WEBUI_LOG_FILE = join(LOG_DIR, "webui", "webui {}.log".format(strftime(TIMESTAMP
 WEBUI_LOG_FORMAT = "[%(asctime)s] <%(filename)s:%(funcName)s:%(lineno)d> %(levelname)s - %(message)s", \
                    "%Y-%m-%d %H:%M:%S",
 
+JOBS_RETENTION_DAYS = 30  # days completed jobs are kept before they're moved to the archive table, None keeps them
+JOBS_ARCHIVE_INTERVAL = 60 * 60  # seconds between archiving completed jobs
+
 SETTINGS_FILE = join(ROOT_DIR, "data", "settings.pickle")
 REFRESH = 1  # Refresh page after delay
 IPP = 50  # Pagination items per page
+LOG_CHUNK_SIZE = 1024 * 64  # Maximum size of one job log chunk in bytes
 
 SETTINGS = {
     "refresh": REFRESH,
@@ -96,6 +144,13 @@ SETTINGS = {
     "use_proxies": USE_PROXIES,
     "scrape_type": SCRAPE_TYPE,
     "concurrent_requests": CONCURRENT_REQUESTS,
+    "http_cache": HTTP_CACHE,
+    "adaptive_throttle": ADAPTIVE_THROTTLE,
+    "throttle_min_delay": THROTTLE_MIN_DELAY,
+    "throttle_max_delay": THROTTLE_MAX_DELAY,
+    "throttle_min_concurrency": THROTTLE_MIN_CONCURRENCY,
+    "throttle_max_concurrency": THROTTLE_MAX_CONCURRENCY,
+    "distributed_crawlers": DISTRIBUTED_CRAWLERS,
     "db_host": DB_HOST,
     "db_port": DB_PORT,
     "db_name": DB_NAME,
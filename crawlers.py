@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+# !/usr/bin/env python
+
+import sys
+from argparse import ArgumentParser
+from logging import DEBUG, Formatter, INFO, StreamHandler, getLogger
+from logging.handlers import RotatingFileHandler
+from os.path import dirname, isfile
+
+from billiard import Process
+
+from application.webui.misc import Settings, ensure_dir
+from application.worker import run_crawler_worker
+from config import (CRAWLER_LOG_FILE, CRAWLER_WORKER_CONCURRENCY, CRAWLER_WORKERS, SETTINGS, SETTINGS_FILE,
+                    WEBUI_LOG_FORMAT, __title__)
+
+
+def main() -> int:
+    """Crawler workers main entry point. Starts a pool of persistent crawler worker processes."""
+    # Command line arguments
+    parser = ArgumentParser(description="{} crawler workers".format(__title__))
+    parser.add_argument("-n", type=int, dest="workers", default=CRAWLER_WORKERS, help="Number of worker processes")
+    parser.add_argument("-c", type=int, dest="concurrency", default=CRAWLER_WORKER_CONCURRENCY,
+                        help="Number of parallel crawls per worker process")
+    parser.add_argument("-v", action="store_true", dest="verbose", help="Enable verbose logging")
+    args = parser.parse_args()
+    # Settings
+    settings = Settings(**SETTINGS)
+    if isfile(SETTINGS_FILE):
+        settings.load(SETTINGS_FILE)
+    # Logging
+    ensure_dir(dirname(CRAWLER_LOG_FILE))
+    logger = getLogger("application.worker")
+    logger.setLevel(DEBUG if args.verbose else INFO)
+    file_handler = RotatingFileHandler(CRAWLER_LOG_FILE, maxBytes=1024 * 1024 * 10)
+    file_handler.setFormatter(Formatter(*WEBUI_LOG_FORMAT))
+    stream_handler = StreamHandler()
+    stream_handler.setFormatter(Formatter(*WEBUI_LOG_FORMAT))
+    logger.addHandler(file_handler)
+    logger.addHandler(stream_handler)
+    # Workers
+    workers = []
+    for _ in range(args.workers):
+        worker = Process(
+            target=run_crawler_worker,
+            args=(settings.key("redis_host"), settings.key("redis_port"), args.concurrency),
+        )
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
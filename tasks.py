@@ -2,17 +2,20 @@
 # !/usr/bin/env python
 
 import datetime
+import json
 import logging
-from os.path import isfile, join
+from contextlib import contextmanager
+from os.path import isdir, isfile, join, splitext
 from pprint import pprint
 from random import choice
+from shutil import rmtree
 
 import celery
 import celery.bin.base
 import celery.bin.celery
 import celery.platforms
 from celery import Celery
-from sqlalchemy import create_engine
+from redis import Redis
 from sqlalchemy.orm import sessionmaker
 from twisted.internet import asyncioreactor
 
@@ -23,13 +26,20 @@ from scrapy.settings import Settings as ScrapySettings
 
 from config import (
     __short_title__, __title__, WEBUI_DB_URI, FEEDS_DIR, EXTENSIONS, RESULTS_DIR, DEBUG,
-    USER_AGENT, SETTINGS, SETTINGS_FILE, TIMESTAMP_FORMAT2, ROTATING_PROXY_LIST_PATH,
-    ROTATING_PROXY_BACKOFF_BASE,
-    ROTATING_PROXY_BACKOFF_CAP, USER_AGENTS_FILE, SPIDER_LOG_DIR,
+    USER_AGENT, SETTINGS, SETTINGS_FILE, TIMESTAMP_FORMAT2, PROXIES_FILE, PROXY_STATS_FILE, PROXY_BAN_COOLDOWN,
+    PROXY_MAX_RETRIES, PROXY_CHECK_URL, PROXY_CHECK_TIMEOUT, PROXY_CHECK_MAX_AGE, USER_AGENTS_FILE, SPIDER_LOG_DIR,
+    DB_BATCH_SIZE, DB_FLUSH_INTERVAL, USER_AGENT_SESSIONS, USER_AGENT_SESSION_REQUESTS, USER_AGENT_SESSION_COOKIES,
+    SEEN_INDEX_REDIS_KEY, PENDING_BATCH_SIZE, PENDING_LEASE, PENDING_MAX_ATTEMPTS, NEAR_DUPLICATE_MODE,
+    NEAR_DUPLICATE_DISTANCE, NEAR_DUPLICATE_REDIS_KEY, CRAWLER_WORKER_MODE,
+    CRAWLER_QUEUE, FRONTIER_REDIS_KEY, FRONTIER_IDLE_TIMEOUT, FRONTIER_EXPIRE,
+    STOP_CHECK_INTERVAL, STATS_INTERVAL, HTTP_CACHE_DIR, HTTP_CACHE_MAX_SIZE, HTTP_CACHE_TTLS, CRAWL_STATE_DIR,
 )
 from application.misc import text_file_to_lines
 from application.spiders import SPIDERS
 from application.scrapers.scrapers.common import SpiderStatus, ScrapeType
+from application.scrapers.scrapers.connections import get_engine
+from application.scrapers.scrapers.events import JOB_RUNNING_KEY, JobTable, publish_job_event
+from application.scrapers.scrapers.frontier import register_crawlers
 from application.webui.misc import Settings
 from application.webui.models import Jobs
 
@@ -52,11 +62,11 @@ BROKER_URI = "amqp://{user}:{pwd}@{host}:{port}".format(
     user=settings.key("broker_user"), pwd=settings.key("broker_pass"),
 )
 
-# WebUI SQLite DB
-engine = create_engine(WEBUI_DB_URI)
-DBSession = sessionmaker(bind=engine)
-db_session = DBSession()
-db_session.close()
+# Credentials aren't stored with job parameters in webui.db, resumed jobs use the current settings
+CREDENTIAL_PARAMS = ("db_user", "db_pass")
+
+# WebUI SQLite DB, shared with WebUI and spider processes so sessions are short-lived
+DBSession = sessionmaker(bind=get_engine(WEBUI_DB_URI))
 
 # Celery
 app = Celery(
@@ -68,44 +78,106 @@ status = celery.bin.celery.CeleryCommand.commands['status']()
 status.app = status.get_app()
 
 
-def run_crawler(params: dict):
+@contextmanager
+def webui_db_session():
+    """Yields short-lived WebUI DB session, changes are committed on exit or rolled back on error"""
+    db_session = DBSession()
+    try:
+        yield db_session
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+
+def stored_params(params: dict) -> str:
     """
-    Create and run scrapy spider
+    Serializes scrapy spider parameters for the jobs table without credentials
     :param dict params: scrapy spider parameters
+    :return: JSON string
+    """
+    return json.dumps({name: value for name, value in params.items() if name not in CREDENTIAL_PARAMS})
+
+
+def redis_client() -> Redis:
+    """Returns Redis client for configured Redis instance"""
+    return Redis(settings.key("redis_host"), settings.key("redis_port"))
+
+
+def crawler_settings(params: dict) -> ScrapySettings:
+    """
+    Create scrapy settings for one scrape job
+    :param dict params: scrapy spider parameters
+    :return: scrapy settings instance
     """
     spider = SPIDERS[params["spider"]]
     scrapy_settings = ScrapySettings()
-    crawler = CrawlerProcess(scrapy_settings)
     # Global settings
     downloader_middlewares = {}
     item_pipelines = {}
     scrapy_settings["BOT_NAME"] = "{} [{}]".format(__title__, spider.name)
     scrapy_settings["ROBOTSTXT_OBEY"] = False
     scrapy_settings["COOKIES_ENABLED"] = False
-    scrapy_settings["CONCURRENT_REQUESTS"] = params["concurrent_requests"]
+    # Spiders download each target country through its own slot, concurrency and delay are per country budgets
+    scrapy_settings["CONCURRENT_REQUESTS"] = params["concurrent_requests"] * max(1, len(params["selected_countries"]))
+    scrapy_settings["CONCURRENT_REQUESTS_PER_DOMAIN"] = params["concurrent_requests"]
     scrapy_settings["DOWNLOAD_DELAY"] = params["delay"]
+    # Adaptive throttle, delay and concurrency settings above are starting rates tuned within floors and ceilings
+    if params.get("adaptive_throttle"):
+        max_concurrency = max(params["throttle_min_concurrency"], params["throttle_max_concurrency"])
+        scrapy_settings["ADAPTIVE_THROTTLE_ENABLED"] = True
+        scrapy_settings["ADAPTIVE_THROTTLE_MIN_DELAY"] = params["throttle_min_delay"]
+        scrapy_settings["ADAPTIVE_THROTTLE_MAX_DELAY"] = params["throttle_max_delay"]
+        scrapy_settings["ADAPTIVE_THROTTLE_MIN_CONCURRENCY"] = params["throttle_min_concurrency"]
+        scrapy_settings["ADAPTIVE_THROTTLE_MAX_CONCURRENCY"] = max_concurrency
+        scrapy_settings["CONCURRENT_REQUESTS"] = max_concurrency * max(1, len(params["selected_countries"]))
     scrapy_settings["DOWNLOAD_TIMEOUT"] = params["timeout"]
     scrapy_settings["RETRY_TIMES"] = params["retries"]
     scrapy_settings["LOG_LEVEL"] = "INFO"
     # User agents
     user_agents = text_file_to_lines(USER_AGENTS_FILE)
     scrapy_settings["USER_AGENT"] = choice(user_agents) if user_agents else USER_AGENT
+    if user_agents:
+        # Sticky user agent per proxy or download slot, ordered after the proxy middleware which picks the proxy
+        scrapy_settings["USER_AGENTS"] = user_agents
+        scrapy_settings["USER_AGENT_SESSIONS"] = USER_AGENT_SESSIONS
+        scrapy_settings["USER_AGENT_SESSION_REQUESTS"] = USER_AGENT_SESSION_REQUESTS
+        if USER_AGENT_SESSION_COOKIES:
+            scrapy_settings["COOKIES_ENABLED"] = True
+            scrapy_settings["USER_AGENT_SESSION_COOKIES"] = True
+        downloader_middlewares.update({
+            "scrapy.downloadermiddlewares.useragent.UserAgentMiddleware": None,
+            "application.scrapers.scrapers.middlewares.RotatingUserAgentMiddleware": 620,
+        })
     # Proxies
     if params["use_proxies"] and user_agents:
-        proxies = text_file_to_lines(ROTATING_PROXY_LIST_PATH)
+        proxies = text_file_to_lines(PROXIES_FILE)
         if proxies:
-            scrapy_settings["USER_AGENTS"] = user_agents
-            downloader_middlewares.update({
-                "scrapy.downloadermiddlewares.useragent.UserAgentMiddleware": None,
-                "application.scrapers.scrapers.middlewares.RotatingUserAgentMiddleware": 300,
-            })
-            scrapy_settings["ROTATING_PROXY_BACKOFF_BASE"] = ROTATING_PROXY_BACKOFF_BASE
-            scrapy_settings["ROTATING_PROXY_BACKOFF_CAP"] = ROTATING_PROXY_BACKOFF_CAP
-            scrapy_settings["ROTATING_PROXY_LIST_PATH"] = ROTATING_PROXY_LIST_PATH
+            scrapy_settings["PROXY_LIST"] = proxies
+            scrapy_settings["PROXY_STATS_FILE"] = PROXY_STATS_FILE
+            scrapy_settings["PROXY_BAN_COOLDOWN"] = PROXY_BAN_COOLDOWN
+            scrapy_settings["PROXY_MAX_RETRIES"] = PROXY_MAX_RETRIES
+            scrapy_settings["PROXY_CHECK_URL"] = PROXY_CHECK_URL
+            scrapy_settings["PROXY_CHECK_TIMEOUT"] = PROXY_CHECK_TIMEOUT
+            scrapy_settings["PROXY_CHECK_MAX_AGE"] = PROXY_CHECK_MAX_AGE
             downloader_middlewares.update({
-                "rotating_proxies.middlewares.RotatingProxyMiddleware": 610,
-                "rotating_proxies.middlewares.BanDetectionMiddleware": 620,
+                "application.scrapers.scrapers.middlewares.ProxyPoolMiddleware": 610,
             })
+    # HTTP cache
+    if params.get("http_cache"):
+        scrapy_settings["HTTPCACHE_ENABLED"] = True
+        scrapy_settings["HTTPCACHE_DIR"] = HTTP_CACHE_DIR
+        scrapy_settings["HTTPCACHE_GZIP"] = True
+        scrapy_settings["HTTPCACHE_POLICY"] = "application.scrapers.scrapers.httpcache.TTLPolicy"
+        scrapy_settings["HTTPCACHE_STORAGE"] = "application.scrapers.scrapers.httpcache.LRUFilesystemCacheStorage"
+        scrapy_settings["HTTPCACHE_TTLS"] = HTTP_CACHE_TTLS
+        scrapy_settings["HTTPCACHE_MAX_SIZE"] = HTTP_CACHE_MAX_SIZE
+        downloader_middlewares.update({
+            "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+            "application.scrapers.scrapers.httpcache.TTLHttpCacheMiddleware": 900,
+        })
     if params["save_to_db"]:
         scrapy_settings["DB_HOST"] = params["db_host"]
         scrapy_settings["DB_PORT"] = params["db_port"]
@@ -119,11 +191,27 @@ def run_crawler(params: dict):
             user=params["db_user"],
             passw=params["db_pass"],
         )
+        scrapy_settings["DB_BATCH_SIZE"] = DB_BATCH_SIZE
+        scrapy_settings["DB_FLUSH_INTERVAL"] = DB_FLUSH_INTERVAL
+        if SEEN_INDEX_REDIS_KEY is not None:
+            scrapy_settings["SEEN_INDEX_REDIS_KEY"] = SEEN_INDEX_REDIS_KEY.format(db=params["db_name"])
+        scrapy_settings["PENDING_BATCH_SIZE"] = PENDING_BATCH_SIZE
+        scrapy_settings["PENDING_LEASE"] = PENDING_LEASE
+        scrapy_settings["PENDING_MAX_ATTEMPTS"] = PENDING_MAX_ATTEMPTS
         item_pipelines.update({
             "application.scrapers.scrapers.pipelines.MySQLPipeline": 400,
         })
+        # Near-duplicates are detected before they are written to DB
+        if NEAR_DUPLICATE_MODE is not None:
+            scrapy_settings["NEAR_DUPLICATE_MODE"] = NEAR_DUPLICATE_MODE
+            scrapy_settings["NEAR_DUPLICATE_DISTANCE"] = NEAR_DUPLICATE_DISTANCE
+            scrapy_settings["NEAR_DUPLICATE_REDIS_KEY"] = NEAR_DUPLICATE_REDIS_KEY.format(db=params["db_name"])
+            item_pipelines.update({
+                "application.scrapers.scrapers.pipelines.NearDuplicatePipeline": 300,
+            })
     # Spider specific settings
-    if params["save_to_feed"]:
+    # Crawlers of a distributed job may run on other hosts and can't share one feed file, job posts go to DB only
+    if params["save_to_feed"] and params.get("distributed_crawlers", 1) <= 1:
         scrapy_settings["FEEDS_DIR"] = FEEDS_DIR
         scrapy_settings["FEED_URI"] = params["feed_file"]
         # ITEM_PIPELINES.update({
@@ -131,6 +219,17 @@ def run_crawler(params: dict):
         # })
     if params["log"]:
         scrapy_settings["LOG_FILE"] = params["log"]
+    # Distributed job, crawlers pull requests from one shared Redis frontier, which is also kept for resuming
+    if params.get("distributed_crawlers", 1) > 1:
+        scrapy_settings["DISTRIBUTED"] = True
+        scrapy_settings["CRAWLER_ID"] = params.get("crawler", 0)
+        scrapy_settings["SCHEDULER"] = "application.scrapers.scrapers.frontier.RedisScheduler"
+        scrapy_settings["FRONTIER_KEY"] = FRONTIER_REDIS_KEY.format(params["job_id"])
+        scrapy_settings["FRONTIER_IDLE_TIMEOUT"] = FRONTIER_IDLE_TIMEOUT
+        scrapy_settings["FRONTIER_EXPIRE"] = FRONTIER_EXPIRE
+    # Persistent request queue, dupefilter and spider state, resumed jobs continue where they stopped
+    elif params.get("resumable", True):
+        scrapy_settings["JOBDIR"] = crawl_state_dir(params["job_id"])
     scrapy_settings["DOWNLOADER_MIDDLEWARES"] = downloader_middlewares
     scrapy_settings["ITEM_PIPELINES"] = item_pipelines
     scrapy_settings["EXTENSIONS"] = EXTENSIONS
@@ -138,16 +237,52 @@ def run_crawler(params: dict):
     scrapy_settings["RESULTS_DIR"] = RESULTS_DIR
     scrapy_settings["JOB_ID"] = params["job_id"]
     scrapy_settings["TASK_ID"] = params["task_id"]
+    scrapy_settings["STOP_CHECK_INTERVAL"] = STOP_CHECK_INTERVAL
+    scrapy_settings["STATS_INTERVAL"] = STATS_INTERVAL
     scrapy_settings["WEBUI_DB_URI"] = WEBUI_DB_URI
     scrapy_settings["SCRAPE_TEST"] = DEBUG
     scrapy_settings["KEYWORDS"] = params["keywords"]
     scrapy_settings["SELECTED_COUNTRIES"] = params["selected_countries"]
+    scrapy_settings["COUNTRY_URLS"] = params.get("country_urls", {})
     scrapy_settings["REDIS_HOST"] = params["redis_host"]
     scrapy_settings["REDIS_PORT"] = params["redis_port"]
     # print(params)
 
-    crawler.crawl(spider)
-    crawler.start()
+    return scrapy_settings
+
+
+def crawl_state_dir(job_id: int) -> str:
+    """
+    Returns persistent crawl state directory of a job (scrapy JOBDIR)
+    :param int job_id: row ID of a job from the jobs table in webui.db
+    :return: directory path
+    """
+    return join(CRAWL_STATE_DIR, str(job_id))
+
+
+def remove_crawl_state(job_id: int):
+    """
+    Removes persistent crawl state of a job
+    :param int job_id: row ID of a job from the jobs table in webui.db
+    """
+    state_dir = crawl_state_dir(job_id)
+    if isdir(state_dir):
+        rmtree(state_dir, ignore_errors=True)
+
+
+def run_crawler(params: dict):
+    """
+    Create and run scrapy spider
+    :param dict params: scrapy spider parameters
+    """
+    spider = SPIDERS[params["spider"]]
+    process = CrawlerProcess(crawler_settings(params))
+    crawler = process.create_crawler(spider)
+    process.crawl(crawler)
+    process.start()
+    # Crawl state is kept only for jobs which can be resumed
+    if crawler.stats.get_value("finish_reason") == "finished":
+        remove_crawl_state(params["job_id"])
 
 
 def run_crawler_process(params: dict) -> Process:
@@ -162,6 +297,48 @@ def run_crawler_process(params: dict) -> Process:
     return process
 
 
+def dispatch_crawler(params: dict):
+    """
+    Start scrapy spider from a separate process or hand it over to persistent crawler workers (see crawlers.py),
+    crawlers of a distributed job are spread over Celery workers
+    :param dict params: scrapy spider parameters
+    """
+    crawlers = params.get("distributed_crawlers", 1)
+    if crawlers > 1:
+        # Running crawlers are counted before any crawler is queued, each crawler only decrements the count on close
+        redis = redis_client()
+        redis.set(JOB_RUNNING_KEY.format(params["job_id"]), crawlers, ex=FRONTIER_EXPIRE)
+        register_crawlers(redis, FRONTIER_REDIS_KEY.format(params["job_id"]), list(range(crawlers)), FRONTIER_EXPIRE)
+        if params["save_to_feed"]:
+            logger.warning("Feed export is disabled for distributed job ID {}".format(params["job_id"]))
+        for crawler_id in range(crawlers):
+            crawler_params = dict(params, crawler=crawler_id)
+            if crawler_id and params["log"]:  # First crawler writes the job log shown in WebUI
+                log_name, log_ext = splitext(params["log"])
+                crawler_params["log"] = "{} crawler {}{}".format(log_name, crawler_id, log_ext)
+            if CRAWLER_WORKER_MODE:
+                redis_client().rpush(CRAWLER_QUEUE, json.dumps(crawler_params))
+            else:
+                run_crawler_task.delay(crawler_params)
+        logger.info("Dispatched {} crawlers of distributed job ID {}".format(crawlers, params["job_id"]))
+        return
+    if not CRAWLER_WORKER_MODE:
+        run_crawler_process(params)
+        return
+    redis_client().rpush(CRAWLER_QUEUE, json.dumps(params))
+    logger.info("Queued job ID {} for crawler workers".format(params["job_id"]))
+
+
+@app.task
+def run_crawler_task(params: dict):
+    """
+    Run one crawler of a distributed scrape job on the worker which picked the task
+    :param dict params: scrapy spider parameters
+    """
+    params["scrape_type"] = ScrapeType(params["scrape_type"])
+    run_crawler_process(params)
+
+
 @app.task
 def run_job(job_id: int, params: dict):
     """
@@ -170,26 +347,52 @@ def run_job(job_id: int, params: dict):
     :param dict params: scrapy spider parameters
     """
     # Update job
-    job = db_session.query(Jobs).filter_by(id=job_id).first()
-    if job is None:
-        return False
-    job.task_id = run_job.request.id
-    time_stamp = datetime.datetime.now()
-    job.date_started = time_stamp
-    file_name = "{} {}".format(job.spider_name, time_stamp.strftime(TIMESTAMP_FORMAT2))
-    log_file = file_name + ".log"
-    feed_file = file_name + ".json"
-    job.spider_status = SpiderStatus.RUNNING
-    db_session.commit()
-    params["log"] = join(SPIDER_LOG_DIR, log_file)
-    params["feed_file"] = join(FEEDS_DIR, feed_file)
-    params["scrape_type"] = ScrapeType(params["scrape_type"])
-    params["job_id"] = job_id
-    params["task_id"] = job.task_id
+    with webui_db_session() as db_session:
+        job = db_session.query(Jobs).filter_by(id=job_id).first()
+        if job is None:
+            return False
+        job.task_id = run_job.request.id
+        time_stamp = datetime.datetime.now()
+        job.date_started = time_stamp
+        file_name = "{} {}".format(job.spider_name, time_stamp.strftime(TIMESTAMP_FORMAT2))
+        log_file = file_name + ".log"
+        feed_file = file_name + ".json"
+        job.spider_status = SpiderStatus.RUNNING
+        params["log"] = join(SPIDER_LOG_DIR, log_file)
+        params["feed_file"] = join(FEEDS_DIR, feed_file)
+        params["scrape_type"] = ScrapeType(params["scrape_type"])
+        params["job_id"] = job_id
+        params["task_id"] = job.task_id
+        job.params = stored_params(params)
+    publish_job_event(redis_client(), JobTable.JOBS, job_id)
     # print(params)
 
-    run_crawler_process(params)
-    # process = run_crawler_process(params)
+    dispatch_crawler(params)
+
+
+@app.task
+def resume_job(job_id: int):
+    """
+    Resume canceled, interrupted or crashed scrape job from its persistent crawl state, job log and feed are continued
+    :param int job_id: row ID of a job from the jobs table in webui.db
+    """
+    with webui_db_session() as db_session:
+        job = db_session.query(Jobs).filter_by(id=job_id).first()
+        if job is None or not job.params:
+            return False
+        params = json.loads(job.params)
+        job.task_id = resume_job.request.id
+        job.spider_status = SpiderStatus.RUNNING
+        job.date_finished = None
+        params["scrape_type"] = ScrapeType(params["scrape_type"])
+        params["task_id"] = job.task_id
+        job.params = stored_params(params)
+    settings.load(SETTINGS_FILE)  # Credentials may have changed since the worker started
+    for name in CREDENTIAL_PARAMS:
+        params[name] = settings.key(name)
+    publish_job_event(redis_client(), JobTable.JOBS, job_id)
+
+    dispatch_crawler(params)
 
 
 @app.task
@@ -203,29 +406,31 @@ def run_periodic_job(job_id: int, params: dict):
     file_name = "{} {}".format(params["spider_name"], time_stamp.strftime(TIMESTAMP_FORMAT2))
     log_file = file_name + ".log"
     feed_file = file_name + ".json"
-    job = Jobs(
-        task_id=run_periodic_job.request.id,
-        spider_name=params["spider_name"],
-        spider_status=SpiderStatus.RUNNING,
-        scrape_type=params["scrape_type"],
-        use_proxies=params["use_proxies"],
-        file=params["save_to_feed"],
-        db=params["save_to_db"],
-        # images=params["images"],
-        date_started=datetime.datetime.now(),
-    )
-    db_session.add(job)
-    db_session.commit()
-    params["log"] = join(SPIDER_LOG_DIR, log_file)
-    params["save_to_feed"] = None
-    params["feed_file"] = join(FEEDS_DIR, feed_file)
-    params["scrape_type"] = ScrapeType(params["scrape_type"])
-    params["job_id"] = job.id
-    params["task_id"] = job.task_id
+    with webui_db_session() as db_session:
+        job = Jobs(
+            task_id=run_periodic_job.request.id,
+            spider_name=params["spider_name"],
+            spider_status=SpiderStatus.RUNNING,
+            scrape_type=params["scrape_type"],
+            use_proxies=params["use_proxies"],
+            file=params["save_to_feed"],
+            db=params["save_to_db"],
+            # images=params["images"],
+            date_started=datetime.datetime.now(),
+        )
+        db_session.add(job)
+        db_session.flush()  # Job ID
+        params["log"] = join(SPIDER_LOG_DIR, log_file)
+        params["save_to_feed"] = None
+        params["feed_file"] = join(FEEDS_DIR, feed_file)
+        params["scrape_type"] = ScrapeType(params["scrape_type"])
+        params["job_id"] = job.id
+        params["task_id"] = job.task_id
+        job.params = stored_params(params)
+    publish_job_event(redis_client(), JobTable.JOBS, params["job_id"])
     # print(params)
 
-    run_crawler_process(params)
-    # process = run_crawler_process(params)
+    dispatch_crawler(params)
 
 
 @app.task
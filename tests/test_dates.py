@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import unittest
+from datetime import datetime, timedelta
+
+from application.scrapers.scrapers.dates import normalize_relative_date, resolve_relative_date
+
+NOW = datetime(2020, 6, 15, 12, 0)
+
+
+class TestResolveRelativeDate(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize_relative_date("  30+ Days\n ago "), "30 days ago")
+
+    def test_now(self):
+        for text in ("Just posted", "Today", "heute", "aujourd'hui", "hoy"):
+            self.assertEqual(resolve_relative_date(text, NOW), NOW, text)
+
+    def test_english(self):
+        self.assertEqual(resolve_relative_date("3 days ago", NOW), NOW - timedelta(days=3))
+        self.assertEqual(resolve_relative_date("30+ days ago", NOW), NOW - timedelta(days=30))
+        self.assertEqual(resolve_relative_date("1 hour ago", NOW), NOW - timedelta(hours=1))
+
+    def test_other_locales(self):
+        expected = NOW - timedelta(days=3)
+        for text in ("vor 3 Tagen", "il y a 3 jours", "hace 3 días", "há 3 dias", "3 giorni fa", "3 dagen geleden"):
+            self.assertEqual(resolve_relative_date(text, NOW), expected, text)
+
+    def test_singular_units(self):
+        self.assertEqual(resolve_relative_date("vor 1 Woche", NOW), NOW - timedelta(weeks=1))
+        self.assertEqual(resolve_relative_date("il y a 1 mois", NOW), NOW - timedelta(days=30))
+
+    def test_relative_to_current_time(self):
+        before = datetime.now()
+        date = resolve_relative_date("2 days ago")
+        self.assertLessEqual(before - timedelta(days=2), date)
+        self.assertLessEqual(date, datetime.now() - timedelta(days=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
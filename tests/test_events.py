@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import unittest
+
+from application.scrapers.scrapers.events import _aggregate
+
+
+class TestAggregate(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(_aggregate([]), {})
+
+    def test_summed_and_maximum(self):
+        stats = _aggregate([
+            {"requests": "10", "items": "4", "requests_per_second": "1.5", "latency_p90": "0.2", "status_200": "9"},
+            {"requests": "5", "items": "1", "requests_per_second": "0.25", "latency_p90": "0.7", "status_200": "5"},
+        ])
+        self.assertEqual(stats["requests"], 15)
+        self.assertEqual(stats["items"], 5)
+        self.assertEqual(stats["requests_per_second"], 1.75)
+        self.assertEqual(stats["status_200"], 14)
+        self.assertEqual(stats["latency_p90"], 0.7)
+        self.assertEqual(stats["crawlers"], 2)
+
+    def test_integers(self):
+        stats = _aggregate([{"requests": "1.0"}, {"requests": "2"}])
+        self.assertIsInstance(stats["requests"], int)
+
+    def test_finish_reason_when_all_finished(self):
+        running = _aggregate([{"requests": "1", "finish_reason": "finished"}, {"requests": "1"}])
+        self.assertNotIn("finish_reason", running)
+        finished = _aggregate([{"requests": "1", "finish_reason": "finished"},
+                               {"requests": "1", "finish_reason": "finished"}])
+        self.assertEqual(finished["finish_reason"], "finished")
+
+
+if __name__ == "__main__":
+    unittest.main()
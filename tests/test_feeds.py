@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import unittest
+from os.path import isfile, join
+from tempfile import TemporaryDirectory
+
+from application.feeds import FeedIndex
+
+
+class TestFeedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = TemporaryDirectory()
+        self.feed_file = join(self._dir.name, "feed.json")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, data: str, mode: str = "w"):
+        with open(self.feed_file, mode) as f:
+            f.write(data)
+
+    def test_missing_feed(self):
+        index = FeedIndex(self.feed_file)
+        self.assertEqual(index.update(), 0)
+        self.assertEqual(len(index), 0)
+
+    def test_items(self):
+        self.write('[\n{"Title": "a", "Tags": ["x", "y"]},\n{"Title": "b {not a brace]"}\n]')
+        index = FeedIndex(self.feed_file)
+        self.assertEqual(index.update(), 2)
+        self.assertEqual(index.items(0, 10), [{"Title": "a", "Tags": ["x", "y"]}, {"Title": "b {not a brace]"}])
+        self.assertEqual(index.items(1, 1), [{"Title": "b {not a brace]"}])
+        self.assertEqual(index.items(2, 1), [])
+
+    def test_incremental_update(self):
+        self.write('[\n{"Title": "a"},\n{"Title": "b\\"')
+        index = FeedIndex(self.feed_file)
+        self.assertEqual(index.update(), 1)
+        self.write(' c"}\n]', "a")
+        self.assertEqual(index.update(), 1)
+        self.assertEqual(index.items(1, 1), [{"Title": "b\" c"}])
+
+    def test_sidecar_index(self):
+        self.write('[\n{"Title": "a"},\n{"Title": "b"}\n]')
+        FeedIndex(self.feed_file).update()
+        self.assertTrue(isfile(self.feed_file + ".idx"))
+        index = FeedIndex(self.feed_file)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.update(), 0)
+
+    def test_json_lines(self):
+        self.write('{"Title": "a"}\n{"Title": "b"}\n')
+        index = FeedIndex(self.feed_file)
+        self.assertEqual(index.update(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
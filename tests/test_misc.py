@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from application.misc import read_text_chunk
+
+
+class TestReadTextChunk(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = TemporaryDirectory()
+        self.file = join(self._dir.name, "test.log")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write(self, data: bytes):
+        with open(self.file, "wb") as f:
+            f.write(data)
+
+    def test_whole_file(self):
+        self.write(b"one\ntwo\n\nthree\n")
+        self.assertEqual(read_text_chunk(self.file, 0, 1024), (["one", "two", "three"], 0, 15))
+
+    def test_forward_chunks(self):
+        self.write(b"one\ntwo\nthree\n")
+        lines, start, end = read_text_chunk(self.file, 0, 6)
+        self.assertEqual((lines, start, end), (["one"], 0, 4))
+        self.assertEqual(read_text_chunk(self.file, end, 6), (["two"], 4, 8))
+
+    def test_partial_last_line(self):
+        self.write(b"one\ntw")
+        self.assertEqual(read_text_chunk(self.file, 0, 1024), (["one"], 0, 4))
+        self.assertEqual(read_text_chunk(self.file, 4, 1024), ([], 4, 4))
+
+    def test_backward(self):
+        self.write(b"one\ntwo\nthree\n")
+        self.assertEqual(read_text_chunk(self.file, 14, 8, backward=True), (["three"], 8, 14))
+        self.assertEqual(read_text_chunk(self.file, 8, 8, backward=True), (["one", "two"], 0, 8))
+
+    def test_offset_beyond_file(self):
+        self.write(b"one\n")
+        self.assertEqual(read_text_chunk(self.file, 100, 1024), ([], 4, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: UTF-8 -*-
+#!/usr/bin/env python
+
+import unittest
+from random import Random
+
+from application.scrapers.scrapers.simhash import NearDuplicateIndex, hamming_distance, simhash
+
+DESCRIPTION = (
+    "We are looking for a senior Python developer to join our backend team. You will design and build scalable "
+    "web services, review code of other developers and mentor junior colleagues. Experience with Django, "
+    "PostgreSQL and Redis is required, knowledge of Scrapy and Celery is a plus. We offer flexible working hours, "
+    "remote work and a yearly education budget."
+)
+
+
+class FakeRedis:
+    """In-memory Redis sets, pipelines are executed at once"""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    def srandmember(self, key, count):
+        return list(self.data.get(key, ()))[:count]
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._results = []
+
+    def __getattr__(self, name):
+        def command(*args):
+            self._results.append(getattr(self._redis, name)(*args))
+        return command
+
+    def execute(self):
+        results, self._results = self._results, []
+        return results
+
+
+class TestSimHash(unittest.TestCase):
+
+    def test_hamming_distance(self):
+        self.assertEqual(hamming_distance(0, 0), 0)
+        self.assertEqual(hamming_distance(0b1011, 0b0010), 2)
+        self.assertEqual(hamming_distance(0, 2 ** 64 - 1), 64)
+
+    def test_deterministic(self):
+        self.assertEqual(simhash(DESCRIPTION), simhash(DESCRIPTION))
+        self.assertLess(simhash(DESCRIPTION), 2 ** 64)
+
+    def test_case_and_punctuation_insensitive(self):
+        self.assertEqual(simhash(DESCRIPTION), simhash(DESCRIPTION.upper().replace(',', ' ')))
+
+    def test_near_duplicate(self):
+        repost = DESCRIPTION.replace("yearly", "annual")
+        self.assertLessEqual(hamming_distance(simhash(DESCRIPTION), simhash(repost)), 5)
+
+    def test_different_texts(self):
+        other = "Warehouse worker wanted for night shifts, forklift license required, immediate start in Berlin."
+        self.assertGreater(hamming_distance(simhash(DESCRIPTION), simhash(other)), 5)
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.index = NearDuplicateIndex(self.redis, "test", max_distance=5)
+
+    def test_find_within_distance(self):
+        random = Random(1)
+        for _ in range(200):
+            fingerprint = random.getrandbits(64)
+            near = fingerprint
+            for bit in random.sample(range(64), 5):
+                near ^= 1 << bit
+            index = NearDuplicateIndex(FakeRedis(), "test", max_distance=5)
+            index.add(fingerprint, "original")
+            self.assertEqual(index.find(near, "repost"), "original")
+
+    def test_not_found_beyond_distance(self):
+        self.index.add(0, "original")
+        self.assertIsNone(self.index.find(0b1111111, "repost"))
+
+    def test_closest(self):
+        self.index.add(0b111, "far")
+        self.index.add(0b1, "close")
+        self.assertEqual(self.index.find(0, "new"), "close")
+
+    def test_itself_isnt_duplicate(self):
+        self.index.add(42, "original")
+        self.assertIsNone(self.index.find(42, "original"))
+
+    def test_load(self):
+        self.assertFalse(self.index.loaded)
+        count = self.index.load([("a", 1), ("b", 2 ** 40), ("c", 2 ** 63)], batch_size=2)
+        self.assertEqual(count, 3)
+        self.assertTrue(self.index.loaded)
+        self.assertEqual(self.index.find(2 ** 40 + 2, "d"), "b")
+
+
+if __name__ == "__main__":
+    unittest.main()